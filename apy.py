@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def annualized_apy(
+    rewards: np.ndarray, stakes: np.ndarray, exponent: float
+) -> np.ndarray:
+    """
+    Vectorized `(1 + reward / stake) ** exponent - 1`, where exponent is the number
+    of paydays in a year (seconds_per_year / payday_duration).
+    Entries with a stake that is not positive get an APY of 0.
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    stakes = np.asarray(stakes, dtype=np.float64)
+    apy = np.zeros(len(stakes), dtype=np.float64)
+    positive = stakes > 0
+    apy[positive] = np.power(1 + rewards[positive] / stakes[positive], exponent) - 1
+    return apy
+
+
+def pool_rewards_and_apys(
+    baker_reward: np.ndarray,
+    transaction_fees: np.ndarray,
+    finalization_reward: np.ndarray,
+    delegated_capital: np.ndarray,
+    effective_stake: np.ndarray,
+    baker_equity_capital: np.ndarray,
+    commission_baking: np.ndarray,
+    commission_transaction: np.ndarray,
+    commission_finalization: np.ndarray,
+    exponent: float,
+) -> dict[str, np.ndarray]:
+    """
+    Split the payday pool rewards for all pools into the part for the pool owner
+    and the part for the delegators (after commission), and calculate the daily
+    APY for the pool as a whole, for the owner and for the delegators.
+    """
+    baker_reward = np.asarray(baker_reward, dtype=np.float64)
+    transaction_fees = np.asarray(transaction_fees, dtype=np.float64)
+    finalization_reward = np.asarray(finalization_reward, dtype=np.float64)
+    delegated_capital = np.asarray(delegated_capital, dtype=np.float64)
+    effective_stake = np.asarray(effective_stake, dtype=np.float64)
+
+    total_reward = baker_reward + finalization_reward + transaction_fees
+
+    delegator_ratio = np.zeros(len(effective_stake), dtype=np.float64)
+    positive = effective_stake > 0
+    delegator_ratio[positive] = delegated_capital[positive] / effective_stake[positive]
+
+    delegator_reward = (
+        (1 - np.asarray(commission_baking)) * (delegator_ratio * baker_reward)
+        + (1 - np.asarray(commission_transaction))
+        * (delegator_ratio * transaction_fees)
+        + (1 - np.asarray(commission_finalization))
+        * (delegator_ratio * finalization_reward)
+    )
+    owner_reward = total_reward - delegator_reward
+
+    return {
+        "total_reward": total_reward,
+        "owner_reward": owner_reward,
+        "delegator_reward": delegator_reward,
+        "total_apy": annualized_apy(total_reward, effective_stake, exponent),
+        "owner_apy": annualized_apy(owner_reward, baker_equity_capital, exponent),
+        "delegator_apy": annualized_apy(delegator_reward, delegated_capital, exponent),
+    }
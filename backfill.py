@@ -0,0 +1,227 @@
+"""
+Backfill / recompute paydays for a range of dates or heights, for instance after
+a change in one of the formulas.
+
+Steps 1-3 only depend on the chain, so they run for many paydays at the same
+time in worker processes. Steps 4-6 build on the previous payday (the daily
+APY history and the moving averages), so they run in the main process, in date
+order, as soon as the results for the next payday come in. The same goes for
+storing the delegators (the changes since the previous payday).
+The paydays to recompute are read from the `paydays` collection. A backfill
+never touches `paydays_current_payday` (that is for the live payday) and
+doesn't write checkpoints.
+
+    python backfill.py --from-date 2023-01-01 --to-date 2023-12-31 --workers 8
+    python backfill.py --from-height 5000000 --to-height 9000000
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.mongodb import Collections, MongoDB
+from ccdexplorer_fundamentals.tooter import Tooter, TooterChannel, TooterType
+from pymongo.collection import Collection
+from rich.console import Console
+import node_pool
+from payday import NullTooter, Payday, ensure_indexes
+from payday_delegators import delegators_collection, ensure_delegator_indexes
+
+console = Console()
+from env import *
+
+STEPS_IN_WORKERS = ["step_1", "step_2", "step_3", "step_3_5"]
+STEPS_IN_ORDER = ["step_4", "step_5", "step_6"]
+
+# what steps 4-6 need from steps 1-3, the rest of the state stays in the worker.
+STATE_FOR_STEPS_IN_ORDER = [
+    "payday_date_string",
+    "payday_block_hash",
+    "payday_duration",
+    "seconds_per_year",
+    "account_rewards",
+    "pool_rewards",
+    "accounts_that_need_APY",
+    "baker_stake_by_account_id",
+    "bakers_that_need_APY",
+    "delegator_table",
+    "baker_account_ids_by_baker_id",
+    "pool_info_by_baker_id",
+    "passive_delegation_info",
+]
+
+# per worker process, set in init_worker
+worker_grpcclient: Optional[GRPCClient] = None
+worker_mongodb: Optional[MongoDB] = None
+worker_TESTNET = False
+
+
+def init_worker(TESTNET: bool, use_node_pool: bool = True):
+    global worker_grpcclient, worker_mongodb, worker_TESTNET
+    node_pool.pooling_enabled = node_pool.pooling_enabled and use_node_pool
+    worker_grpcclient = GRPCClient()
+    worker_mongodb = MongoDB(Tooter())
+    worker_TESTNET = TESTNET
+
+
+def run_steps_in_worker(payday: dict) -> dict:
+    """
+    Steps 1-3 for a single payday, returns the state steps 4-6 need.
+    """
+    result = Payday(
+        payday["date"],
+        payday["hash"],
+        worker_grpcclient,
+        worker_mongodb,
+        NullTooter(),
+        TESTNET=worker_TESTNET,
+        backfill=True,
+        step_names=STEPS_IN_WORKERS,
+    )
+    return result.state(STATE_FOR_STEPS_IN_ORDER)
+
+
+def paydays_in_range(
+    db: Dict[Collections, Collection],
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    from_height: Optional[int] = None,
+    to_height: Optional[int] = None,
+) -> list[dict]:
+    """
+    The paydays (date, payday block hash) to recompute, in date order. Heights
+    are payday block heights (`height_for_last_block` + 1).
+    """
+    query = {}
+    if from_date or to_date:
+        query["date"] = {}
+        if from_date:
+            query["date"]["$gte"] = from_date
+        if to_date:
+            query["date"]["$lte"] = to_date
+    if from_height or to_height:
+        query["height_for_last_block"] = {}
+        if from_height:
+            query["height_for_last_block"]["$gte"] = from_height - 1
+        if to_height:
+            query["height_for_last_block"]["$lte"] = to_height - 1
+
+    return [
+        {"date": x["date"], "hash": x["_id"]}
+        for x in db[Collections.paydays].find(
+            query, projection={"_id": 1, "date": 1}, sort=[("date", 1)]
+        )
+    ]
+
+
+def backfill(
+    paydays: list[dict],
+    mongodb: MongoDB,
+    workers: int,
+    TESTNET: bool = False,
+    use_node_pool: bool = True,
+):
+    """
+    Run steps 1-3 for up to 2 x `workers` paydays ahead in a process pool, and
+    steps 4-6 for every payday in order in this process.
+    """
+    paydays_to_submit = iter(paydays)
+    in_flight = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(TESTNET, use_node_pool)
+    ) as executor:
+
+        def submit_next():
+            payday = next(paydays_to_submit, None)
+            if payday:
+                in_flight.append((payday, executor.submit(run_steps_in_worker, payday)))
+
+        for _ in range(2 * workers):
+            submit_next()
+
+        done = 0
+        while len(in_flight) > 0:
+            payday, future = in_flight.popleft()
+            try:
+                state = future.result()
+            except Exception as e:
+                console.log(f"Backfill failed at {payday['date']} ({e}), stopping.")
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            submit_next()
+
+            payday_in_order = Payday.from_state(
+                state,
+                None,
+                mongodb,
+                NullTooter(),
+                TESTNET=TESTNET,
+                backfill=True,
+            )
+            # the delegators are stored as the changes since the previous
+            # payday, so in date order (Step 1 in the workers skips them).
+            payday_in_order.store_delegators()
+            payday_in_order.run_pipeline(STEPS_IN_ORDER)
+            done += 1
+            console.log(f"Backfilled {payday['date']} ({done:,}/{len(paydays):,}).")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Backfill / recompute paydays.")
+    parser.add_argument("--from-date")
+    parser.add_argument("--to-date")
+    parser.add_argument("--from-height", type=int, help="Payday block height.")
+    parser.add_argument("--to-height", type=int, help="Payday block height.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Worker processes for steps 1-3.",
+    )
+    parser.add_argument("--testnet", action="store_true")
+    parser.add_argument(
+        "--no-node-pool",
+        action="store_true",
+        help="Only use the primary gRPC node, see node_pool.py.",
+    )
+    args = parser.parse_args()
+    if not (args.from_date or args.to_date or args.from_height or args.to_height):
+        parser.error("Give a date and/or height range.")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    tooter = Tooter()
+    mongodb = MongoDB(tooter)
+    db: Dict[Collections, Collection] = (
+        mongodb.mainnet if not args.testnet else mongodb.testnet
+    )
+    ensure_indexes(db)
+    ensure_delegator_indexes(delegators_collection(mongodb, args.testnet))
+
+    paydays = paydays_in_range(
+        db, args.from_date, args.to_date, args.from_height, args.to_height
+    )
+    if len(paydays) == 0:
+        console.log("No paydays in this range.")
+    else:
+        console.log(
+            f"Backfilling {len(paydays):,} paydays, {paydays[0]['date']} - {paydays[-1]['date']}..."
+        )
+        backfill(
+            paydays,
+            mongodb,
+            args.workers,
+            TESTNET=args.testnet,
+            use_node_pool=not args.no_node_pool,
+        )
+        try:
+            tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Backfill) \nDone: {len(paydays):,} paydays, {paydays[0]['date']} - {paydays[-1]['date']}.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Backfill, can't toot.")
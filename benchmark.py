@@ -0,0 +1,706 @@
+"""
+Offline benchmark for the payday pipeline.
+
+Runs Steps 1-6 of `Payday` against an in-memory Mongo stand-in, with gRPC
+responses that are either generated (synthetic, at a configurable scale) or
+replayed from a fixture recorded earlier against a real node. Reports per step
+wall time, memory and the number of DB and gRPC operations.
+
+    python benchmark.py synthetic --pools 500 --delegators 200000 --history-days 31 --days 2
+    python benchmark.py record --payday-date 2024-05-01 --payday-hash <hash> --previous-height <height> --fixture payday.pickle
+    python benchmark.py replay --fixture payday.pickle
+"""
+
+import os
+import tempfile
+
+# checkpoints of benchmark runs should never end up next to the real ones,
+# this needs to be set before env.py is imported (through payday).
+os.environ.setdefault(
+    "PAYDAY_CHECKPOINT_DIR", tempfile.mkdtemp(prefix="payday-benchmark-")
+)
+# every gRPC call has to reach the benchmark's client (a recording needs all
+# responses), so no response cache on disk shared with real runs.
+os.environ["PAYDAY_GRPC_CACHE_DIR"] = ""
+# offline: the benchmark's clients are never pooled with real nodes.
+os.environ["PAYDAY_GRPC_NODE_POOL"] = "false"
+# the StepMeter measures one step at a time, so the steps run one by one
+# (unless set otherwise).
+os.environ.setdefault("PAYDAY_STEP_CONCURRENCY", "1")
+
+import argparse
+import datetime as dt
+import json
+import pickle
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, Optional
+import numpy as np
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import (
+    CCD_AccountInfo,
+    CCD_BakerPoolInfo,
+    CCD_BlockInfo,
+    CCD_BlockSpecialEvent,
+    CCD_BlockSpecialEvent_PaydayAccountReward,
+    CCD_BlockSpecialEvent_PaydayPoolReward,
+    CCD_CommissionRates,
+    CCD_CurrentPaydayStatus,
+    CCD_DelegatorRewardPeriodInfo,
+    CCD_ElectionInfo,
+    CCD_ElectionInfo_Baker,
+    CCD_PassiveDelegationInfo,
+    CCD_PoolInfo,
+)
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.collection import Collection
+from rich.console import Console
+from rich.table import Table
+from in_memory_mongo import InMemoryMongoDB
+from payday import NullTooter, Payday, ensure_indexes
+from payday_delegators import delegators_collection, ensure_delegator_indexes
+
+console = Console()
+
+BLOCKS_PER_PAYDAY = 8_640
+SECONDS_PER_BLOCK = 10
+FIRST_PAYDAY_HEIGHT = 3_232_445
+GENESIS_SLOT_TIME = dt.datetime(2022, 6, 24, 9, 0, tzinfo=dt.timezone.utc)
+
+
+class SyntheticGRPCClient:
+    """
+    Generates the gRPC responses the payday pipeline asks for: `pools` pools
+    with `delegators` delegators (10% of them on passive delegation), and for
+    every payday block a reward for every pool and (almost) every account.
+    Block hashes are `block-<height>`, blocks are SECONDS_PER_BLOCK apart.
+    Delegations and stakes are fixed, rewards differ per payday.
+    """
+
+    def __init__(self, pools: int, delegators: int, seed: int = 42):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.baker_ids = list(range(pools))
+        self.baker_accounts = [f"validator-{x:06d}" for x in self.baker_ids]
+
+        # a few big pools, many small ones
+        weights = rng.pareto(1.5, pools) + 1
+        pool_for_delegator = rng.choice(
+            pools, size=delegators, p=weights / weights.sum()
+        )
+        pool_for_delegator[rng.random(delegators) < 0.10] = -1
+        self.stakes = rng.integers(1_000, 1_000_000, size=delegators) * 1_000_000
+        self.delegator_accounts = [f"delegator-{x:08d}" for x in range(delegators)]
+        self.pool_for_delegator = pool_for_delegator
+
+        self.delegators_by_pool: Dict[Optional[int], list] = {
+            x: [] for x in self.baker_ids
+        }
+        self.delegators_by_pool[None] = []
+        for account, pool, stake in zip(
+            self.delegator_accounts, pool_for_delegator.tolist(), self.stakes.tolist()
+        ):
+            self.delegators_by_pool[pool if pool >= 0 else None].append(
+                CCD_DelegatorRewardPeriodInfo(account=account, stake=stake)
+            )
+
+        self.equity = rng.integers(500_000, 5_000_000, size=pools) * 1_000_000
+        self.commission = rng.choice([0.0, 0.05, 0.1], size=pools)
+        delegated = [
+            sum(x.stake for x in self.delegators_by_pool[b]) for b in self.baker_ids
+        ]
+        self.all_pool_total_capital = int(self.equity.sum()) + int(self.stakes.sum())
+
+        self.pool_info_by_baker_id: Dict[int, CCD_PoolInfo] = {}
+        for b in self.baker_ids:
+            effective_stake = int(self.equity[b]) + delegated[b]
+            self.pool_info_by_baker_id[b] = CCD_PoolInfo(
+                all_pool_total_capital=self.all_pool_total_capital,
+                address=self.baker_accounts[b],
+                baker=b,
+                equity_capital=int(self.equity[b]),
+                delegated_capital=delegated[b],
+                current_payday_info=CCD_CurrentPaydayStatus(
+                    baker_equity_capital=int(self.equity[b]),
+                    blocks_baked=0,
+                    delegated_capital=delegated[b],
+                    effective_stake=effective_stake,
+                    finalization_live=True,
+                    lottery_power=effective_stake / self.all_pool_total_capital,
+                    transaction_fees_earned=0,
+                ),
+                pool_info=CCD_BakerPoolInfo(
+                    commission_rates=CCD_CommissionRates(
+                        baking=float(self.commission[b]),
+                        finalization=1.0,
+                        transaction=float(self.commission[b]),
+                    ),
+                    url="",
+                    open_status="openForAll" if b % 10 else "closedForNew",
+                ),
+            )
+        passive_capital = sum(x.stake for x in self.delegators_by_pool[None])
+        self.passive_delegation_info = CCD_PassiveDelegationInfo(
+            all_pool_total_capital=self.all_pool_total_capital,
+            delegated_capital=passive_capital,
+            current_payday_transaction_fees_earned=0,
+            current_payday_delegated_capital=passive_capital,
+            commission_rates=CCD_CommissionRates(
+                baking=0.12, finalization=1.0, transaction=0.12
+            ),
+        )
+        self.election_info = CCD_ElectionInfo(
+            election_nonce="synthetic",
+            baker_election_info=[
+                CCD_ElectionInfo_Baker(
+                    baker=b,
+                    account=self.baker_accounts[b],
+                    lottery_power=self.pool_info_by_baker_id[
+                        b
+                    ].current_payday_info.lottery_power,
+                )
+                for b in self.baker_ids
+            ],
+        )
+        self.special_events_by_hash: Dict[str, list[CCD_BlockSpecialEvent]] = {}
+
+    @staticmethod
+    def height_from_hash(block_hash: str) -> int:
+        return int(block_hash.split("-")[1])
+
+    def get_blocks_at_height(self, height: int, *args, **kwargs) -> list[str]:
+        return [f"block-{height}"]
+
+    def get_block_info(self, block_hash: str, *args, **kwargs) -> CCD_BlockInfo:
+        height = self.height_from_hash(block_hash)
+        return CCD_BlockInfo(
+            hash=block_hash,
+            height=height,
+            last_finalized_block=f"block-{height - 1}",
+            parent_block=f"block-{height - 1}",
+            slot_time=GENESIS_SLOT_TIME
+            + dt.timedelta(seconds=SECONDS_PER_BLOCK * height),
+            era_block_height=height,
+            finalized=True,
+            genesis_index=0,
+            transaction_count=0,
+            transactions_energy_cost=0,
+            transactions_size=0,
+        )
+
+    def get_election_info(self, block_hash: str, *args, **kwargs) -> CCD_ElectionInfo:
+        return self.election_info
+
+    def get_account_info(
+        self, block_hash: str, account_index: int = None, *args, **kwargs
+    ) -> CCD_AccountInfo:
+        return CCD_AccountInfo.model_construct(
+            address=self.baker_accounts[account_index]
+        )
+
+    def get_pool_info_for_pool(self, baker_id: int, block_hash: str, *args, **kwargs):
+        return self.pool_info_by_baker_id[baker_id]
+
+    def get_delegators_for_pool_in_reward_period(
+        self, baker_id: int, block_hash: str, *args, **kwargs
+    ) -> list[CCD_DelegatorRewardPeriodInfo]:
+        return self.delegators_by_pool[baker_id]
+
+    def get_delegators_for_passive_delegation_in_reward_period(
+        self, block_hash: str, *args, **kwargs
+    ) -> list[CCD_DelegatorRewardPeriodInfo]:
+        return self.delegators_by_pool[None]
+
+    def get_passive_delegation_info(self, block_hash: str, *args, **kwargs):
+        return self.passive_delegation_info
+
+    def get_block_special_events(
+        self, block_hash: str, *args, **kwargs
+    ) -> list[CCD_BlockSpecialEvent]:
+        if block_hash not in self.special_events_by_hash:
+            # only keep the payday we are working on.
+            self.special_events_by_hash = {
+                block_hash: self.generate_special_events(block_hash)
+            }
+        return self.special_events_by_hash[block_hash]
+
+    def generate_special_events(self, block_hash: str) -> list[CCD_BlockSpecialEvent]:
+        """
+        Rewards for a payday block, around 5% APY, 5% of the accounts without a
+        reward (so the moving averages see missing days).
+        """
+        rng = np.random.default_rng([self.seed, self.height_from_hash(block_hash)])
+        daily_rate = 0.05 / 365 * rng.uniform(0.5, 1.5, size=len(self.baker_ids))
+        events = []
+        for b in self.baker_ids:
+            pool_info = self.pool_info_by_baker_id[b]
+            total = int(pool_info.current_payday_info.effective_stake * daily_rate[b])
+            events.append(
+                CCD_BlockSpecialEvent(
+                    payday_pool_reward=CCD_BlockSpecialEvent_PaydayPoolReward(
+                        pool_owner=b,
+                        transaction_fees=total // 10,
+                        baker_reward=total - total // 5,
+                        finalization_reward=total // 10,
+                    )
+                )
+            )
+        passive_total = int(
+            self.passive_delegation_info.current_payday_delegated_capital * 0.04 / 365
+        )
+        events.append(
+            CCD_BlockSpecialEvent(
+                payday_pool_reward=CCD_BlockSpecialEvent_PaydayPoolReward(
+                    pool_owner=None,
+                    transaction_fees=0,
+                    baker_reward=passive_total,
+                    finalization_reward=0,
+                )
+            )
+        )
+
+        rate_for_delegator = np.where(
+            self.pool_for_delegator >= 0,
+            daily_rate[np.maximum(self.pool_for_delegator, 0)],
+            0.04 / 365,
+        ) * (1 - 0.1)
+        rewards = (self.stakes * rate_for_delegator).astype(np.int64).tolist()
+        rewarded = (rng.random(len(self.delegator_accounts)) > 0.05).tolist()
+        accounts = list(zip(self.delegator_accounts, rewards, rewarded))
+        accounts += [
+            (self.baker_accounts[b], int(self.equity[b] * daily_rate[b]), True)
+            for b in self.baker_ids
+        ]
+        for account, reward, is_rewarded in accounts:
+            if is_rewarded:
+                events.append(
+                    CCD_BlockSpecialEvent(
+                        payday_account_reward=CCD_BlockSpecialEvent_PaydayAccountReward(
+                            account=account,
+                            transaction_fees=reward // 10,
+                            baker_reward=reward - reward // 5,
+                            finalization_reward=reward // 10,
+                        )
+                    )
+                )
+        return events
+
+    def seed_history(
+        self, db: Dict[Collections, Collection], dates: list[str], heights: list[int]
+    ):
+        """
+        Paydays entries and `daily_apy_dict` history for `dates`, as if those
+        paydays were processed before (without moving average state, so the
+        first benchmarked payday does a full recompute).
+        """
+        rng = np.random.default_rng([self.seed, 0])
+        db[Collections.paydays].seed(
+            [
+                {
+                    "_id": f"block-{height}",
+                    "date": date,
+                    "height_for_last_block": height - 1,
+                }
+                for date, height in zip(dates, heights)
+            ]
+        )
+        if len(dates) == 0:
+            return
+
+        # a small set of distinct day entries, shared between the documents
+        day_entries = [
+            {"apy": float(x), "reward": float(x) * 10}
+            for x in rng.uniform(0.02, 0.08, size=64)
+        ]
+        pool_entries = [{"baker": x, "total": x, "delegator": x} for x in day_entries]
+        documents = []
+        for account_id in self.delegator_accounts + self.baker_accounts:
+            picks = rng.integers(0, 64, size=len(dates)).tolist()
+            missing = (rng.random(len(dates)) < 0.05).tolist()
+            documents.append(
+                {
+                    "_id": account_id,
+                    "calculation_type": "daily apy (intermediate value)",
+                    "daily_apy_dict": {
+                        date: day_entries[pick]
+                        for date, pick, is_missing in zip(dates, picks, missing)
+                        if not is_missing
+                    },
+                    "last_payday_date": dates[-1],
+                }
+            )
+        for pool_id in [str(x) for x in self.baker_ids] + ["passive_delegation"]:
+            picks = rng.integers(0, 64, size=len(dates)).tolist()
+            daily_apy_dict = {
+                date: pool_entries[pick] for date, pick in zip(dates, picks)
+            }
+            if pool_id == "passive_delegation":
+                daily_apy_dict = {
+                    date: {**entry, "passive": entry["total"]}
+                    for date, entry in daily_apy_dict.items()
+                }
+            documents.append(
+                {
+                    "_id": pool_id,
+                    "calculation_type": "daily apy (intermediate value)",
+                    "daily_apy_dict": daily_apy_dict,
+                    "last_payday_date": dates[-1],
+                }
+            )
+        db[Collections.paydays_apy_intermediate].seed(documents)
+
+
+class CountingGRPCClient:
+    """
+    Wraps a GRPCClient (or a stand-in) and counts the calls per method.
+    Safe to use from the fan_out worker threads.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        f = getattr(self.client, name)
+        if not callable(f):
+            return f
+
+        def counted(*args, **kwargs):
+            with self.lock:
+                self.calls[name] += 1
+            return f(*args, **kwargs)
+
+        return counted
+
+
+def response_key(name: str, args: tuple, kwargs: dict) -> tuple:
+    return (name, args, tuple(sorted(kwargs.items())))
+
+
+class RecordingGRPCClient:
+    """
+    Wraps a GRPCClient and keeps every response, keyed by method and arguments,
+    so a payday can be replayed later without a node.
+    """
+
+    def __init__(self, client: GRPCClient):
+        self.client = client
+        self.responses: Dict[tuple, object] = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        f = getattr(self.client, name)
+        if not callable(f):
+            return f
+
+        def recorded(*args, **kwargs):
+            response = f(*args, **kwargs)
+            with self.lock:
+                self.responses[response_key(name, args, kwargs)] = response
+            return response
+
+        return recorded
+
+
+class ReplayGRPCClient:
+    """
+    Serves the responses recorded by RecordingGRPCClient.
+    """
+
+    def __init__(self, responses: Dict[tuple, object]):
+        self.responses = responses
+
+    def __getattr__(self, name: str):
+        def replayed(*args, **kwargs):
+            key = response_key(name, args, kwargs)
+            if key not in self.responses:
+                raise KeyError(f"No recorded response for {key}.")
+            return self.responses[key]
+
+        return replayed
+
+
+class StepMeter:
+    """
+    Measures wall time, memory and DB/gRPC operations between two points.
+    With `trace_memory`, memory is the tracemalloc peak during the step (slow,
+    but per step), otherwise the max RSS of the process so far.
+    """
+
+    def __init__(
+        self,
+        mongodb: InMemoryMongoDB,
+        grpcclient: CountingGRPCClient,
+        trace_memory: bool = False,
+    ):
+        self.mongodb = mongodb
+        self.grpcclient = grpcclient
+        self.trace_memory = trace_memory
+        self.rows: list[dict] = []
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start()
+
+    def snapshot(self) -> dict:
+        documents = self.mongodb.documents()
+        return {
+            "time": time.perf_counter(),
+            # round trips, a bulk_write counts once
+            "db_operations": sum(
+                v
+                for k, v in self.mongodb.operations().items()
+                if not k.endswith(".bulk_write_requests")
+            ),
+            "db_documents_read": documents["read"],
+            "db_documents_written": documents["written"],
+            "grpc_calls": sum(self.grpcclient.calls.values()),
+        }
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.started = self.snapshot()
+
+    def stop(self, payday_date_string: str, step_name: str):
+        ended = self.snapshot()
+        if self.trace_memory:
+            memory = tracemalloc.get_traced_memory()[1] / 1024**2
+        else:
+            # kilobytes on Linux
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        row = {"date": payday_date_string, "step": step_name}
+        for k in ended.keys():
+            row[k] = ended[k] - self.started[k]
+        row["seconds"] = row.pop("time")
+        row["memory_mb"] = memory
+        self.rows.append(row)
+        self.start()
+
+    def wrap(self, payday_date_string: str, step_name: str, methods: list[Callable]):
+        def measured():
+            self.start()
+            for method in methods:
+                method()
+            self.stop(payday_date_string, step_name)
+
+        return measured
+
+
+class BenchmarkPayday(Payday):
+    """
+    Payday that measures every step of the pipeline with a StepMeter.
+    The block lookups in the constructor are reported as `setup`.
+    The meter is a class attribute, so it stays out of the checkpoint pickle.
+    """
+
+    meter: StepMeter = None
+
+    def __init__(self, *args, **kwargs):
+        self.meter.start()
+        super().__init__(*args, **kwargs)
+
+    def pipeline_steps(self) -> list[tuple[str, list]]:
+        self.meter.stop(self.payday_date_string, "setup")
+        return [
+            (step_name, [self.meter.wrap(self.payday_date_string, step_name, methods)])
+            for step_name, methods in super().pipeline_steps()
+        ]
+
+
+def print_report(rows: list[dict], memory_label: str):
+    table = Table(title="Payday benchmark")
+    table.add_column("date")
+    table.add_column("step")
+    for column in [
+        "seconds",
+        memory_label,
+        "db ops",
+        "docs read",
+        "docs written",
+        "gRPC calls",
+    ]:
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(
+            row["date"],
+            row["step"],
+            f"{row['seconds']:,.2f}",
+            f"{row['memory_mb']:,.0f}",
+            f"{row['db_operations']:,}",
+            f"{row['db_documents_read']:,}",
+            f"{row['db_documents_written']:,}",
+            f"{row['grpc_calls']:,}",
+        )
+    console.print(table)
+
+
+def run_paydays(
+    paydays: list[dict],
+    grpcclient,
+    mongodb: InMemoryMongoDB,
+    trace_memory: bool,
+    prepare: Optional[Callable] = None,
+) -> list[dict]:
+    """
+    Run the pipeline for every payday ({date, hash}) in order, return the rows
+    with measurements. `prepare(payday)` is called (unmeasured) before each.
+    """
+    counting_grpcclient = CountingGRPCClient(grpcclient)
+    ensure_indexes(mongodb.mainnet)
+    ensure_delegator_indexes(delegators_collection(mongodb))
+    meter = StepMeter(mongodb, counting_grpcclient, trace_memory=trace_memory)
+    BenchmarkPayday.meter = meter
+    for payday in paydays:
+        if prepare:
+            prepare(payday)
+        BenchmarkPayday(
+            payday["date"],
+            payday["hash"],
+            counting_grpcclient,
+            mongodb,
+            NullTooter(),
+        )
+    return meter.rows
+
+
+def previous_date_string(date_string: str) -> str:
+    return f"{dt.date.fromisoformat(date_string) - dt.timedelta(days=1):%Y-%m-%d}"
+
+
+def synthetic(args) -> list[dict]:
+    console.log(
+        f"Generating {args.pools:,} pools and {args.delegators:,} delegators..."
+    )
+    grpcclient = SyntheticGRPCClient(args.pools, args.delegators, seed=args.seed)
+    mongodb = InMemoryMongoDB()
+
+    start_date = dt.date.fromisoformat(args.start_date)
+    dates = [
+        f"{start_date + dt.timedelta(days=x):%Y-%m-%d}"
+        for x in range(args.history_days + args.days)
+    ]
+    heights = [
+        FIRST_PAYDAY_HEIGHT + (x + 1) * BLOCKS_PER_PAYDAY for x in range(len(dates))
+    ]
+    console.log(f"Seeding {args.history_days} days of history...")
+    grpcclient.seed_history(
+        mongodb.mainnet, dates[: args.history_days], heights[: args.history_days]
+    )
+
+    paydays = [
+        {"date": date, "hash": f"block-{height}"}
+        for date, height in zip(
+            dates[args.history_days :], heights[args.history_days :]
+        )
+    ]
+    # generate the special events up front, so that isn't measured.
+    return run_paydays(
+        paydays,
+        grpcclient,
+        mongodb,
+        args.trace_memory,
+        prepare=lambda payday: grpcclient.get_block_special_events(payday["hash"]),
+    )
+
+
+def seed_previous_payday(mongodb: InMemoryMongoDB, payday: dict):
+    if payday.get("previous_height") is not None:
+        mongodb.mainnet[Collections.paydays].seed(
+            [
+                {
+                    "_id": f"previous-{payday['date']}",
+                    "date": previous_date_string(payday["date"]),
+                    "height_for_last_block": payday["previous_height"],
+                }
+            ]
+        )
+
+
+def record(args) -> list[dict]:
+    grpcclient = RecordingGRPCClient(GRPCClient())
+    mongodb = InMemoryMongoDB()
+    payday = {
+        "date": args.payday_date,
+        "hash": args.payday_hash,
+        "previous_height": args.previous_height,
+    }
+    seed_previous_payday(mongodb, payday)
+    rows = run_paydays([payday], grpcclient, mongodb, args.trace_memory)
+
+    with open(args.fixture, "wb") as f:
+        pickle.dump(
+            {"paydays": [payday], "responses": grpcclient.responses},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    console.log(f"Recorded {len(grpcclient.responses):,} responses to {args.fixture}.")
+    return rows
+
+
+def replay(args) -> list[dict]:
+    with open(args.fixture, "rb") as f:
+        fixture = pickle.load(f)
+    mongodb = InMemoryMongoDB()
+    for payday in fixture["paydays"]:
+        seed_previous_payday(mongodb, payday)
+    return run_paydays(
+        fixture["paydays"],
+        ReplayGRPCClient(fixture["responses"]),
+        mongodb,
+        args.trace_memory,
+    )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Offline payday benchmark.")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Per step peak memory with tracemalloc (slower), instead of max RSS.",
+    )
+    parser.add_argument("--json", help="Also write the measurements to this file.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    parser_synthetic = subparsers.add_parser("synthetic", help="Generated data.")
+    parser_synthetic.add_argument("--pools", type=int, default=500)
+    parser_synthetic.add_argument("--delegators", type=int, default=200_000)
+    parser_synthetic.add_argument(
+        "--history-days",
+        type=int,
+        default=31,
+        help="Paydays of history before the benchmarked ones (>= 30 for moving averages).",
+    )
+    parser_synthetic.add_argument(
+        "--days", type=int, default=2, help="Consecutive paydays to benchmark."
+    )
+    parser_synthetic.add_argument("--start-date", default="2024-01-01")
+    parser_synthetic.add_argument("--seed", type=int, default=42)
+
+    parser_record = subparsers.add_parser(
+        "record", help="Run a payday against a node and record the responses."
+    )
+    parser_record.add_argument("--payday-date", required=True)
+    parser_record.add_argument("--payday-hash", required=True)
+    parser_record.add_argument(
+        "--previous-height",
+        type=int,
+        help="height_for_last_block of the previous payday.",
+    )
+    parser_record.add_argument("--fixture", required=True)
+
+    parser_replay = subparsers.add_parser("replay", help="Replay a recorded fixture.")
+    parser_replay.add_argument("--fixture", required=True)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    rows = {"synthetic": synthetic, "record": record, "replay": replay}[args.mode](args)
+    print_report(rows, "peak MB" if args.trace_memory else "max RSS MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
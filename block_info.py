@@ -0,0 +1,121 @@
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import CCD_BlockHash, CCD_BlockInfo
+from ccdexplorer_fundamentals.mongodb import MongoDB
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+from rich.console import Console
+from grpc_fanout import call_with_retry
+
+console = Console()
+from env import *
+
+# block info of the blocks a payday looks up by height, keyed on height.
+PAYDAYS_BLOCK_INFO = "paydays_block_info"
+
+
+def block_info_collection(mongodb: MongoDB, TESTNET: bool = False) -> Collection:
+    """
+    The paydays_block_info collection. It's not in `Collections`, so it's
+    taken from the database directly.
+    """
+    database = mongodb.mainnet_db if not TESTNET else mongodb.testnet_db
+    return database[PAYDAYS_BLOCK_INFO]
+
+
+def block_info_document(block_info: CCD_BlockInfo) -> dict:
+    # the transaction hashes aren't needed and can be large.
+    return {
+        "_id": block_info.height,
+        **block_info.model_dump(exclude_none=True, exclude={"transaction_hashes"}),
+    }
+
+
+def block_info_from_document(document: dict) -> CCD_BlockInfo:
+    """
+    Mongo returns naive datetimes (in UTC), the node timezone aware ones.
+    """
+    document = {
+        k: (
+            v.replace(tzinfo=dt.timezone.utc)
+            if isinstance(v, dt.datetime) and (v.tzinfo is None)
+            else v
+        )
+        for k, v in document.items()
+        if k != "_id"
+    }
+    return CCD_BlockInfo(**document)
+
+
+class BlockInfoResolver:
+    """
+    Block info for a set of heights, with as few node round trips as possible:
+    heights already resolved (in this process or, for finalized blocks, stored
+    in paydays_block_info) are not looked up again, a known hash skips
+    `get_blocks_at_height`, and the remaining lookups run concurrently.
+    """
+
+    def __init__(
+        self,
+        grpcclient: GRPCClient,
+        collection: Collection,
+        max_workers: int = PAYDAY_GRPC_CONCURRENCY,
+    ):
+        self.grpcclient = grpcclient
+        self.collection = collection
+        self.max_workers = max(1, max_workers)
+        self.block_info_by_height: Dict[int, CCD_BlockInfo] = {}
+
+    def lookup(
+        self, height: int, known_hash: Optional[CCD_BlockHash] = None
+    ) -> CCD_BlockInfo:
+        _hash = known_hash
+        if not _hash:
+            _hash = call_with_retry(self.grpcclient.get_blocks_at_height, height)[0]
+        return call_with_retry(self.grpcclient.get_block_info, _hash)
+
+    def resolve(
+        self,
+        heights: list[int],
+        known_hashes: Optional[Dict[int, CCD_BlockHash]] = None,
+    ) -> Dict[int, CCD_BlockInfo]:
+        known_hashes = known_hashes or {}
+        missing = [
+            x for x in dict.fromkeys(heights) if x not in self.block_info_by_height
+        ]
+
+        if len(missing) > 0:
+            for document in self.collection.find({"_id": {"$in": missing}}):
+                self.block_info_by_height[document["_id"]] = block_info_from_document(
+                    document
+                )
+            missing = [x for x in missing if x not in self.block_info_by_height]
+
+        if len(missing) > 0:
+            with ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(missing))
+            ) as executor:
+                looked_up = list(
+                    executor.map(
+                        lambda height: self.lookup(height, known_hashes.get(height)),
+                        missing,
+                    )
+                )
+            for height, block_info in zip(missing, looked_up):
+                self.block_info_by_height[height] = block_info
+
+            # only finalized blocks can't change anymore.
+            queue = [
+                ReplaceOne({"_id": x.height}, block_info_document(x), upsert=True)
+                for x in looked_up
+                if x.finalized
+            ]
+            if len(queue) > 0:
+                _ = self.collection.bulk_write(queue, ordered=False)
+
+        console.log(
+            f"Block info for {len(heights)} heights, {len(missing)} looked up on the node."
+        )
+        return {x: self.block_info_by_height[x] for x in heights}
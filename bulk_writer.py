@@ -0,0 +1,143 @@
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+from rich.console import Console
+
+console = Console()
+from env import *
+
+
+class BulkWriter:
+    """
+    Drop-in for the `queue` list the steps build for a bulk_write: `append`
+    requests, then `close` to write what's left and wait for everything. As a
+    context manager it closes on exit, or aborts if the block raised, so no
+    thread or pending chunk is left behind.
+
+    Every PAYDAY_BULK_WRITE_CHUNK_SIZE requests are written as an unordered
+    bulk_write on a background thread, while the step keeps computing. At most
+    PAYDAY_BULK_WRITE_MAX_PENDING chunks are in flight (`append` waits for the
+    oldest one otherwise), so memory doesn't grow with the number of accounts.
+    The result (or error) of every chunk is kept in `results`. With
+    ordered=False a failing request doesn't stop the rest of its chunk, but
+    `close` raises the first error, so the step still fails.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        chunk_size: int = PAYDAY_BULK_WRITE_CHUNK_SIZE,
+        max_pending: int = PAYDAY_BULK_WRITE_MAX_PENDING,
+        ordered: bool = False,
+    ):
+        self.collection = collection
+        self.chunk_size = max(1, chunk_size)
+        self.max_pending = max(1, max_pending)
+        self.ordered = ordered
+        self.chunk: list = []
+        self.chunks_submitted = 0
+        self.pending: deque[Future] = deque()
+        self.results: list[dict] = []
+        # a single thread, so chunks are written in the order they're added.
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"bulk_writer-{collection.name}"
+        )
+
+    def append(self, request):
+        self.chunk.append(request)
+        if len(self.chunk) >= self.chunk_size:
+            self.submit()
+
+    def extend(self, requests):
+        for request in requests:
+            self.append(request)
+
+    def submit(self):
+        if len(self.chunk) == 0:
+            return
+        while len(self.pending) >= self.max_pending:
+            self.wait_for_oldest()
+        # in a copy of the caller's context, so the write counts for its step.
+        self.pending.append(
+            self.executor.submit(
+                contextvars.copy_context().run,
+                self.write_chunk,
+                self.chunks_submitted,
+                self.chunk,
+            )
+        )
+        self.chunks_submitted += 1
+        self.chunk = []
+
+    def write_chunk(self, index: int, chunk: list) -> dict:
+        result = {"chunk": index, "requests": len(chunk), "errors": 0}
+        start = time.perf_counter()
+        try:
+            bulk_write_result = self.collection.bulk_write(chunk, ordered=self.ordered)
+            result.update(
+                {
+                    "inserted": bulk_write_result.inserted_count,
+                    "upserted": bulk_write_result.upserted_count,
+                    "matched": bulk_write_result.matched_count,
+                    "modified": bulk_write_result.modified_count,
+                }
+            )
+        except BulkWriteError as e:
+            result["errors"] = len(e.details.get("writeErrors", [])) or len(chunk)
+            result["error"] = e
+        except PyMongoError as e:
+            result["errors"] = len(chunk)
+            result["error"] = e
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def wait_for_oldest(self):
+        result = self.pending.popleft().result()
+        if result["errors"] > 0:
+            console.log(
+                f"{self.collection.name}: chunk {result['chunk']} had {result['errors']:,} "
+                f"errors out of {result['requests']:,} ({result['error']})."
+            )
+        self.results.append(result)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """
+        Drop the requests not written yet and wait for the chunks in flight,
+        after the step failed; their errors are left for the step's error.
+        """
+        self.chunk = []
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.pending.clear()
+
+    def close(self) -> list[dict]:
+        """
+        Write the last chunk, wait for all chunks and return their results.
+        """
+        self.submit()
+        while len(self.pending) > 0:
+            self.wait_for_oldest()
+        self.executor.shutdown()
+
+        errors = [x for x in self.results if x["errors"] > 0]
+        console.log(
+            f"{self.collection.name}: {sum(x['requests'] for x in self.results):,} writes in "
+            f"{len(self.results):,} chunks, {sum(x['errors'] for x in errors):,} errors, "
+            f"{sum(x['seconds'] for x in self.results):,.1f}s writing."
+        )
+        if len(errors) > 0:
+            raise errors[0]["error"]
+        return self.results
@@ -0,0 +1,222 @@
+"""
+Catch up on every payday that was missed (the service was down for a while),
+instead of jumping to the newest one: the missed paydays are found on chain
+between the last processed payday and `last_known_payday` and processed in
+date order. While a payday runs Steps 2-6, the gRPC state of the next one
+(block lookups, election info, pool and delegator info) is fetched in the
+background into the gRPC response cache, so its Step 1 hardly waits on the node.
+"""
+
+import datetime as dt
+import threading
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.mongodb import Collections, MongoDB
+from ccdexplorer_fundamentals.tooter import Tooter, TooterChannel, TooterType
+from pymongo.collection import Collection
+from rich.console import Console
+from grpc_fanout import call_with_retry
+from payday import NullTooter, Payday
+
+console = Console()
+from env import *
+
+
+def next_payday_time(grpcclient: GRPCClient, block_hash: str) -> dt.datetime:
+    tokenomics_info = call_with_retry(grpcclient.get_tokenomics_info, block_hash)
+    if not tokenomics_info.v1:
+        raise ValueError(f"No next payday time at {block_hash} (protocol < 4).")
+    return tokenomics_info.v1.next_payday_time
+
+
+def hash_at_height(grpcclient: GRPCClient, height: int) -> str:
+    return call_with_retry(grpcclient.get_blocks_at_height, height)[0]
+
+
+def find_next_payday_height(
+    grpcclient: GRPCClient, payday_hash: str, from_height: int, to_height: int
+) -> int:
+    """
+    The height of the first payday after `payday_hash`, searched between
+    `from_height` and `to_height`: the first block at which the next payday
+    time (in the tokenomics info) has moved on. Returns `to_height` if it
+    hasn't moved on before that.
+    """
+    current = next_payday_time(grpcclient, payday_hash)
+    low, high = from_height, to_height
+    while low < high:
+        middle = (low + high) // 2
+        if next_payday_time(grpcclient, hash_at_height(grpcclient, middle)) > current:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def find_unprocessed_paydays(
+    grpcclient: GRPCClient,
+    db: Dict[Collections, Collection],
+    last_known_payday: dict,
+) -> list[dict]:
+    """
+    All paydays ({date, hash}) after the last processed one, up to and
+    including `last_known_payday`, in date order. A payday is dated on the
+    slot time of its block.
+    """
+    last_processed = db[Collections.paydays].find_one(
+        {}, sort=list({"height_for_last_block": -1}.items())
+    )
+    if not last_processed:
+        return [last_known_payday]
+
+    last_known_height = call_with_retry(
+        grpcclient.get_block_info, last_known_payday["hash"]
+    ).height
+    processed_dates = {
+        x["date"]
+        for x in db[Collections.paydays].find(
+            {
+                "height_for_last_block": {
+                    "$gte": last_processed["height_for_last_block"]
+                }
+            },
+            projection={"_id": 0, "date": 1},
+        )
+    }
+
+    paydays = []
+    payday_hash = last_processed["_id"]
+    payday_height = last_processed["height_for_last_block"] + 1
+    while True:
+        payday_height = find_next_payday_height(
+            grpcclient, payday_hash, payday_height + 1, last_known_height
+        )
+        if payday_height >= last_known_height:
+            break
+        payday_hash = hash_at_height(grpcclient, payday_height)
+        slot_time = call_with_retry(grpcclient.get_block_info, payday_hash).slot_time
+        paydays.append({"date": f"{slot_time:%Y-%m-%d}", "hash": payday_hash})
+
+    paydays.append(last_known_payday)
+    return [x for x in paydays if x["date"] not in processed_dates]
+
+
+class Prefetcher:
+    """
+    Fetches the gRPC state of a payday on a background thread, with a
+    throwaway Payday, so the responses end up in the response cache (and the
+    block info in paydays_block_info) before the real run asks for them.
+    """
+
+    def __init__(self, grpcclient: GRPCClient, mongodb: MongoDB, TESTNET: bool = False):
+        self.grpcclient = grpcclient
+        self.mongodb = mongodb
+        self.TESTNET = TESTNET
+        self.payday: Optional[dict] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def prefetch(self):
+        payday = Payday.from_state(
+            {
+                "payday_date_string": self.payday["date"],
+                "payday_block_hash": self.payday["hash"],
+            },
+            self.grpcclient,
+            self.mongodb,
+            NullTooter(),
+            TESTNET=self.TESTNET,
+        )
+        # its first block follows the last block of the previous payday.
+        if not payday.get_previous_payday_information_entry(self.payday["date"]):
+            console.log(
+                f"Previous payday not stored, not prefetching {self.payday['date']}."
+            )
+            return
+        try:
+            payday.resolve_blocks()
+            payday.retrieve_state_information_for_current_payday()
+            console.log(f"Prefetched {self.payday['date']}.")
+        except Exception as e:
+            # the real run simply fetches what's missing.
+            console.log(f"Prefetching {self.payday['date']} failed ({e}).")
+
+    def start(self):
+        if self.payday and (self.thread is None):
+            self.thread = threading.Thread(
+                target=self.prefetch, name="payday_prefetch", daemon=True
+            )
+            self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+
+class CatchUpPayday(Payday):
+    """
+    Payday that starts prefetching the next payday once its Step 1 is done
+    (the next payday needs this payday's entry in `paydays`).
+    The prefetcher is a class attribute, so it stays out of the checkpoint.
+    """
+
+    prefetcher: Prefetcher = None
+
+    def pipeline_steps(self) -> list[tuple[str, list]]:
+        return [
+            (
+                step_name,
+                (
+                    (methods + [self.prefetcher.start])
+                    if step_name == "step_1"
+                    else methods
+                ),
+            )
+            for step_name, methods in super().pipeline_steps()
+        ]
+
+
+def catch_up(
+    grpcclient: GRPCClient,
+    mongodb: MongoDB,
+    tooter: Tooter,
+    last_known_payday: dict,
+    TESTNET: bool = False,
+):
+    """
+    Process every unprocessed payday up to `last_known_payday`, oldest first.
+    If the missed paydays can't be found, only `last_known_payday` is done.
+    """
+    db: Dict[Collections, Collection] = (
+        mongodb.mainnet if not TESTNET else mongodb.testnet
+    )
+    try:
+        paydays = find_unprocessed_paydays(grpcclient, db, last_known_payday)
+    except Exception as e:
+        console.log(f"Can't find missed paydays ({e}), only doing the last one.")
+        paydays = [last_known_payday]
+
+    if len(paydays) > 1:
+        console.log(
+            f"Catching up on {len(paydays):,} paydays, {paydays[0]['date']} - {paydays[-1]['date']}..."
+        )
+        try:
+            tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Catch up) \nProcessing {len(paydays):,} paydays, {paydays[0]['date']} - {paydays[-1]['date']}.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Catch up, can't toot.")
+
+    prefetcher = Prefetcher(grpcclient, mongodb, TESTNET)
+    CatchUpPayday.prefetcher = prefetcher
+    for i, payday in enumerate(paydays):
+        # never two runs fetching the same payday at the same time.
+        prefetcher.wait()
+        prefetcher.payday = paydays[i + 1] if i + 1 < len(paydays) else None
+        console.log(f"Starting Payday calculations for {payday['date']}...")
+        CatchUpPayday(
+            payday["date"], payday["hash"], grpcclient, mongodb, tooter, TESTNET=TESTNET
+        )
+    prefetcher.wait()
@@ -0,0 +1,110 @@
+import os
+import pickle
+from typing import Dict
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.collection import Collection
+from rich.console import Console
+
+console = Console()
+from env import *
+
+CHECKPOINT_HELPER_ID = "payday_pipeline_checkpoint"
+
+# attributes of a Payday that can't (and shouldn't) be pickled.
+NOT_CHECKPOINTED = [
+    "mongodb",
+    "db",
+    "delegators",
+    "delegator_headers",
+    "current_payday_staging",
+    "grpcclient",
+    "tooter",
+    "metrics",
+    "serialization_cache",
+]
+
+
+class PaydayCheckpoint:
+    """
+    Keeps track of the progress of the payday pipeline, so a restart can resume
+    from the last completed step.
+    The completed steps are recorded in the `helpers` collection, the intermediate
+    products (the state of the Payday instance after that step) are pickled to
+    PAYDAY_CHECKPOINT_DIR. If the pickle is gone, we start from step 1 again,
+    which is fine as every step is idempotent.
+    """
+
+    def __init__(
+        self,
+        db: Dict[Collections, Collection],
+        payday_date_string: str,
+        payday_block_hash: str,
+    ):
+        self.db = db
+        self.payday_date_string = payday_date_string
+        self.payday_block_hash = payday_block_hash
+        self.path = os.path.join(
+            PAYDAY_CHECKPOINT_DIR, f"{payday_date_string}-{payday_block_hash}.pickle"
+        )
+
+    def restore(self, payday) -> list[str]:
+        """
+        Restore the state of `payday` from the last checkpoint and return the
+        steps that are already completed.
+        """
+        helper = self.db[Collections.helpers].find_one({"_id": CHECKPOINT_HELPER_ID})
+        if not helper:
+            return []
+        if (helper["date"] != self.payday_date_string) or (
+            helper["payday_block_hash"] != self.payday_block_hash
+        ):
+            return []
+
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            console.log(f"Can't read checkpoint {self.path} ({e}), starting over.")
+            return []
+
+        payday.__dict__.update(state)
+        console.log(
+            f"Resuming payday {self.payday_date_string} after {helper['completed_steps']}."
+        )
+        return helper["completed_steps"]
+
+    def save(self, payday, completed_steps: list[str]):
+        state = {k: v for k, v in payday.__dict__.items() if k not in NOT_CHECKPOINTED}
+        os.makedirs(PAYDAY_CHECKPOINT_DIR, exist_ok=True)
+        # write to a temp file first, a crash halfway should not leave a
+        # corrupt checkpoint behind.
+        with open(f"{self.path}.tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.path}.tmp", self.path)
+
+        self.db[Collections.helpers].replace_one(
+            {"_id": CHECKPOINT_HELPER_ID},
+            {
+                "_id": CHECKPOINT_HELPER_ID,
+                "date": self.payday_date_string,
+                "payday_block_hash": self.payday_block_hash,
+                "completed_steps": completed_steps,
+            },
+            upsert=True,
+        )
+
+    def clear(self):
+        self.db[Collections.helpers].delete_one({"_id": CHECKPOINT_HELPER_ID})
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def get_unfinished_payday(db: Dict[Collections, Collection]):
+    """
+    The payday (date, block hash) of a pipeline run that didn't finish, if any.
+    """
+    helper = db[Collections.helpers].find_one({"_id": CHECKPOINT_HELPER_ID})
+    if helper:
+        return helper["date"], helper["payday_block_hash"]
+    else:
+        return None
@@ -0,0 +1,59 @@
+from ccdexplorer_fundamentals.mongodb import MongoDB
+from pymongo import InsertOne
+from pymongo.collection import Collection
+from rich.console import Console
+from bulk_writer import BulkWriter
+
+console = Console()
+from env import *
+
+# paydays_current_payday is built here first, then renamed over the real one.
+PAYDAYS_CURRENT_PAYDAY_STAGING = "paydays_current_payday_staging"
+
+
+def staging_collection(mongodb: MongoDB, TESTNET: bool = False) -> Collection:
+    """
+    The staging collection, in the same database as paydays_current_payday
+    (a rename can't cross databases).
+    """
+    database = mongodb.mainnet_db if not TESTNET else mongodb.testnet_db
+    return database[PAYDAYS_CURRENT_PAYDAY_STAGING]
+
+
+def copy_indexes(source: Collection, target: Collection):
+    """
+    A rename with dropTarget drops the indexes of the target, so the staging
+    collection gets them first, with all their options (unique, sparse, TTL,
+    partialFilterExpression, collation, ...).
+    """
+    for name, info in source.index_information().items():
+        if name == "_id_":
+            continue
+        options = {k: v for k, v in info.items() if k not in ["v", "ns", "key"]}
+        target.create_index(info["key"], name=name, **options)
+
+
+def swap_current_payday(
+    staging: Collection, current_payday: Collection, documents: list[dict]
+):
+    """
+    Replace all documents in paydays_current_payday in one go: the documents
+    are written to the staging collection, which is then renamed over
+    paydays_current_payday (with dropTarget, atomic on the server). Readers
+    see either the previous or the new current payday, never an empty or
+    partial one. If a write fails the rename doesn't happen and the previous
+    current payday stays in place.
+    """
+    if len(documents) == 0:
+        # nothing to rename, an empty current payday it is.
+        current_payday.delete_many({})
+        return
+
+    # leftovers from a run that failed halfway.
+    staging.drop()
+    with BulkWriter(staging) as queue:
+        queue.extend(InsertOne(d) for d in documents)
+
+    copy_indexes(current_payday, staging)
+    staging.rename(current_payday.name, dropTarget=True)
+    console.log(f"Swapped in {len(documents):,} documents for {current_payday.name}.")
@@ -0,0 +1,114 @@
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, Optional
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import (
+    CCD_DelegatorRewardPeriodInfo,
+)
+
+
+class DelegatorTable:
+    """
+    The delegators of all pools for a payday, in one compact table instead of
+    lists of pydantic models: one row per delegator, rows of a pool next to
+    each other. Account addresses are interned strings, stakes (microCCD) and
+    the pool of every row are typed arrays, pools are indexed once.
+    Filled by `add_pool` (in pool order), read by Steps 1-5 and pickled with
+    the checkpoint.
+    """
+
+    __slots__ = (
+        "pools",
+        "pool_index",
+        "offsets",
+        "accounts",
+        "stakes",
+        "pool_of_row",
+        "rows",
+    )
+
+    def __init__(self):
+        self.pools: list[str] = []
+        self.pool_index: Dict[str, int] = {}
+        # rows of pool i are offsets[i]:offsets[i + 1]
+        self.offsets = array("q", [0])
+        self.accounts: list[str] = []
+        self.stakes = array("q")
+        self.pool_of_row = array("i")
+        # row of every account
+        self.rows: Dict[str, int] = {}
+
+    @classmethod
+    def from_delegators(
+        cls, delegators_by_pool: Dict[str, list[CCD_DelegatorRewardPeriodInfo]]
+    ) -> "DelegatorTable":
+        table = cls()
+        for pool, delegators in delegators_by_pool.items():
+            table.add_pool(pool, delegators)
+        return table
+
+    def add_pool(self, pool: str, delegators: Iterable[CCD_DelegatorRewardPeriodInfo]):
+        """
+        Add a pool (a baker id or "passive_delegation") with its delegators,
+        anything with `account` and `stake`.
+        """
+        self.add_pool_rows(pool, ((x.account, x.stake) for x in delegators))
+
+    def add_pool_rows(self, pool: str, rows: Iterable[tuple[str, int]]):
+        """
+        Add a pool with its delegators as (account, stake).
+        """
+        pool = str(pool)
+        if pool in self.pool_index:
+            raise ValueError(f"Pool {pool} is already in the table.")
+        self.pool_index[pool] = len(self.pools)
+        self.pools.append(pool)
+        for account, stake in rows:
+            account = sys.intern(account)
+            self.rows[account] = len(self.accounts)
+            self.accounts.append(account)
+            self.stakes.append(stake)
+            self.pool_of_row.append(self.pool_index[pool])
+        self.offsets.append(len(self.accounts))
+
+    def __contains__(self, account: str) -> bool:
+        return account in self.rows
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def pool_rows(self, pool: str) -> range:
+        i = self.pool_index[str(pool)]
+        return range(self.offsets[i], self.offsets[i + 1])
+
+    def delegator_count(self, pool: str) -> int:
+        return len(self.pool_rows(pool))
+
+    def delegated_stake(self, pool: str) -> int:
+        rows = self.pool_rows(pool)
+        return sum(self.stakes[rows.start : rows.stop])
+
+    def pool_for_account(self, account: str) -> Optional[str]:
+        """
+        The pool the account delegates to (None if it doesn't delegate).
+        """
+        row = self.rows.get(account)
+        return self.pools[self.pool_of_row[row]] if row is not None else None
+
+    def stake_for_account(self, account: str) -> Optional[int]:
+        row = self.rows.get(account)
+        return self.stakes[row] if row is not None else None
+
+    def delegators(self, pool: str) -> Iterator[tuple[str, int]]:
+        """
+        (account, stake) of every delegator of `pool`.
+        """
+        for row in self.pool_rows(pool):
+            yield self.accounts[row], self.stakes[row]
+
+    def items(self) -> Iterator[tuple[str, str, int]]:
+        """
+        (pool, account, stake) of every delegator, pool by pool.
+        """
+        for pool in self.pools:
+            for account, stake in self.delegators(pool):
+                yield pool, account, stake
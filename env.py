@@ -16,3 +16,34 @@ ON_SERVER = os.environ.get("ON_SERVER", False)
 COIN_API_KEY = os.environ.get("COIN_API_KEY")
 DEBUG = os.environ.get("DEBUG", False)
 RUN_ON_NET = os.environ.get("NET")
+PAYDAY_GRPC_CONCURRENCY = int(os.environ.get("PAYDAY_GRPC_CONCURRENCY", 16))
+PAYDAY_GRPC_RETRIES = int(os.environ.get("PAYDAY_GRPC_RETRIES", 3))
+PAYDAY_GRPC_RETRY_BACKOFF = float(os.environ.get("PAYDAY_GRPC_RETRY_BACKOFF", 0.5))
+PAYDAY_MONGO_IN_CHUNK_SIZE = int(os.environ.get("PAYDAY_MONGO_IN_CHUNK_SIZE", 1_000))
+PAYDAY_MA_FULL_RECOMPUTE_EVERY = int(
+    os.environ.get("PAYDAY_MA_FULL_RECOMPUTE_EVERY", 30)
+)
+PAYDAY_MA_FULL_SCAN = os.environ.get("PAYDAY_MA_FULL_SCAN", "false").lower() == "true"
+PAYDAY_CHECKPOINT_DIR = os.environ.get("PAYDAY_CHECKPOINT_DIR", "checkpoints")
+PAYDAY_POLL_MIN_SECONDS = float(os.environ.get("PAYDAY_POLL_MIN_SECONDS", 1))
+PAYDAY_POLL_MAX_SECONDS = float(os.environ.get("PAYDAY_POLL_MAX_SECONDS", 60))
+PAYDAY_TRIGGER_SAFETY_SECONDS = float(
+    os.environ.get("PAYDAY_TRIGGER_SAFETY_SECONDS", 300)
+)
+PAYDAY_METRICS_FILE = os.environ.get("PAYDAY_METRICS_FILE")
+PAYDAY_BULK_WRITE_CHUNK_SIZE = int(
+    os.environ.get("PAYDAY_BULK_WRITE_CHUNK_SIZE", 10_000)
+)
+PAYDAY_BULK_WRITE_MAX_PENDING = int(os.environ.get("PAYDAY_BULK_WRITE_MAX_PENDING", 2))
+PAYDAY_GRPC_CACHE_DIR = os.environ.get("PAYDAY_GRPC_CACHE_DIR")
+PAYDAY_GRPC_CACHE_MAX_MB = float(os.environ.get("PAYDAY_GRPC_CACHE_MAX_MB", 128))
+PAYDAY_STEP_CONCURRENCY = int(os.environ.get("PAYDAY_STEP_CONCURRENCY", 4))
+PAYDAY_GRPC_ENDPOINTS = os.environ.get("PAYDAY_GRPC_ENDPOINTS", "")
+PAYDAY_GRPC_HEDGE_PERCENTILE = float(os.environ.get("PAYDAY_GRPC_HEDGE_PERCENTILE", 95))
+PAYDAY_GRPC_HEDGE_MIN_DELAY = float(os.environ.get("PAYDAY_GRPC_HEDGE_MIN_DELAY", 0.05))
+PAYDAY_DELEGATORS_SNAPSHOT_EVERY = int(
+    os.environ.get("PAYDAY_DELEGATORS_SNAPSHOT_EVERY", 30)
+)
+PAYDAY_GRPC_NODE_POOL = (
+    os.environ.get("PAYDAY_GRPC_NODE_POOL", "true").lower() == "true"
+)
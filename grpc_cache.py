@@ -0,0 +1,210 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional
+from rich.console import Console
+
+console = Console()
+from env import *
+
+# methods whose response only depends on their arguments, one of which is a
+# block hash: the state at a given block never changes.
+CACHED_METHODS = [
+    "get_account_info",
+    "get_block_info",
+    "get_block_special_events",
+    "get_delegators_for_passive_delegation_in_reward_period",
+    "get_delegators_for_pool_in_reward_period",
+    "get_election_info",
+    "get_passive_delegation_info",
+    "get_pool_info_for_pool",
+]
+
+# relative block identifiers, the block they point to moves.
+NOT_A_BLOCK_HASH = ["last_final", "best"]
+
+_MISSING = object()
+
+# elements of a long list measured for `memory_size`.
+MEMORY_SIZE_SAMPLE = 64
+
+
+def cache_key(method: str, args: tuple, kwargs: dict) -> Optional[str]:
+    """
+    Content address of a call: a hash of the method and all its arguments,
+    or None if the call isn't cacheable.
+    """
+    if method not in CACHED_METHODS:
+        return None
+    if any(x in NOT_A_BLOCK_HASH for x in [*args, *kwargs.values()]):
+        return None
+    call = repr((method, args, tuple(sorted(kwargs.items()))))
+    return hashlib.sha256(call.encode()).hexdigest()
+
+
+def object_size(value) -> int:
+    """
+    Bytes in memory of `value` and everything it references, each object
+    counted once: containers through their items, pydantic models (and other
+    objects) through their __dict__.
+    """
+    seen = set()
+    stack = [value]
+    size = 0
+    while stack:
+        x = stack.pop()
+        if (id(x) in seen) or isinstance(x, type):
+            continue
+        seen.add(id(x))
+        size += sys.getsizeof(x)
+        if isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset)):
+            stack.extend(x)
+        elif hasattr(x, "__dict__"):
+            stack.append(x.__dict__)
+            if hasattr(x, "__pydantic_fields_set__"):
+                stack.append(x.__pydantic_fields_set__)
+    return size
+
+
+def memory_size(response) -> int:
+    """
+    Estimated size of a response in memory, several times its pickled size
+    for lists of pydantic models. A long list (the delegators of a pool) is
+    extrapolated from a sample of its elements, which errs on the high side
+    as objects the elements share are counted for every one of them.
+    """
+    if isinstance(response, (list, tuple)) and len(response) > MEMORY_SIZE_SAMPLE:
+        sample = response[:: len(response) // MEMORY_SIZE_SAMPLE][:MEMORY_SIZE_SAMPLE]
+        return sys.getsizeof(response) + (
+            sum(object_size(x) for x in sample) * len(response) // len(sample)
+        )
+    return object_size(response)
+
+
+def cacheable_response(method: str, response) -> bool:
+    # a block that isn't finalized yet can still change.
+    if method == "get_block_info":
+        return bool(getattr(response, "finalized", False))
+    return True
+
+
+class BlockResponseCache:
+    """
+    gRPC responses keyed by `cache_key`. In memory it keeps the most recently
+    used responses up to `max_mb` (their estimated size in memory, see
+    `memory_size`), a response larger than half of that isn't kept in memory
+    at all; with `directory` set every response is also pickled to disk, so
+    restarts and backfill workers share them.
+    Thread safe, responses come in from the fan_out workers. The responses
+    are shared, treat them as read-only (as the payday code does).
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = PAYDAY_GRPC_CACHE_DIR,
+        max_mb: float = PAYDAY_GRPC_CACHE_MAX_MB,
+    ):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        # key -> (response, size in memory)
+        self.responses: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self.bytes_in_memory = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pickle")
+
+    def remember(self, key: str, response):
+        size = memory_size(response)
+        if size > self.max_bytes // 2:
+            return
+        with self.lock:
+            if key in self.responses:
+                self.bytes_in_memory -= self.responses.pop(key)[1]
+            self.responses[key] = (response, size)
+            self.bytes_in_memory += size
+            while self.bytes_in_memory > self.max_bytes:
+                self.bytes_in_memory -= self.responses.popitem(last=False)[1][1]
+
+    def get(self, key: str):
+        with self.lock:
+            response = self.responses.get(key, (_MISSING, 0))[0]
+            if response is not _MISSING:
+                self.responses.move_to_end(key)
+        if (response is _MISSING) and self.directory:
+            try:
+                with open(self.path(key), "rb") as f:
+                    data = f.read()
+                response = pickle.loads(data)
+                self.remember(key, response)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                console.log(f"Can't read cached response {key} ({e}).")
+        with self.lock:
+            if response is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, key: str, response):
+        self.remember(key, response)
+        if self.directory:
+            path = self.path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # write to a temp file first, another process may read it.
+                with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                    pickle.dump(response, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f"{path}.{os.getpid()}.tmp", path)
+            except Exception as e:
+                console.log(f"Can't write cached response {key} ({e}).")
+
+    def log_summary(self):
+        console.log(
+            f"gRPC response cache: {self.hits:,} hits, {self.misses:,} misses, "
+            f"{len(self.responses):,} in memory ({self.bytes_in_memory / 1024 / 1024:,.1f} MB)."
+        )
+
+
+class CachingGRPCClient:
+    """
+    Wraps a GRPCClient, calls in CACHED_METHODS are answered from `cache`
+    when possible, so the node only sees calls it hasn't answered before.
+    """
+
+    def __init__(self, client, cache: BlockResponseCache):
+        self.client = client
+        self.cache = cache
+
+    def __getattr__(self, name: str):
+        f = getattr(self.client, name)
+        if (not callable(f)) or (name not in CACHED_METHODS):
+            return f
+
+        def cached(*args, **kwargs):
+            key = cache_key(name, args, kwargs)
+            if key is None:
+                return f(*args, **kwargs)
+            response = self.cache.get(key)
+            if response is _MISSING:
+                response = f(*args, **kwargs)
+                if cacheable_response(name, response):
+                    self.cache.put(key, response)
+            return response
+
+        cached.__name__ = name
+        return cached
+
+
+# shared by all paydays in this process.
+response_cache = BlockResponseCache()
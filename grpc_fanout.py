@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import time
+from typing import Callable, Iterable
+from rich.console import Console
+from step_graph import track
+
+console = Console()
+from env import *
+
+
+def call_with_retry(
+    f: Callable,
+    *args,
+    retries: int = PAYDAY_GRPC_RETRIES,
+    backoff: float = PAYDAY_GRPC_RETRY_BACKOFF,
+    **kwargs,
+):
+    """
+    Call `f` and retry it (with exponential backoff) if it raises. The last
+    exception is re-raised once all attempts are used up.
+    """
+    attempt = 0
+    while True:
+        try:
+            return f(*args, **kwargs)
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            console.log(
+                f"{getattr(f, '__name__', f)} failed ({e}), retry {attempt}/{retries}."
+            )
+            time.sleep(backoff * (2 ** (attempt - 1)))
+
+
+def fan_out(
+    f: Callable,
+    items: Iterable,
+    max_workers: int = PAYDAY_GRPC_CONCURRENCY,
+    description: str = "Working...",
+) -> list:
+    """
+    Run `f(item)` for every item on a bounded thread pool. Results are returned
+    in the same order as `items`, so callers can fill their dicts deterministically.
+    """
+    items = list(items)
+    if len(items) == 0:
+        return []
+
+    # the workers run in (a copy of) the caller's context, so their calls
+    # count for the caller's step in the metrics.
+    context = contextvars.copy_context()
+
+    def in_context(item):
+        return context.copy().run(f, item)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(
+            track(
+                executor.map(in_context, items),
+                total=len(items),
+                description=description,
+            )
+        )
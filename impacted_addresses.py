@@ -0,0 +1,35 @@
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import (
+    CCD_BlockSpecialEvent_PaydayAccountReward,
+)
+from pymongo import ReplaceOne
+
+
+def impacted_address_for_account_reward(
+    account_reward: CCD_BlockSpecialEvent_PaydayAccountReward,
+    block_height: int,
+    payday_date_string: str,
+) -> ReplaceOne:
+    """
+    The impacted_addresses entry for a payday account reward, built directly.
+    This is exactly (same fields, same order) what
+    `MongoImpactedAddress(...).model_dump(exclude_none=True)` without `id` gives
+    for an "Account Reward" with a baker, finalization and transaction fee
+    reward, so the stored BSON doesn't change.
+    """
+    canonical = account_reward.account[:29]
+    return ReplaceOne(
+        {"_id": f"{block_height}-{canonical}"},
+        {
+            "impacted_address": account_reward.account,
+            "impacted_address_canonical": canonical,
+            "effect_type": "Account Reward",
+            "balance_movement": {
+                "baker_reward": account_reward.baker_reward,
+                "finalization_reward": account_reward.finalization_reward,
+                "transaction_fee_reward": account_reward.transaction_fees,
+            },
+            "block_height": block_height,
+            "date": payday_date_string,
+        },
+        upsert=True,
+    )
@@ -0,0 +1,465 @@
+import copy
+import threading
+from collections import Counter
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+
+_MISSING = object()
+
+
+def _get_path(document: dict, path: str):
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def _set_path(document: dict, path: str, value):
+    """
+    Set a dotted path, copying every dict along the way (copy on write), so
+    documents handed out by earlier reads never change underneath the caller.
+    """
+    keys = path.split(".")
+    for key in keys[:-1]:
+        child = document.get(key)
+        child = dict(child) if isinstance(child, dict) else {}
+        document[key] = child
+        document = child
+    document[keys[-1]] = value
+
+
+def _unset_path(document: dict, path: str):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        child = document.get(key)
+        if not isinstance(child, dict):
+            return
+        child = dict(child)
+        document[key] = child
+        document = child
+    document.pop(keys[-1], None)
+
+
+def _matches_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                if (value is _MISSING) or (value not in operand):
+                    return False
+            elif operator == "$exists":
+                if (value is not _MISSING) != operand:
+                    return False
+            elif operator in ["$gte", "$gt", "$lte", "$lt"]:
+                if value is _MISSING:
+                    return False
+                if (operator == "$gte") and not (value >= operand):
+                    return False
+                if (operator == "$gt") and not (value > operand):
+                    return False
+                if (operator == "$lte") and not (value <= operand):
+                    return False
+                if (operator == "$lt") and not (value < operand):
+                    return False
+            else:
+                raise NotImplementedError(
+                    f"InMemoryCollection doesn't support the query operator {operator}."
+                )
+        return True
+    return value == condition
+
+
+def _evaluate(document: dict, expression, variables: dict):
+    """
+    The value of an aggregation expression for `document`: field paths
+    ("$a.b"), variables ("$$day.k") and the operators the payday code uses in
+    pipeline updates ($max, $map, $objectToArray). Anything else is a literal.
+    """
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, _, path = expression[2:].partition(".")
+        value = variables.get(name, _MISSING)
+        return _get_path(value, path) if path else value
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, list):
+        return [_evaluate(document, x, variables) for x in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not any(k.startswith("$") for k in expression):
+        return {k: _evaluate(document, v, variables) for k, v in expression.items()}
+
+    ((operator, operand),) = expression.items()
+    if operator == "$objectToArray":
+        value = _evaluate(document, operand, variables)
+        if not isinstance(value, dict):
+            return None
+        return [{"k": k, "v": v} for k, v in value.items()]
+    elif operator == "$map":
+        values = _evaluate(document, operand["input"], variables)
+        if not isinstance(values, list):
+            return None
+        name = operand.get("as", "this")
+        return [
+            _evaluate(document, operand["in"], {**variables, name: x}) for x in values
+        ]
+    elif operator == "$max":
+        # one argument is an array to take the max of, more are the values.
+        values = _evaluate(document, operand, variables)
+        if (not isinstance(operand, list)) and (not isinstance(values, list)):
+            values = [values]
+        values = [x for x in values if (x is not None) and (x is not _MISSING)]
+        return max(values) if values else None
+    else:
+        raise NotImplementedError(
+            f"InMemoryCollection doesn't support the expression operator {operator}."
+        )
+
+
+def _matches(document: dict, query: Optional[dict]) -> bool:
+    for path, condition in (query or {}).items():
+        if not _matches_condition(_get_path(document, path), condition):
+            return False
+    return True
+
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return dict(document)
+    include = [k for k, v in projection.items() if v and (k != "_id")]
+    if include:
+        result = {}
+        for path in include:
+            value = _get_path(document, path)
+            if value is not _MISSING:
+                _set_path(result, path, value)
+    else:
+        result = dict(document)
+        for path, v in projection.items():
+            if not v and (path != "_id"):
+                _unset_path(result, path)
+    if projection.get("_id", 1):
+        result["_id"] = document["_id"]
+    else:
+        result.pop("_id", None)
+    return result
+
+
+class InMemoryWriteResult:
+    def __init__(self, counts: Counter):
+        self.acknowledged = True
+        self.inserted_count = counts["inserted"]
+        self.matched_count = counts["matched"]
+        self.modified_count = counts["modified"]
+        self.deleted_count = counts["deleted"]
+        self.upserted_count = counts["upserted"]
+
+
+class InMemoryCollection:
+    """
+    A thread safe stand-in for a pymongo Collection, supporting the queries
+    and updates the payday pipeline uses (including the `$set` pipeline
+    updates of the startup and full scan repairs). Lookups on `_id` (literal or `$in`)
+    are dict lookups, everything else is a scan.
+    Every call is counted in `operations`, every document read or written
+    in `documents`.
+    Documents returned by reads share their sub-documents with the stored
+    ones, treat them as read-only (as the payday code does).
+    """
+
+    def __init__(self, name: str, database: Optional["InMemoryDatabase"] = None):
+        self.name = name
+        self.database = database
+        self.documents_by_id: Dict[str, dict] = {}
+        self.operations: Counter = Counter()
+        self.documents: Counter = Counter()
+        self.lock = threading.RLock()
+
+    def seed(self, documents: list[dict]):
+        """
+        Load documents without copying or counting them, to set up a benchmark.
+        """
+        with self.lock:
+            for document in documents:
+                self.documents_by_id[document["_id"]] = document
+
+    def _candidate_ids(self, query: Optional[dict]) -> list:
+        _id = (query or {}).get("_id", _MISSING)
+        if _id is _MISSING:
+            return list(self.documents_by_id.keys())
+        if isinstance(_id, dict) and ("$in" in _id):
+            return [x for x in _id["$in"] if x in self.documents_by_id]
+        if isinstance(_id, dict):
+            return list(self.documents_by_id.keys())
+        return [_id] if _id in self.documents_by_id else []
+
+    def _matching_ids(self, query: Optional[dict]) -> list:
+        return [
+            _id
+            for _id in self._candidate_ids(query)
+            if _matches(self.documents_by_id[_id], query)
+        ]
+
+    # reads
+    def _find(self, filter, projection, sort) -> list[dict]:
+        with self.lock:
+            result = [
+                _project(self.documents_by_id[_id], projection)
+                for _id in self._matching_ids(filter)
+            ]
+        for key, direction in reversed(sort or []):
+            result.sort(key=lambda x: _get_path(x, key), reverse=(direction == -1))
+        self.documents["read"] += len(result)
+        return result
+
+    def find(self, filter=None, projection=None, sort=None, **kwargs):
+        self.operations["find"] += 1
+        return self._find(filter, projection, sort)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        self.operations["find_one"] += 1
+        result = self._find(filter, projection, sort)
+        return result[0] if result else None
+
+    def count_documents(self, filter=None, **kwargs):
+        self.operations["count_documents"] += 1
+        with self.lock:
+            return len(self._matching_ids(filter))
+
+    # writes
+    def _apply_pipeline_update(self, document: dict, pipeline: list) -> dict:
+        for stage in pipeline:
+            ((name, fields),) = stage.items()
+            if name not in ["$set", "$addFields"]:
+                raise NotImplementedError(
+                    f"InMemoryCollection doesn't support the pipeline update stage {name}."
+                )
+            # every field is computed from the document as it was before the stage.
+            values = {
+                path: _evaluate(document, expression, {})
+                for path, expression in fields.items()
+            }
+            document = dict(document)
+            for path, value in values.items():
+                if value is _MISSING:
+                    _unset_path(document, path)
+                else:
+                    _set_path(document, path, copy.deepcopy(value))
+        return document
+
+    def _apply_update(self, document: dict, update) -> dict:
+        if isinstance(update, list):
+            return self._apply_pipeline_update(document, update)
+        document = dict(document)
+        for operator, fields in update.items():
+            for path, value in fields.items():
+                if operator == "$set":
+                    _set_path(document, path, copy.deepcopy(value))
+                elif operator == "$max":
+                    current = _get_path(document, path)
+                    if (current is _MISSING) or (value > current):
+                        _set_path(document, path, value)
+                elif operator == "$unset":
+                    _unset_path(document, path)
+                elif operator != "$setOnInsert":
+                    raise NotImplementedError(
+                        f"InMemoryCollection doesn't support the update operator {operator}."
+                    )
+        return document
+
+    def _update(self, query, update, upsert, many, counts: Counter):
+        matched = self._matching_ids(query)
+        if not many:
+            matched = matched[:1]
+        for _id in matched:
+            self.documents_by_id[_id] = self._apply_update(
+                self.documents_by_id[_id], update
+            )
+        counts["matched"] += len(matched)
+        counts["modified"] += len(matched)
+        if (len(matched) == 0) and upsert:
+            document = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            document = self._apply_update(document, update)
+            set_on_insert = (
+                update.get("$setOnInsert", {}) if isinstance(update, dict) else {}
+            )
+            for path, value in set_on_insert.items():
+                _set_path(document, path, copy.deepcopy(value))
+            self.documents_by_id[document["_id"]] = document
+            counts["upserted"] += 1
+        self.documents["written"] += max(len(matched), 1 if upsert else 0)
+
+    def _replace(self, query, replacement, upsert, counts: Counter):
+        matched = self._matching_ids(query)[:1]
+        replacement = copy.deepcopy(replacement)
+        if matched:
+            replacement.setdefault("_id", matched[0])
+            self.documents_by_id[matched[0]] = replacement
+            counts["matched"] += 1
+            counts["modified"] += 1
+        elif upsert:
+            replacement.setdefault("_id", query.get("_id"))
+            self.documents_by_id[replacement["_id"]] = replacement
+            counts["upserted"] += 1
+        self.documents["written"] += 1
+
+    def _insert(self, document, counts: Counter):
+        if document["_id"] in self.documents_by_id:
+            raise OperationFailure(f"E11000 duplicate key {document['_id']}", 11000)
+        self.documents_by_id[document["_id"]] = copy.deepcopy(document)
+        counts["inserted"] += 1
+        self.documents["written"] += 1
+
+    def _delete(self, query, many, counts: Counter):
+        matched = self._matching_ids(query)
+        if not many:
+            matched = matched[:1]
+        for _id in matched:
+            del self.documents_by_id[_id]
+        counts["deleted"] += len(matched)
+
+    def _write(self, operation: str, f, *args) -> InMemoryWriteResult:
+        self.operations[operation] += 1
+        counts = Counter()
+        with self.lock:
+            f(*args, counts)
+        return InMemoryWriteResult(counts)
+
+    def insert_one(self, document):
+        return self._write("insert_one", self._insert, document)
+
+    def insert_many(self, documents, ordered=True):
+        self.operations["insert_many"] += 1
+        counts = Counter()
+        with self.lock:
+            for document in documents:
+                self._insert(document, counts)
+        return InMemoryWriteResult(counts)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        return self._write("replace_one", self._replace, filter, replacement, upsert)
+
+    def update_one(self, filter, update, upsert=False):
+        return self._write("update_one", self._update, filter, update, upsert, False)
+
+    def update_many(self, filter, update, upsert=False):
+        return self._write("update_many", self._update, filter, update, upsert, True)
+
+    def delete_one(self, filter):
+        return self._write("delete_one", self._delete, filter, False)
+
+    def delete_many(self, filter):
+        return self._write("delete_many", self._delete, filter, True)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        requests = list(requests)
+        if len(requests) == 0:
+            # same as pymongo
+            raise OperationFailure("No operations to execute.")
+        self.operations["bulk_write"] += 1
+        self.operations["bulk_write_requests"] += len(requests)
+        counts = Counter()
+        with self.lock:
+            for request in requests:
+                if isinstance(request, ReplaceOne):
+                    self._replace(
+                        request._filter, request._doc, request._upsert, counts
+                    )
+                elif isinstance(request, UpdateOne):
+                    self._update(
+                        request._filter, request._doc, request._upsert, False, counts
+                    )
+                elif isinstance(request, InsertOne):
+                    self._insert(request._doc, counts)
+                elif isinstance(request, DeleteOne):
+                    self._delete(request._filter, False, counts)
+                elif isinstance(request, DeleteMany):
+                    self._delete(request._filter, True, counts)
+                else:
+                    raise NotImplementedError(
+                        f"InMemoryCollection doesn't support {type(request).__name__} in bulk_write."
+                    )
+        return InMemoryWriteResult(counts)
+
+    # admin
+    def create_index(self, keys, **kwargs):
+        self.operations["create_index"] += 1
+        return str(keys)
+
+    def index_information(self) -> dict:
+        return {"_id_": {"key": [("_id", 1)]}}
+
+    def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        """
+        Moves the documents into the collection `new_name` of the same
+        database, so existing handles on that collection see them.
+        """
+        self.operations["rename"] += 1
+        with self.lock:
+            if len(self.documents_by_id) == 0:
+                raise OperationFailure("source namespace does not exist", 26)
+            target = self.database[new_name]
+            with target.lock:
+                if (len(target.documents_by_id) > 0) and not dropTarget:
+                    raise OperationFailure("target namespace exists", 48)
+                target.documents_by_id = self.documents_by_id
+                self.documents_by_id = {}
+
+    def watch(self, *args, **kwargs):
+        # like a standalone server, so PaydayTrigger falls back to polling.
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets"
+        )
+
+    def drop(self):
+        self.operations["drop"] += 1
+        with self.lock:
+            self.documents_by_id = {}
+
+
+class InMemoryDatabase(dict):
+    """
+    Collections by name, created on first use (like a pymongo Database).
+    """
+
+    def __missing__(self, name: str) -> InMemoryCollection:
+        self[name] = InMemoryCollection(name, self)
+        return self[name]
+
+
+class InMemoryMongoDB:
+    """
+    Stand-in for ccdexplorer_fundamentals' MongoDB, with in-memory collections
+    for mainnet and testnet.
+    """
+
+    def __init__(self):
+        self.mainnet_db = InMemoryDatabase()
+        self.testnet_db = InMemoryDatabase()
+        self.mainnet: Dict[Collections, InMemoryCollection] = {
+            x: self.mainnet_db[x.value] for x in Collections
+        }
+        self.testnet: Dict[Collections, InMemoryCollection] = {
+            x: self.testnet_db[x.value] for x in Collections
+        }
+
+    def collections(self) -> list[InMemoryCollection]:
+        return list(self.mainnet_db.values()) + list(self.testnet_db.values())
+
+    def operations(self) -> Counter:
+        """
+        Operations over all collections, keyed by `collection.operation`.
+        """
+        result = Counter()
+        for collection in self.collections():
+            for operation, count in collection.operations.items():
+                result[f"{collection.name}.{operation}"] += count
+        return result
+
+    def documents(self) -> Counter:
+        result = Counter()
+        for collection in self.collections():
+            result.update(collection.documents)
+        return result
@@ -0,0 +1,461 @@
+import contextvars
+import datetime as dt
+import os
+import threading
+import time
+from typing import Dict, Optional
+import bson
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.collection import Collection
+from rich.console import Console
+
+console = Console()
+from env import *
+
+RUN_REPORT_HELPER_ID = "payday_run_report"
+
+# the step a call is made in. Steps can run in parallel (see step_graph.py),
+# threads started within a step (fan_out, BulkWriter) get a copy of it.
+current_step: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "payday_step", default="setup"
+)
+
+
+def empty_grpc_metrics() -> dict:
+    return {"calls": 0, "errors": 0, "seconds": 0.0}
+
+
+def empty_mongo_metrics() -> dict:
+    return {
+        "calls": 0,
+        "seconds": 0.0,
+        "documents_read": 0,
+        "documents_written": 0,
+        "bytes_written": 0,
+    }
+
+
+def bytes_for_write(document) -> int:
+    """
+    BSON size of a replacement or update document (an update pipeline is
+    a list, so it's wrapped first).
+    """
+    if isinstance(document, list):
+        document = {"pipeline": document}
+    return len(bson.encode(document))
+
+
+def bytes_for_request(request) -> int:
+    """
+    BSON size of the document a bulk write request (InsertOne, ReplaceOne,
+    UpdateOne/UpdateMany) sends. pymongo keeps it in `_doc`; deletes send no
+    document.
+    """
+    document = getattr(request, "_doc", None)
+    return bytes_for_write(document) if document is not None else 0
+
+
+class PaydayMetrics:
+    """
+    Durations and counts for a single payday run, per step: the step itself,
+    every gRPC call (per method) and every Mongo call (per collection and
+    operation). Calls made outside of a step are counted under `setup`.
+    Thread safe, steps can run in parallel and gRPC calls come in from the
+    fan_out workers.
+    """
+
+    def __init__(self, payday_date_string: str, payday_block_hash: str):
+        self.payday_date_string = payday_date_string
+        self.payday_block_hash = payday_block_hash
+        self.started = dt.datetime.now(dt.timezone.utc)
+        self.finished: Optional[dt.datetime] = None
+        self.steps: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+        # setup runs until the first step starts.
+        self.step_started: Dict[str, float] = {"setup": time.perf_counter()}
+        current_step.set("setup")
+
+    def metrics_for_step(self, step_name: str) -> dict:
+        if step_name not in self.steps:
+            self.steps[step_name] = {"seconds": 0.0, "grpc": {}, "mongo": {}}
+        return self.steps[step_name]
+
+    def start_step(self, step_name: str):
+        """
+        Start timing `step_name`, calls made from this thread (and the threads
+        it starts) count for that step from now on.
+        """
+        self.stop_step("setup")
+        current_step.set(step_name)
+        with self.lock:
+            self.step_started[step_name] = time.perf_counter()
+
+    def stop_step(self, step_name: str):
+        with self.lock:
+            started = self.step_started.pop(step_name, None)
+            if started is not None:
+                self.metrics_for_step(step_name)["seconds"] += (
+                    time.perf_counter() - started
+                )
+
+    def finish(self):
+        self.stop_step("setup")
+        current_step.set("report")
+        self.finished = dt.datetime.now(dt.timezone.utc)
+
+    def record_grpc(self, method: str, seconds: float, error: bool = False):
+        with self.lock:
+            grpc = self.metrics_for_step(current_step.get())["grpc"]
+            m = grpc.setdefault(method, empty_grpc_metrics())
+            m["calls"] += 1
+            m["errors"] += 1 if error else 0
+            m["seconds"] += seconds
+
+    def record_mongo(
+        self,
+        collection: str,
+        operation: str,
+        seconds: float,
+        calls: int = 1,
+        documents_read: int = 0,
+        documents_written: int = 0,
+        bytes_written: int = 0,
+    ):
+        with self.lock:
+            mongo = self.metrics_for_step(current_step.get())["mongo"]
+            m = mongo.setdefault(collection, {}).setdefault(
+                operation, empty_mongo_metrics()
+            )
+            m["calls"] += calls
+            m["seconds"] += seconds
+            m["documents_read"] += documents_read
+            m["documents_written"] += documents_written
+            m["bytes_written"] += bytes_written
+
+    def run_report(self) -> dict:
+        """
+        The run report as stored in `helpers`.
+        """
+        finished = self.finished or dt.datetime.now(dt.timezone.utc)
+        return {
+            "_id": RUN_REPORT_HELPER_ID,
+            "date": self.payday_date_string,
+            "payday_block_hash": self.payday_block_hash,
+            "started": self.started,
+            "finished": finished,
+            "seconds": (finished - self.started).total_seconds(),
+            "steps": self.steps,
+        }
+
+    def prometheus_text(self) -> str:
+        """
+        The run in the Prometheus text exposition format, for the
+        node_exporter textfile collector.
+        """
+        date = self.payday_date_string
+        lines = []
+
+        def metric(name: str, help: str, samples: list[tuple[dict, float]]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                labels = ",".join(
+                    f'{k}="{v}"' for k, v in {"date": date, **labels}.items()
+                )
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        report = self.run_report()
+        metric(
+            "payday_run_seconds",
+            "Duration of the payday run.",
+            [({}, report["seconds"])],
+        )
+        metric(
+            "payday_run_finished_timestamp_seconds",
+            "When the payday run finished.",
+            [({}, report["finished"].timestamp())],
+        )
+        metric(
+            "payday_step_seconds",
+            "Duration per step.",
+            [({"step": k}, v["seconds"]) for k, v in self.steps.items()],
+        )
+        for field, help in [
+            ("calls", "gRPC calls per step and method."),
+            ("errors", "Failed (and retried) gRPC calls per step and method."),
+            ("seconds", "Time spent in gRPC calls per step and method."),
+        ]:
+            metric(
+                f"payday_grpc_{field}",
+                help,
+                [
+                    ({"step": step_name, "method": method}, m[field])
+                    for step_name, step in self.steps.items()
+                    for method, m in step["grpc"].items()
+                ],
+            )
+        for field, help in [
+            ("calls", "Mongo calls per step, collection and operation."),
+            ("seconds", "Time spent in Mongo calls."),
+            ("documents_read", "Documents read."),
+            ("documents_written", "Documents written (write requests)."),
+            ("bytes_written", "BSON bytes of the documents sent in writes."),
+        ]:
+            metric(
+                f"payday_mongo_{field}",
+                help,
+                [
+                    (
+                        {
+                            "step": step_name,
+                            "collection": collection,
+                            "operation": operation,
+                        },
+                        m[field],
+                    )
+                    for step_name, step in self.steps.items()
+                    for collection, operations in step["mongo"].items()
+                    for operation, m in operations.items()
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self):
+        console.log(
+            " | ".join(f"{k}: {v['seconds']:,.1f}s" for k, v in self.steps.items())
+        )
+
+    def export(self, db: Dict[Collections, Collection]):
+        """
+        Store the run report in `helpers` and, if PAYDAY_METRICS_FILE is set,
+        write the Prometheus text to that file.
+        """
+        self.finish()
+        report = self.run_report()
+        self.log_summary()
+        try:
+            db[Collections.helpers].replace_one(
+                {"_id": RUN_REPORT_HELPER_ID}, report, upsert=True
+            )
+        except Exception as e:
+            console.log(f"Can't store run report ({e}).")
+
+        if PAYDAY_METRICS_FILE:
+            # write to a temp file first, the collector may read at any time.
+            with open(f"{PAYDAY_METRICS_FILE}.tmp", "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(f"{PAYDAY_METRICS_FILE}.tmp", PAYDAY_METRICS_FILE)
+
+
+class InstrumentedGRPCClient:
+    """
+    Wraps a GRPCClient, every call is timed and counted in `metrics`.
+    """
+
+    def __init__(self, client, metrics: PaydayMetrics):
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, name: str):
+        f = getattr(self.client, name)
+        if not callable(f):
+            return f
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = f(*args, **kwargs)
+            except Exception:
+                self.metrics.record_grpc(name, time.perf_counter() - start, error=True)
+                raise
+            self.metrics.record_grpc(name, time.perf_counter() - start)
+            return result
+
+        instrumented.__name__ = name
+        return instrumented
+
+
+class InstrumentedCursor:
+    """
+    Wraps a Cursor from `find`, the documents are counted (and timed) as they
+    are iterated and recorded once the cursor is exhausted or closed. Cursor
+    methods that return the cursor (sort, limit, ...) return the wrapper.
+    """
+
+    def __init__(self, cursor, collection: "InstrumentedCollection"):
+        self.cursor = cursor
+        self.iterator = None
+        self.collection = collection
+        self.documents_read = 0
+        self.seconds = 0.0
+        self.recorded = False
+
+    def __getattr__(self, name: str):
+        f = getattr(self.cursor, name)
+        if not callable(f):
+            return f
+
+        def chained(*args, **kwargs):
+            result = f(*args, **kwargs)
+            return self if result is self.cursor else result
+
+        return chained
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.iterator is None:
+            self.iterator = iter(self.cursor)
+        start = time.perf_counter()
+        try:
+            document = next(self.iterator)
+        except StopIteration:
+            self.seconds += time.perf_counter() - start
+            self.record()
+            raise
+        self.seconds += time.perf_counter() - start
+        self.documents_read += 1
+        return document
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.record()
+
+    def record(self):
+        if self.recorded:
+            return
+        self.recorded = True
+        self.collection.metrics.record_mongo(
+            self.collection.collection.name,
+            "find",
+            self.seconds,
+            calls=0,
+            documents_read=self.documents_read,
+        )
+
+    def close(self):
+        self.record()
+        if hasattr(self.cursor, "close"):
+            self.cursor.close()
+
+
+class InstrumentedCollection:
+    """
+    Wraps a pymongo Collection, every call is timed and counted in `metrics`,
+    with the number of documents read or written and the BSON size of writes.
+    Documents from `find` are counted (and timed) as they are iterated, see
+    InstrumentedCursor.
+    """
+
+    def __init__(self, collection: Collection, metrics: PaydayMetrics):
+        self.collection = collection
+        self.metrics = metrics
+
+    def __getattr__(self, name: str):
+        f = getattr(self.collection, name)
+        if not callable(f):
+            return f
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            result = f(*args, **kwargs)
+            self.record(name, start)
+            return result
+
+        return instrumented
+
+    def record(self, operation: str, start: float, **kwargs):
+        self.metrics.record_mongo(
+            self.collection.name, operation, time.perf_counter() - start, **kwargs
+        )
+
+    def find(self, *args, **kwargs):
+        start = time.perf_counter()
+        cursor = self.collection.find(*args, **kwargs)
+        self.record("find", start)
+        return InstrumentedCursor(cursor, self)
+
+    def find_one(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.collection.find_one(*args, **kwargs)
+        self.record("find_one", start, documents_read=1 if result else 0)
+        return result
+
+    def bulk_write(self, requests, *args, **kwargs):
+        # measured here, so for a BulkWriter on its writer thread and not in
+        # the step that builds the documents.
+        requests = list(requests)
+        bytes_written = sum(bytes_for_request(x) for x in requests)
+        start = time.perf_counter()
+        result = self.collection.bulk_write(requests, *args, **kwargs)
+        self.record(
+            "bulk_write",
+            start,
+            documents_written=len(requests),
+            bytes_written=bytes_written,
+        )
+        return result
+
+    def insert_many(self, documents, *args, **kwargs):
+        documents = list(documents)
+        bytes_written = sum(bytes_for_write(x) for x in documents)
+        start = time.perf_counter()
+        result = self.collection.insert_many(documents, *args, **kwargs)
+        self.record(
+            "insert_many",
+            start,
+            documents_written=len(documents),
+            bytes_written=bytes_written,
+        )
+        return result
+
+    def replace_one(self, filter, replacement, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.collection.replace_one(filter, replacement, *args, **kwargs)
+        self.record(
+            "replace_one",
+            start,
+            documents_written=1,
+            bytes_written=bytes_for_write(replacement),
+        )
+        return result
+
+    def update_one(self, filter, update, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.collection.update_one(filter, update, *args, **kwargs)
+        self.record(
+            "update_one",
+            start,
+            documents_written=1,
+            bytes_written=bytes_for_write(update),
+        )
+        return result
+
+    def update_many(self, filter, update, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.collection.update_many(filter, update, *args, **kwargs)
+        self.record(
+            "update_many",
+            start,
+            documents_written=result.modified_count,
+            bytes_written=bytes_for_write(update),
+        )
+        return result
+
+    def delete_many(self, filter, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.collection.delete_many(filter, *args, **kwargs)
+        self.record("delete_many", start, documents_written=result.deleted_count)
+        return result
+
+
+def instrument_db(
+    db: Dict[Collections, Collection], metrics: PaydayMetrics
+) -> Dict[Collections, InstrumentedCollection]:
+    return {k: InstrumentedCollection(v, metrics) for k, v in db.items()}
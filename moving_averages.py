@@ -0,0 +1,121 @@
+import numpy as np
+from typing import Optional
+
+
+def apy_and_reward_for_day(account_id: str, day: dict) -> tuple[float, float]:
+    """
+    The (apy, reward) pair from an entry in `daily_apy_dict` that counts towards
+    the moving averages. For passive delegation this is the passive figure, for
+    bakers the delegator figure and for accounts the entry itself.
+    """
+    if account_id == "passive_delegation":
+        day = day["passive"]
+    elif account_id.isnumeric():
+        day = day["delegator"]
+    return day["apy"], day["reward"]
+
+
+def day_values(
+    account_ids: list[str], days: list[Optional[dict]]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Gather one (optional) `daily_apy_dict` entry per account into arrays of
+    apy, reward and whether the account has an entry for that day at all.
+    """
+    apys = np.zeros(len(account_ids), dtype=np.float64)
+    rewards = np.zeros(len(account_ids), dtype=np.float64)
+    present = np.zeros(len(account_ids), dtype=bool)
+    for i, (account_id, day) in enumerate(zip(account_ids, days)):
+        if day is not None:
+            apys[i], rewards[i] = apy_and_reward_for_day(account_id, day)
+            present[i] = True
+    return apys, rewards, present
+
+
+def window_sums_from_states(states: list[dict]) -> dict[str, np.ndarray]:
+    """
+    The running sums as stored in `moving_average_state`, as arrays.
+    """
+    return {
+        "sum_ln": np.array([x["sum_ln"] for x in states], dtype=np.float64),
+        "sum_reward": np.array([x["sum_reward"] for x in states], dtype=np.float64),
+        "count": np.array([x["count"] for x in states], dtype=np.int64),
+    }
+
+
+def window_sums_from_history(
+    account_ids: list[str], daily_apy_dicts: list[dict], term_dates: list[str]
+) -> dict[str, np.ndarray]:
+    """
+    Full recompute of the running sums for a window, from the complete
+    `daily_apy_dict` of every account.
+    """
+    segments = []
+    apys = []
+    rewards = []
+    for i, (account_id, daily_apy_dict) in enumerate(zip(account_ids, daily_apy_dicts)):
+        for date in term_dates:
+            day = daily_apy_dict.get(date)
+            if day is not None:
+                apy, reward = apy_and_reward_for_day(account_id, day)
+                segments.append(i)
+                apys.append(apy)
+                rewards.append(reward)
+
+    segments = np.array(segments, dtype=np.int64)
+    apys = np.array(apys, dtype=np.float64)
+    rewards = np.array(rewards, dtype=np.float64)
+    return {
+        "sum_ln": np.bincount(
+            segments, weights=np.log(1 + apys), minlength=len(account_ids)
+        ),
+        "sum_reward": np.bincount(
+            segments, weights=rewards, minlength=len(account_ids)
+        ),
+        "count": np.bincount(segments, minlength=len(account_ids)).astype(np.int64),
+    }
+
+
+def slide_window_sums(
+    sums: dict[str, np.ndarray],
+    entering: tuple[np.ndarray, np.ndarray, np.ndarray],
+    leaving: tuple[np.ndarray, np.ndarray, np.ndarray],
+) -> dict[str, np.ndarray]:
+    """
+    Move the windows one payday ahead: add the newest day (for accounts that
+    have an entry for it) and subtract the day that drops out of the window.
+    """
+    entering_apys, entering_rewards, entering_present = entering
+    leaving_apys, leaving_rewards, leaving_present = leaving
+    return {
+        "sum_ln": (
+            sums["sum_ln"]
+            + np.where(entering_present, np.log(1 + entering_apys), 0.0)
+            - np.where(leaving_present, np.log(1 + leaving_apys), 0.0)
+        ),
+        "sum_reward": (
+            sums["sum_reward"]
+            + np.where(entering_present, entering_rewards, 0.0)
+            - np.where(leaving_present, leaving_rewards, 0.0)
+        ),
+        "count": (
+            sums["count"]
+            + entering_present.astype(np.int64)
+            - leaving_present.astype(np.int64)
+        ),
+    }
+
+
+def moving_averages_from_sums(
+    sums: dict[str, np.ndarray], period: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Which windows have more than 90% of their days covered, and for those the
+    geometric mean APY (exp of the average log(1+apy), minus 1).
+    """
+    enough_days = sums["count"] > 0.90 * period
+    apys = np.zeros(len(sums["count"]), dtype=np.float64)
+    apys[enough_days] = (
+        np.exp(sums["sum_ln"][enough_days] / sums["count"][enough_days]) - 1
+    )
+    return enough_days, apys
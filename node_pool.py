@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from rich.console import Console
+
+console = Console()
+from env import *
+
+# latencies kept per endpoint and method.
+LATENCY_WINDOW = 256
+# below this many samples the percentile means little, hedge after
+# HEDGE_INITIAL_DELAY instead.
+HEDGE_MIN_SAMPLES = 20
+HEDGE_INITIAL_DELAY = 1.0
+
+
+def parse_endpoint(uri: str) -> tuple[str, int]:
+    """
+    host and port from "host:port" (a scheme is ignored, the port defaults
+    to 20000).
+    """
+    address = uri.split("://")[-1].strip("/")
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address, 20000
+
+
+def configured_endpoints() -> list[str]:
+    """
+    The extra nodes, from PAYDAY_GRPC_ENDPOINTS (comma separated) and
+    FALLBACK_URI.
+    """
+    endpoints = [x.strip() for x in PAYDAY_GRPC_ENDPOINTS.split(",")]
+    endpoints.append(FALLBACK_URI or "")
+    return list(dict.fromkeys(x for x in endpoints if x))
+
+
+def endpoint_client(uri: str) -> GRPCClient:
+    """
+    A GRPCClient connected (for mainnet) to `uri` only.
+    """
+    host, port = parse_endpoint(uri)
+    client = GRPCClient()
+    client.hosts[NET.MAINNET] = [{"host": host, "port": port}]
+    client.host_index[NET.MAINNET] = 0
+    client.connect()
+    return client
+
+
+class Endpoint:
+    """
+    A node with its recent latencies per method, the number of calls in
+    flight and the number of failures in a row (errors, and calls that were
+    too slow and hedged away).
+    """
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.latencies: Dict[str, deque] = {}
+        self.in_flight = 0
+        self.failures = 0
+        self.calls = 0
+        self.hedges_won = 0
+
+    def percentile(self, method: str, q: float) -> Optional[float]:
+        samples = sorted(self.latencies.get(method, []))
+        if len(samples) == 0:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def hedge_delay(self, method: str) -> float:
+        """
+        How long to wait for a call before sending it to another node as well:
+        the PAYDAY_GRPC_HEDGE_PERCENTILE latency of this method on this node.
+        """
+        if len(self.latencies.get(method, [])) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        return max(
+            PAYDAY_GRPC_HEDGE_MIN_DELAY,
+            self.percentile(method, PAYDAY_GRPC_HEDGE_PERCENTILE),
+        )
+
+    def cost(self, method: str) -> float:
+        # a node that hasn't answered this method yet counts as slow (not as
+        # free), and every call still in flight there (a hanging one too)
+        # makes it more expensive.
+        median = self.percentile(method, 50)
+        return (self.in_flight + 1) * (
+            median if median is not None else HEDGE_INITIAL_DELAY
+        )
+
+
+class NodePool:
+    """
+    Wraps the GRPCClient of the primary node and the clients of the extra
+    nodes. Every query goes to the node with the lowest expected latency
+    (median latency of the method times the calls in flight there); if it
+    hasn't answered within that node's p95 for the method, the same query is
+    also sent to the next best node and the first answer wins, the slow node
+    counts a failure. A failed query is sent on to the next node straight
+    away. Nodes with failures are ranked after the others.
+    The queries run on a bounded thread pool. The losing query isn't
+    cancelled (the client is synchronous), it runs out and still counts for
+    the latencies.
+    """
+
+    def __init__(
+        self, endpoints: list[Endpoint], max_workers: int = 2 * PAYDAY_GRPC_CONCURRENCY
+    ):
+        self.endpoints = endpoints
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="grpc_node_pool"
+        )
+
+    def ranked(self, method: str) -> list[Endpoint]:
+        with self.lock:
+            return sorted(
+                self.endpoints, key=lambda x: (x.failures > 0, x.cost(method))
+            )
+
+    def submit(self, endpoint: Endpoint, method: str, args, kwargs) -> Future:
+        with self.lock:
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+        # set when the call is hedged away, its late answer doesn't clear
+        # the failure that counted.
+        hedged_away = threading.Event()
+
+        def run():
+            start = time.perf_counter()
+            try:
+                result = getattr(endpoint.client, method)(*args, **kwargs)
+            except Exception:
+                with self.lock:
+                    endpoint.in_flight -= 1
+                    endpoint.failures += 1
+                raise
+            with self.lock:
+                endpoint.in_flight -= 1
+                if not hedged_away.is_set():
+                    endpoint.failures = 0
+                endpoint.latencies.setdefault(
+                    method, deque(maxlen=LATENCY_WINDOW)
+                ).append(time.perf_counter() - start)
+            return result
+
+        future = self.executor.submit(run)
+        future.hedged_away = hedged_away
+        return future
+
+    def call(self, method: str, *args, **kwargs):
+        candidates = self.ranked(method)
+        first = candidates.pop(0)
+        running: Dict[Future, Endpoint] = {
+            self.submit(first, method, args, kwargs): first
+        }
+        hedged = False
+        error = None
+        while True:
+            timeout = None
+            if (not hedged) and (len(candidates) > 0):
+                timeout = first.hedge_delay(method)
+            done, _ = wait(running.keys(), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = running.pop(future)
+                if future.exception() is None:
+                    if endpoint is not first:
+                        with self.lock:
+                            endpoint.hedges_won += 1
+                    return future.result()
+                error = future.exception()
+
+            if len(candidates) == 0:
+                if len(running) == 0:
+                    raise error
+            elif len(done) == 0:
+                # too slow, ask the next node as well.
+                hedged = True
+                with self.lock:
+                    self.hedges += 1
+                    first.failures += 1
+                for future in running:
+                    future.hedged_away.set()
+                endpoint = candidates.pop(0)
+                running[self.submit(endpoint, method, args, kwargs)] = endpoint
+            elif len(running) == 0:
+                # failed, on to the next node.
+                endpoint = candidates.pop(0)
+                running[self.submit(endpoint, method, args, kwargs)] = endpoint
+
+    def __getattr__(self, name: str):
+        f = getattr(self.endpoints[0].client, name)
+        if (not callable(f)) or (not name.startswith("get_")):
+            return f
+
+        def pooled(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+
+        pooled.__name__ = name
+        return pooled
+
+    def log_summary(self):
+        for x in self.endpoints:
+            console.log(
+                f"gRPC node {x.name}: {x.calls:,} calls, {x.hedges_won:,} hedges won."
+            )
+        console.log(f"gRPC node pool: {self.hedges:,} hedged calls.")
+
+
+# one pool per primary client in this process.
+node_pools: Dict[int, NodePool] = {}
+# the benchmark and backfill (--no-node-pool) turn it off.
+pooling_enabled = PAYDAY_GRPC_NODE_POOL
+
+
+def node_pool_for(grpcclient: GRPCClient):
+    """
+    The NodePool around `grpcclient` and the configured extra nodes, or
+    `grpcclient` itself if there are none, pooling is off or it isn't a real
+    GRPCClient (a benchmark client, or None for steps that don't use gRPC).
+    """
+    endpoints = configured_endpoints()
+    if (
+        (not pooling_enabled)
+        or (len(endpoints) == 0)
+        or (not isinstance(grpcclient, GRPCClient))
+    ):
+        return grpcclient
+    if id(grpcclient) not in node_pools:
+        node_pools[id(grpcclient)] = NodePool(
+            [Endpoint("primary", grpcclient)]
+            + [Endpoint(x, endpoint_client(x)) for x in endpoints]
+        )
+    return node_pools[id(grpcclient)]
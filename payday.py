@@ -0,0 +1,1236 @@
+from ccdexplorer_fundamentals.tooter import Tooter, TooterType, TooterChannel
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.mongodb import (
+    MongoDB,
+    Collections,
+)
+from pymongo.collection import Collection
+from pymongo import ReplaceOne, UpdateOne
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import (
+    CCD_PoolInfo,
+    CCD_BlockHash,
+    CCD_BakerId,
+    CCD_AccountAddress,
+    CCD_BlockSpecialEvent_PaydayAccountReward,
+    CCD_BlockSpecialEvent_PaydayPoolReward,
+)
+import datetime as dt
+import dateutil.parser
+import numpy as np
+from typing import Dict, Optional
+from rich.console import Console
+from grpc_fanout import call_with_retry, fan_out
+from step_graph import run_step_graph, track
+from checkpoint import NOT_CHECKPOINTED, PaydayCheckpoint
+from metrics import (
+    InstrumentedCollection,
+    InstrumentedGRPCClient,
+    PaydayMetrics,
+    instrument_db,
+)
+from payday_delegators import (
+    delegation_summary,
+    delegator_headers_collection,
+    delegators_collection,
+    store_delegators_for_payday,
+)
+from serialization import SerializationCache
+from impacted_addresses import impacted_address_for_account_reward
+from bulk_writer import BulkWriter
+from grpc_cache import CachingGRPCClient, response_cache
+from node_pool import node_pool_for, node_pools
+from block_info import BlockInfoResolver, block_info_collection
+from current_payday import staging_collection, swap_current_payday
+from delegator_table import DelegatorTable
+from apy import annualized_apy, pool_rewards_and_apys
+from moving_averages import (
+    day_values,
+    moving_averages_from_sums,
+    slide_window_sums,
+    window_sums_from_history,
+    window_sums_from_states,
+)
+
+console = Console()
+from env import *
+
+
+class NullTooter:
+    """
+    Tooter that doesn't send anything, for benchmark and backfill runs.
+    """
+
+    def send(self, *args, **kwargs):
+        pass
+
+
+def ensure_indexes(db: Dict[Collections, Collection]):
+    """
+    Indexes (and fields) the payday lookups rely on. Safe to call on every
+    startup.
+    """
+    db[Collections.paydays].create_index("date")
+    db[Collections.paydays].create_index("height_for_last_block")
+    db[Collections.paydays_apy_intermediate].create_index("last_payday_date")
+    # the moving averages only look at recent `last_payday_date`s.
+    if db[Collections.paydays_apy_intermediate].find_one(
+        {"last_payday_date": {"$exists": False}}, projection={"_id": 1}
+    ):
+        set_missing_last_payday_dates(db)
+
+
+def set_missing_last_payday_dates(db: Dict[Collections, Collection]):
+    """
+    Documents written before `last_payday_date` existed get it set to the
+    last date in their `daily_apy_dict`, computed server side.
+    """
+    db[Collections.paydays_apy_intermediate].update_many(
+        {"last_payday_date": {"$exists": False}},
+        [
+            {
+                "$set": {
+                    "last_payday_date": {
+                        "$max": {
+                            "$map": {
+                                "input": {"$objectToArray": "$daily_apy_dict"},
+                                "as": "day",
+                                "in": "$$day.k",
+                            }
+                        }
+                    }
+                }
+            }
+        ],
+    )
+
+
+# what every step needs from the steps before it. Steps 2 and 3 only need
+# step 1, the impacted addresses and the daily APY of accounts (step 4) and
+# bakers (step 5, other `_id`s) only the rewards from step 3.
+STEP_DEPENDENCIES = {
+    "step_1": [],
+    "step_2": ["step_1"],
+    "step_3": ["step_1"],
+    "step_3_5": ["step_3"],
+    "step_4": ["step_3"],
+    "step_5": ["step_3"],
+    "step_6": ["step_4", "step_5"],
+}
+
+
+class Payday:
+    """
+    Class Payday is the class that calculates and stores all payday related information.
+    It should be called with the date_string (ex. "2022-12-30") and blockHeight of the
+    block that contains the rewards.
+
+    Process:
+    1. Create PaydayInformation entry and store in collection_paydays
+    2. From PaydayInformation, property `bakerAccountIds` (or `bakersWithDelegators`), get list of
+    all bakers that have participated in this payday. Call `process_payday_performance_for_baker`,
+    which stores an entry for every baker in collection_paydays_performance.
+    3. Loop through all RewardEvents and call `process_payday_rewards_for_account_or_baker`,
+    which stores an entry for every reward in collection_paydays_rewards.
+    4. Call `fill_apy_intermediate_for_accounts_for_date` to calculate daily APY figures
+    for all accounts that need calculation (this includes all delegators and all baker accounts).
+    5. Call `fill_apy_intermediate_for_bakers_for_date` to calculate daily APY figures
+    for all bakers that have participated in this payday).
+    6. From intermediate results, calculate the averages through ...
+    """
+
+    def __init__(
+        self,
+        payday_date_string: str,
+        payday_block_hash: CCD_BlockHash,
+        grpcclient: GRPCClient,
+        mongodb: MongoDB,
+        tooter: Tooter,
+        TESTNET: bool = False,
+        backfill: bool = False,
+        step_names: Optional[list[str]] = None,
+    ):
+        self.payday_date_string = payday_date_string
+        self.payday_block_hash = payday_block_hash
+        self.attach(grpcclient, mongodb, tooter, TESTNET, backfill)
+
+        self.resolve_blocks()
+
+        console.log(self.payday_date_string)
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStart.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 0, can't toot.")
+        start_time = dt.datetime.now()
+        self.run_pipeline(step_names)
+        # done
+        console.log(
+            f"{self.payday_date_string} | {(dt.datetime.now() - start_time).total_seconds():,.0f} sec"
+        )
+
+    def resolve_blocks(self):
+        """
+        The payday block, its special events and the first and last block of
+        the payday (the previous payday must be in `paydays` by now).
+        """
+        # current payday information
+        self.payday_block_info = self.grpcclient.get_block_info(self.payday_block_hash)
+
+        self.special_events_with_rewards = self.grpcclient.get_block_special_events(
+            self.payday_block_info.hash
+        )
+
+        # current payday information first block
+        self.previous_payday = self.get_previous_payday_information_entry(
+            self.payday_date_string
+        )
+        self.height_first = (
+            self.previous_payday["height_for_last_block"] + 1
+            if self.previous_payday
+            else 3_232_445
+        )
+
+        # current payday information last block
+        self.height_for_pool_status = self.payday_block_info.height - 1
+
+        # duration is measured from the slot_time of the last block from
+        # previous Reward period until slot_time from the last block in this
+        # Reward period. That block is the last block of the previous payday,
+        # its hash is in the previous paydays entry (and its block info
+        # usually already in paydays_block_info).
+        _height_start_duration = (
+            self.previous_payday["height_for_last_block"]
+            if self.previous_payday
+            else 3_232_444
+        )
+        known_hashes = {}
+        if self.previous_payday and ("hash_for_last_block" in self.previous_payday):
+            known_hashes[_height_start_duration] = self.previous_payday[
+                "hash_for_last_block"
+            ]
+
+        block_info_by_height = BlockInfoResolver(
+            self.grpcclient,
+            InstrumentedCollection(
+                block_info_collection(self.mongodb, self.TESTNET), self.metrics
+            ),
+        ).resolve(
+            [self.height_first, self.height_for_pool_status, _height_start_duration],
+            known_hashes,
+        )
+        self.payday_block_info_first_block = block_info_by_height[self.height_first]
+        self.payday_block_info_last_block = block_info_by_height[
+            self.height_for_pool_status
+        ]
+        block_start_duration = block_info_by_height[_height_start_duration]
+        self.payday_duration = (
+            self.payday_block_info_last_block.slot_time - block_start_duration.slot_time
+        ).total_seconds()
+
+        self.seconds_per_year = 3_153_6000
+
+    def attach(
+        self,
+        grpcclient: GRPCClient,
+        mongodb: MongoDB,
+        tooter: Tooter,
+        TESTNET: bool = False,
+        backfill: bool = False,
+    ):
+        """
+        Set the clients (which are never pickled with the state). With
+        `backfill`, the payday is a historical one: no checkpoints and no
+        refresh of paydays_current_payday, as that belongs to the live payday.
+        """
+        self.mongodb = mongodb
+        self.TESTNET = TESTNET
+        self.backfill = backfill
+        # every gRPC and Mongo call is timed and counted per step, see metrics.py
+        self.metrics = PaydayMetrics(self.payday_date_string, self.payday_block_hash)
+        self.db: Dict[Collections, Collection] = instrument_db(
+            self.mongodb.mainnet if not self.TESTNET else self.mongodb.testnet,
+            self.metrics,
+        )
+        self.delegators = InstrumentedCollection(
+            delegators_collection(self.mongodb, self.TESTNET), self.metrics
+        )
+        self.delegator_headers = InstrumentedCollection(
+            delegator_headers_collection(self.mongodb, self.TESTNET), self.metrics
+        )
+        self.current_payday_staging = InstrumentedCollection(
+            staging_collection(self.mongodb, self.TESTNET), self.metrics
+        )
+        # the response cache sits in front, so the metrics count node calls only.
+        # All gRPC calls are made in Step 1 (and the block lookups before it),
+        # spread over the configured nodes, see node_pool.py.
+        self.grpcclient = CachingGRPCClient(
+            InstrumentedGRPCClient(node_pool_for(grpcclient), self.metrics),
+            response_cache,
+        )
+        self.tooter = tooter
+        # keyed on object id, so never checkpointed
+        self.serialization_cache = SerializationCache()
+
+    @classmethod
+    def from_state(
+        cls,
+        state: dict,
+        grpcclient: GRPCClient,
+        mongodb: MongoDB,
+        tooter: Tooter,
+        TESTNET: bool = False,
+        backfill: bool = False,
+    ):
+        """
+        A Payday from the state of an earlier run (see `state`), without
+        the block lookups, to run the remaining steps with `run_pipeline`.
+        """
+        payday = cls.__new__(cls)
+        payday.__dict__.update(state)
+        payday.attach(grpcclient, mongodb, tooter, TESTNET, backfill)
+        return payday
+
+    def state(self, keys: Optional[list[str]] = None) -> dict:
+        """
+        The picklable state of this payday (optionally only `keys`).
+        """
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if (k not in NOT_CHECKPOINTED) and ((keys is None) or (k in keys))
+        }
+
+    def pipeline_steps(self) -> list[tuple[str, list]]:
+        """
+        The steps of the payday, in order. Every step is idempotent, so it
+        can safely be run again after a crash halfway.
+        """
+        return [
+            # step 1
+            (
+                "step_1",
+                [
+                    self.create_and_save_payday_information_entry,
+                    self.get_accounts_and_bakers_for_APY_calc,
+                ],
+            ),
+            # # step 2
+            ("step_2", [self.process_payday_performance_for_bakers]),
+            # # step 3
+            ("step_3", [self.process_payday_rewards_for_account_or_baker]),
+            # # step 3.5
+            (
+                "step_3_5",
+                [lambda: self.add_reward_to_impacted_accounts(self.account_rewards)],
+            ),
+            # # step 4
+            ("step_4", [self.fill_apy_intermediate_for_accounts_for_date]),
+            # # step 5
+            ("step_5", [self.fill_apy_intermediate_for_bakers_for_date]),
+            # # step 6
+            ("step_6", [self.calc_moving_averages]),
+        ]
+
+    def run_pipeline(self, step_names: Optional[list[str]] = None):
+        """
+        Run all steps (or only `step_names`), each step as soon as the steps it
+        depends on (STEP_DEPENDENCIES) are done, up to PAYDAY_STEP_CONCURRENCY
+        at the same time. Completed steps (and the state they produced) are
+        recorded in a checkpoint whenever no step is running, so the state is
+        consistent. A restart of the same payday resumes after those steps.
+        A backfill isn't checkpointed, the backfill itself is simply restarted.
+        """
+        checkpoint = PaydayCheckpoint(
+            self.db, self.payday_date_string, self.payday_block_hash
+        )
+        completed_steps = checkpoint.restore(self) if not self.backfill else []
+
+        def run_step(step_name: str, methods: list):
+            def run():
+                self.metrics.start_step(step_name)
+                try:
+                    for method in methods:
+                        method()
+                finally:
+                    self.metrics.stop_step(step_name)
+
+            return run
+
+        def on_completed(step_name: str, idle: bool):
+            completed_steps.append(step_name)
+            if idle and not self.backfill:
+                checkpoint.save(self, completed_steps)
+
+        steps = []
+        for step_name, methods in self.pipeline_steps():
+            if (step_names is not None) and (step_name not in step_names):
+                continue
+            if step_name in completed_steps:
+                console.log(f"{step_name} already completed, skipping.")
+                continue
+            steps.append((step_name, run_step(step_name, methods)))
+        run_step_graph(steps, STEP_DEPENDENCIES, on_completed)
+
+        if not self.backfill:
+            checkpoint.clear()
+            self.metrics.export(self.db)
+        else:
+            self.metrics.finish()
+            self.metrics.log_summary()
+        response_cache.log_summary()
+        for node_pool in node_pools.values():
+            node_pool.log_summary()
+
+    def get_accounts_and_bakers_for_APY_calc(self):
+        """
+        This method determines for which accounts and baker_ids we need
+        to calculate APY.
+        """
+
+        # the stake (and pool) of delegators is in the delegator table, bakers
+        # stake their equity capital.
+        self.baker_stake_by_account_id: Dict[str, int] = {
+            account_id: pool_info.current_payday_info.baker_equity_capital
+            for account_id, pool_info in self.pool_info_by_account_id.items()
+        }
+
+        self.baker_account_ids = set(self.baker_account_ids_by_baker_id.values())
+
+        self.accounts_that_need_APY = list(
+            set(self.delegator_table.rows.keys()) | self.baker_account_ids
+        )
+        self.bakers_that_need_APY = list(self.delegator_table.pools)
+
+    def stake_for_account(self, account_id: str) -> Optional[int]:
+        if account_id in self.baker_stake_by_account_id:
+            return self.baker_stake_by_account_id[account_id]
+        return self.delegator_table.stake_for_account(account_id)
+
+    def get_previous_payday_information_entry(self, payday_date_string: str):
+        payday_date = dateutil.parser.parse(payday_date_string)
+        previous_payday_date = payday_date - dt.timedelta(days=1)
+        previous_payday_date_string = f"{previous_payday_date:%Y-%m-%d}"
+
+        # indexed on `date`, see ensure_indexes.
+        result = self.db[Collections.paydays].find_one(
+            {"date": previous_payday_date_string},
+            projection={"_id": 0, "height_for_last_block": 1, "hash_for_last_block": 1},
+        )
+
+        if result:
+            return result
+        else:
+            # self.tooter.send(channel=TooterChannel.NOTIFIER, message=f'(Payday: {payday_date_string}): Cannot find this date in collection_paydays', notifier_type=TooterType.INFO)
+            return None
+
+    def get_expected_blocks_per_day(self, lp):
+        slots_in_day = 14400 * 24
+        return slots_in_day * (1.0 - (1 - 1 / 40) ** (lp))
+
+    def retrieve_state_for_baker(self, baker_id: CCD_BakerId, last_hash: CCD_BlockHash):
+        """
+        Account info, pool info and delegators for a single baker at the last block
+        of the payday. Runs on a worker thread, every call is retried on its own.
+        """
+        account_info = call_with_retry(
+            self.grpcclient.get_account_info, last_hash, account_index=baker_id
+        )
+        # future me: this needs to be collected from the last_hash,
+        # as we are using this to collect the actually baked blocks
+        # in a payday (in baker-tally).
+        pool_info_for_baker = call_with_retry(
+            self.grpcclient.get_pool_info_for_pool, baker_id, last_hash
+        )
+        delegators_for_baker = call_with_retry(
+            self.grpcclient.get_delegators_for_pool_in_reward_period,
+            baker_id,
+            last_hash,
+        )
+        return baker_id, (account_info, pool_info_for_baker, delegators_for_baker)
+
+    def retrieve_state_for_baker_current_payday(self, baker_id: CCD_BakerId):
+        """
+        Pool info for a single baker at the payday block.
+        """
+        # future me: this needs to be collected from the payday_block_hash,
+        # as we are using this to display the current payday information
+        pool_info_for_baker_current_payday = call_with_retry(
+            self.grpcclient.get_pool_info_for_pool, baker_id, self.payday_block_hash
+        )
+        return baker_id, pool_info_for_baker_current_payday
+
+    def retrieve_state_information_for_current_payday(self):
+        """
+        State information for the current payday from the last block in the payday.
+        """
+
+        # bakers for this payday
+        last_hash = self.payday_block_info_last_block.hash
+        first_hash = self.payday_block_info_first_block.hash
+
+        self.bakers_in_block = self.grpcclient.get_election_info(
+            last_hash
+        ).baker_election_info
+
+        # needed for current payday information to show pools at /staking,
+        # a backfill doesn't touch that.
+        self.bakers_in_block_current_payday = (
+            self.grpcclient.get_election_info(
+                self.payday_block_hash
+            ).baker_election_info
+            if not self.backfill
+            else []
+        )
+
+        self.baker_account_ids_by_baker_id: Dict[str, CCD_AccountAddress] = {}
+        self.baker_account_ids_by_account_id: Dict[str, CCD_BakerId] = {}
+        # the delegators of every pool (and passive delegation), shared by
+        # Steps 1-5.
+        self.delegator_table = DelegatorTable()
+        self.pool_info_by_baker_id: Dict[str, CCD_PoolInfo] = {}
+        self.pool_info_by_baker_id_current_payday: Dict[str, CCD_PoolInfo] = {}
+        self.pool_info_by_account_id: Dict[str, CCD_PoolInfo] = {}
+
+        self.pool_status_dict: Dict[str, list] = {}
+        self.pool_status_dict_current_payday: Dict[str, list] = {}
+        # retrieve per baker state concurrently, results come back in the
+        # order of bakers_in_block, so the dicts below are filled as before.
+        state_for_bakers = fan_out(
+            lambda baker_id: self.retrieve_state_for_baker(baker_id, last_hash),
+            [x.baker for x in self.bakers_in_block],
+            description="Bakers (last block)",
+        )
+        for baker_id, (
+            account_info,
+            pool_info_for_baker,
+            delegators_for_baker,
+        ) in state_for_bakers:
+            self.pool_info_by_baker_id[str(baker_id)] = pool_info_for_baker
+            self.pool_info_by_account_id[account_info.address] = pool_info_for_baker
+
+            # lookup mappings from acount_id <---> baker_id
+            self.baker_account_ids_by_baker_id[str(baker_id)] = (
+                pool_info_for_baker.address
+            )
+            self.baker_account_ids_by_account_id[pool_info_for_baker.address] = baker_id
+
+            # contains delegators with info
+            self.delegator_table.add_pool(str(baker_id), delegators_for_baker)
+
+            # add dictionary with payday pool status for each baker/pool
+            current_baker_pool_status = pool_info_for_baker.pool_info.open_status
+
+            if current_baker_pool_status in self.pool_status_dict.keys():
+                self.pool_status_dict[current_baker_pool_status].append(baker_id)
+            else:
+                self.pool_status_dict[current_baker_pool_status] = [baker_id]
+
+        # needed for current payday information to show pools at /staking
+        state_for_bakers_current_payday = fan_out(
+            self.retrieve_state_for_baker_current_payday,
+            [x.baker for x in self.bakers_in_block_current_payday],
+            description="Bakers (payday block)",
+        )
+        for (
+            baker_id,
+            pool_info_for_baker_current_payday,
+        ) in state_for_bakers_current_payday:
+            self.pool_info_by_baker_id_current_payday[str(baker_id)] = (
+                pool_info_for_baker_current_payday
+            )
+
+            # add dictionary with payday pool status for each baker/pool
+            current_baker_pool_status = (
+                pool_info_for_baker_current_payday.pool_info.open_status
+            )
+
+            if current_baker_pool_status in self.pool_status_dict_current_payday.keys():
+                self.pool_status_dict_current_payday[current_baker_pool_status].append(
+                    baker_id
+                )
+            else:
+                self.pool_status_dict_current_payday[current_baker_pool_status] = [
+                    baker_id
+                ]
+
+        # add passive delegators
+        self.delegator_table.add_pool(
+            "passive_delegation",
+            call_with_retry(
+                self.grpcclient.get_delegators_for_passive_delegation_in_reward_period,
+                last_hash,
+            ),
+        )
+
+        self.passive_delegation_info = call_with_retry(
+            self.grpcclient.get_passive_delegation_info, last_hash
+        )
+
+    # step 1
+    def create_and_save_payday_information_entry(self):
+        """
+        If the payday is triggered on block 3_232_445, it's the start of the very first payday.
+        In that case, we need to retrieve stake information and store in the collection.
+        For any future payday, we can (hopefully) read the info back, as we store it during
+        processing of the previous payday. If we can't read it, we still have to retrieve it.
+        """
+        console.log("Step 1: create_and_save_payday_information_entry")
+
+        self.retrieve_state_information_for_current_payday()
+        payday_information_entry = {
+            "_id": self.payday_block_info.hash,
+            "date": self.payday_date_string,
+            "height_for_first_block": self.payday_block_info_first_block.height,
+            "height_for_last_block": self.payday_block_info_last_block.height,
+            "hash_for_first_block": self.payday_block_info_first_block.hash,
+            "hash_for_last_block": self.payday_block_info_last_block.hash,
+            "payday_duration_in_seconds": self.payday_duration,
+            "payday_block_slot_time": self.payday_block_info.slot_time,
+            # the delegators themselves are stored in paydays_delegators
+            "delegation_summary": delegation_summary(self.delegator_table),
+            "baker_account_ids": self.baker_account_ids_by_baker_id,
+            "pool_status_for_bakers": self.pool_status_dict,
+        }
+        self.payday_information = payday_information_entry
+        # before the paydays entry and outside the try below: without its
+        # delegators a payday must not count as processed. A backfill stores
+        # them in date order, see backfill.py.
+        if not self.backfill:
+            self.store_delegators()
+        try:
+            query = {"_id": self.payday_block_info.hash}
+            self.db[Collections.paydays].replace_one(
+                query, payday_information_entry, upsert=True
+            )
+            try:
+                self.tooter.send(
+                    channel=TooterChannel.NOTIFIER,
+                    message=f"(Payday: {self.payday_date_string}) \nStep 1: create_and_save_payday_information_entry...done.",
+                    notifier_type=TooterType.INFO,
+                )
+            except:
+                console.log("Step 1, can't toot.")
+
+        except Exception as e:
+            console.log(e)
+
+    def store_delegators(self):
+        """
+        The delegators of this payday, as the changes since the previous
+        payday (or a snapshot), see payday_delegators.py.
+        """
+        store_delegators_for_payday(
+            self.delegators,
+            self.delegator_headers,
+            self.payday_date_string,
+            self.delegator_table,
+        )
+
+    # step 2
+    def process_payday_performance_for_bakers(self):
+        console.log("Step 2: process_payday_performance_for_bakers")
+        estimated_blocks_per_day = (
+            self.payday_block_info_last_block.height
+            - self.payday_block_info_first_block.height
+            + 1
+        )
+        with BulkWriter(self.db[Collections.paydays_performance]) as queue:
+            for baker_id in track(self.delegator_table.pools):
+                _id = f"{self.payday_date_string}-{baker_id}"
+                d = {}
+                if baker_id == "passive_delegation":
+                    d["pool_status"] = self.serialization_cache.dump(
+                        self.passive_delegation_info
+                    )
+                else:
+                    d["pool_status"] = self.serialization_cache.dump(
+                        self.pool_info_by_baker_id[str(baker_id)]
+                    )
+                    if self.pool_info_by_baker_id[str(baker_id)].current_payday_info:
+                        d["expectation"] = (
+                            self.pool_info_by_baker_id[
+                                str(baker_id)
+                            ].current_payday_info.lottery_power
+                            * estimated_blocks_per_day
+                        )
+
+                    else:
+                        d["expectation"] = 0
+
+                pool_owner = baker_id
+                d["_id"] = _id
+                d["date"] = self.payday_date_string
+                d["payday_block_slot_time"] = self.payday_block_info.slot_time
+                d["baker_id"] = pool_owner
+
+                queue.append(ReplaceOne({"_id": _id}, d, upsert=True))
+
+        # for current payday...
+        current_payday_documents = []
+        for baker_id in track(self.pool_info_by_baker_id_current_payday.keys()):
+            _id = f"{self.payday_date_string}-{baker_id}"
+            d = {}
+            d["pool_status"] = self.serialization_cache.dump(
+                self.pool_info_by_baker_id_current_payday[str(baker_id)]
+            )
+            if self.pool_info_by_baker_id_current_payday[
+                str(baker_id)
+            ].current_payday_info:
+                d["expectation"] = (
+                    self.pool_info_by_baker_id_current_payday[
+                        str(baker_id)
+                    ].current_payday_info.lottery_power
+                    * estimated_blocks_per_day
+                )
+
+            else:
+                d["expectation"] = 0
+
+            pool_owner = baker_id
+            d["_id"] = _id
+            d["date"] = self.payday_date_string
+            d["payday_block_slot_time"] = self.payday_block_info.slot_time
+            d["baker_id"] = pool_owner
+
+            current_payday_documents.append(d)
+
+        # the current payday collection is only for the live payday.
+        if not self.backfill:
+            swap_current_payday(
+                self.current_payday_staging,
+                self.db[Collections.paydays_current_payday],
+                current_payday_documents,
+            )
+
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStep 2: process_payday_performance_for_bakers...done.\nProcessed {len(self.baker_account_ids_by_baker_id.keys())} bakers.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 2, can't toot.")
+
+    def add_reward_to_impacted_accounts(
+        self, account_rewards: Dict[str, CCD_BlockSpecialEvent_PaydayAccountReward]
+    ):
+        """
+        One impacted_addresses entry per account reward, written in chunks
+        while the entries are built.
+        """
+        block_height = self.payday_block_info_last_block.height + 1
+        with BulkWriter(
+            self.db[Collections.impacted_addresses]
+        ) as impacted_addresses_queue:
+            for ar in track(account_rewards.values()):
+                impacted_addresses_queue.append(
+                    impacted_address_for_account_reward(
+                        ar, block_height, self.payday_date_string
+                    )
+                )
+        self.tooter.send(
+            channel=TooterChannel.NOTIFIER,
+            message=f"(Payday: {self.payday_date_string}) \nStep 3.5: add_reward_to_impacted_accounts...done.",
+            notifier_type=TooterType.INFO,
+        )
+
+    # # step 3
+    def process_payday_rewards_for_account_or_baker(self):
+        console.log("Step 3: process_payday_rewards_for_account_or_baker")
+        """
+        This method runs through all rewards for the payday and stores an entry for each in collection_paydays_rewards.
+        """
+        self.account_rewards: Dict[str, CCD_BlockSpecialEvent_PaydayAccountReward] = {}
+        self.pool_rewards: Dict[str, CCD_BlockSpecialEvent_PaydayPoolReward] = {}
+        with BulkWriter(self.db[Collections.paydays_rewards]) as queue:
+            for e in track(self.special_events_with_rewards):  #
+                if (e.payday_pool_reward) or e.payday_account_reward:
+                    d = {}
+                    if e.payday_account_reward:
+                        self.account_rewards[e.payday_account_reward.account] = (
+                            e.payday_account_reward
+                        )
+                        _tag = "payday_account_reward"
+                        d["account_id"] = e.payday_account_reward.account
+                        d["reward"] = e.payday_account_reward.model_dump()
+                        receiver = e.payday_account_reward.account
+                        if e.payday_account_reward.account in self.delegator_table:
+                            d["account_is_delegator"] = True
+                            d["delegation_target"] = (
+                                self.delegator_table.pool_for_account(
+                                    e.payday_account_reward.account
+                                )
+                            )
+                            d["staked_amount"] = self.stake_for_account(
+                                e.payday_account_reward.account
+                            )
+
+                        if e.payday_account_reward.account in self.baker_account_ids:
+                            # request poolstatus to get a stable stakedAmount for an account from the baker itself.
+                            d["staked_amount"] = self.pool_info_by_account_id[
+                                e.payday_account_reward.account
+                            ].current_payday_info.baker_equity_capital
+                            d["account_is_baker"] = True
+                            d["baker_id"] = self.baker_account_ids_by_account_id[
+                                e.payday_account_reward.account
+                            ]
+
+                    elif e.payday_pool_reward:
+
+                        d["pool_owner"] = (
+                            e.payday_pool_reward.pool_owner
+                            if e.payday_pool_reward.pool_owner
+                            else "passive_delegation"
+                        )
+                        receiver = (
+                            self.baker_account_ids_by_baker_id[
+                                str(e.payday_pool_reward.pool_owner)
+                            ]
+                            if e.payday_pool_reward.pool_owner
+                            else "passive_delegation"
+                        )
+                        self.pool_rewards[str(d["pool_owner"])] = e.payday_pool_reward
+                        _tag = "payday_pool_reward"
+                        d["pool_status"] = self.serialization_cache.dump(
+                            self.pool_info_by_baker_id[
+                                str(e.payday_pool_reward.pool_owner)
+                            ]
+                            if e.payday_pool_reward.pool_owner
+                            else self.passive_delegation_info
+                        )
+                        d["reward"] = e.payday_pool_reward.model_dump(exclude_none=True)
+
+                    # receiver = "passive_delegation" if not receiver else receiver #type: ignore
+                    d["_id"] = f"{self.payday_date_string}-{_tag}-{receiver}"  # type: ignore
+                    d["date"] = self.payday_date_string
+                    d["slot_time"] = self.payday_block_info.slot_time
+
+                    queue.append(ReplaceOne({"_id": d["_id"]}, d, upsert=True))
+
+            # BULK_WRITE
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStep 3: process_payday_rewards_for_account_or_baker...done.\nProcessed {len(self.baker_account_ids_by_baker_id.keys())} bakers.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 3, can't toot.")
+
+    def prefetch_apy_intermediate(
+        self, ids: list[str], projection: Optional[dict] = None
+    ) -> Dict[str, dict]:
+        """
+        Read the existing paydays_apy_intermediate documents for `ids` in chunked
+        `$in` queries, instead of one find_one per account/baker.
+        """
+        documents_by_id: Dict[str, dict] = {}
+        for i in range(0, len(ids), PAYDAY_MONGO_IN_CHUNK_SIZE):
+            chunk = ids[i : (i + PAYDAY_MONGO_IN_CHUNK_SIZE)]
+            for x in self.db[Collections.paydays_apy_intermediate].find(
+                {"_id": {"$in": chunk}}, projection
+            ):
+                documents_by_id[x["_id"]] = x
+        return documents_by_id
+
+    # # step 4
+    def fill_apy_intermediate_for_accounts_for_date(self):
+        console.log("Step 4: fill_apy_intermediate_for_accounts_for_date")
+        """
+        We only get into this method if it's a account that is either a baker or a delegator.
+        
+        This method fills the paydays_apy_intermediate collection, for a given payday. 
+        This contains the daily apy (reward/relevant_stake). There are documents for every account,
+        with a property daily_apy, which is a dictionary, keyed by date, valued is daily apy.
+        """
+
+        # gather rewards and stakes for all accounts, so the daily APY
+        # can be calculated in one go.
+        rewards = np.zeros(len(self.accounts_that_need_APY), dtype=np.float64)
+        stakes = np.zeros(len(self.accounts_that_need_APY), dtype=np.float64)
+        has_reward = np.zeros(len(self.accounts_that_need_APY), dtype=bool)
+        for i, account_id in enumerate(self.accounts_that_need_APY):
+            reward_for_account = self.account_rewards.get(account_id)
+            if reward_for_account:
+                has_reward[i] = True
+                rewards[i] = (
+                    reward_for_account.baker_reward
+                    + reward_for_account.finalization_reward
+                    + reward_for_account.transaction_fees
+                )
+                stakes[i] = self.stake_for_account(account_id)
+
+        daily_apys = annualized_apy(
+            rewards, stakes, self.seconds_per_year / self.payday_duration
+        ).tolist()
+        rewards_in_ccd = (rewards / 1_000_000).tolist()
+
+        with BulkWriter(self.db[Collections.paydays_apy_intermediate]) as queue:
+            for i, account_id in enumerate(track(self.accounts_that_need_APY)):
+                _id = account_id
+
+                # add daily_apy to the dict for this account, only the key
+                # for this payday is written, the history stays untouched.
+                queue.append(
+                    UpdateOne(
+                        {"_id": _id},
+                        {
+                            "$set": {
+                                "calculation_type": "daily apy (intermediate value)",
+                                f"daily_apy_dict.{self.payday_date_string}": {
+                                    "apy": daily_apys[i] if has_reward[i] else 0,
+                                    "reward": rewards_in_ccd[i],
+                                },
+                            },
+                            "$max": {"last_payday_date": self.payday_date_string},
+                        },
+                        upsert=True,
+                    )
+                )
+
+            # BULK_WRITE
+
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStep 4: fill_apy_intermediate_for_accounts_for_date...done.\nProcessed {len(self.accounts_that_need_APY)} accounts.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 4, can't toot.")
+
+    # # step 5
+    def fill_apy_intermediate_for_bakers_for_date(self):
+        console.log("Step 5: fill_apy_intermediate_for_bakers_for_date")
+        """
+        We only get into this method if it's a baker.
+        
+        This method fills the paydays_apy_intermediate collection, for a given payday. 
+        This contains the daily apy (reward/relevant_stake). There are documents for every account,
+        with a property daily_apy, which is a dictionary, keyed by date, valued is daily apy.
+        For bakers
+        """
+        exponent = self.seconds_per_year / self.payday_duration
+
+        # gather the pool rewards and pool info for all pools with a reward,
+        # so the reward split and APYs can be calculated in one go.
+        pools_with_reward = [
+            baker_id
+            for baker_id in self.bakers_that_need_APY
+            if (baker_id in self.pool_rewards) and (baker_id != "passive_delegation")
+        ]
+        index_for_pool = {baker_id: i for i, baker_id in enumerate(pools_with_reward)}
+        rewards = [self.pool_rewards[baker_id] for baker_id in pools_with_reward]
+        pool_infos = [
+            self.pool_info_by_baker_id[baker_id] for baker_id in pools_with_reward
+        ]
+        pools = pool_rewards_and_apys(
+            baker_reward=[x.baker_reward for x in rewards],
+            transaction_fees=[x.transaction_fees for x in rewards],
+            finalization_reward=[x.finalization_reward for x in rewards],
+            delegated_capital=[
+                x.current_payday_info.delegated_capital for x in pool_infos
+            ],
+            effective_stake=[x.current_payday_info.effective_stake for x in pool_infos],
+            baker_equity_capital=[
+                x.current_payday_info.baker_equity_capital for x in pool_infos
+            ],
+            commission_baking=[x.pool_info.commission_rates.baking for x in pool_infos],
+            commission_transaction=[
+                x.pool_info.commission_rates.transaction for x in pool_infos
+            ],
+            commission_finalization=[
+                x.pool_info.commission_rates.finalization for x in pool_infos
+            ],
+            exponent=exponent,
+        )
+        pools = {k: v.tolist() for k, v in pools.items()}
+
+        with BulkWriter(self.db[Collections.paydays_apy_intermediate]) as queue:
+            for baker_id in track(self.bakers_that_need_APY):
+                _id = baker_id
+
+                daily_total = None
+                daily_baker = None
+                daily_delegator = None
+                daily_passive = None
+
+                if baker_id == "passive_delegation":
+                    if baker_id in self.pool_rewards.keys():
+                        reward_for_baker = self.pool_rewards[baker_id]
+                        total_reward = (
+                            reward_for_baker.baker_reward
+                            + reward_for_baker.finalization_reward
+                            + reward_for_baker.transaction_fees
+                        )
+                        daily_apy = annualized_apy(
+                            [total_reward],
+                            [
+                                self.passive_delegation_info.current_payday_delegated_capital
+                            ],
+                            exponent,
+                        )[0]
+                        daily_passive = {
+                            "apy": float(daily_apy),
+                            "reward": total_reward / 1_000_000,
+                        }
+
+                elif baker_id in index_for_pool:
+                    i = index_for_pool[baker_id]
+                    daily_total = {
+                        "apy": pools["total_apy"][i],
+                        "reward": pools["total_reward"][i] / 1_000_000,
+                    }
+                    daily_baker = {
+                        "apy": pools["owner_apy"][i],
+                        "reward": pools["owner_reward"][i] / 1_000_000,
+                    }
+                    if self.delegator_table.delegator_count(baker_id) > 0:
+                        daily_delegator = {
+                            "apy": pools["delegator_apy"][i],
+                            "reward": pools["delegator_reward"][i] / 1_000_000,
+                        }
+
+                # add daily_apy to the dict for this baker
+                daily_apy_for_baker = {}
+                if daily_baker:
+                    daily_apy_for_baker.update({"baker": daily_baker})
+                else:
+                    daily_apy_for_baker.update({"baker": {"apy": 0, "reward": 0}})
+                if daily_total:
+                    daily_apy_for_baker.update({"total": daily_total})
+                else:
+                    daily_apy_for_baker.update({"total": {"apy": 0, "reward": 0}})
+
+                if daily_delegator:
+                    daily_apy_for_baker.update({"delegator": daily_delegator})
+                else:
+                    daily_apy_for_baker.update({"delegator": {"apy": 0, "reward": 0}})
+
+                if baker_id == "passive_delegation":
+                    if daily_passive:
+                        daily_apy_for_baker.update({"passive": daily_passive})
+                    else:
+                        daily_apy_for_baker.update({"passive": {"apy": 0, "reward": 0}})
+
+                queue.append(
+                    UpdateOne(
+                        {"_id": _id},
+                        {
+                            "$set": {
+                                "calculation_type": "daily apy (intermediate value)",
+                                f"daily_apy_dict.{self.payday_date_string}": daily_apy_for_baker,
+                            },
+                            "$max": {"last_payday_date": self.payday_date_string},
+                        },
+                        upsert=True,
+                    )
+                )
+
+            # BULK_WRITE
+
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStep 5: fill_apy_intermediate_for_bakers_for_date...done.\nProcessed {len(self.baker_account_ids_by_baker_id.keys())} bakers.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 5, can't toot.")
+
+    def add_moving_average_updates(
+        self,
+        updates_by_account: Dict[str, dict],
+        period: int,
+        account_ids: list[str],
+        sums: Dict[str, np.ndarray],
+        incremental_updates: list[int],
+    ):
+        """
+        Add the $set fields for one period to the updates for every account: the
+        running sums for this payday and, if more than 90% of the days in the
+        window have an entry, the moving average itself.
+        """
+        enough_days, apys = moving_averages_from_sums(sums, period)
+        enough_days = enough_days.tolist()
+        apys = apys.tolist()
+        sums = {k: v.tolist() for k, v in sums.items()}
+        for i, account_id in enumerate(account_ids):
+            updates = updates_by_account.setdefault(account_id, {})
+            updates[f"moving_average_state.d{period}"] = {
+                "date": self.payday_date_string,
+                "incremental_updates": incremental_updates[i],
+                "sums": {
+                    "sum_ln": sums["sum_ln"][i],
+                    "sum_reward": sums["sum_reward"][i],
+                    "count": sums["count"][i],
+                },
+            }
+            if enough_days[i]:
+                updates[f"d{period}_apy_dict.{self.payday_date_string}"] = {
+                    "apy": apys[i],
+                    "sum_of_rewards": sums["sum_reward"][i],
+                    "count_of_days": sums["count"][i],
+                }
+
+    # step 6
+    def calc_moving_averages(self, full_scan: bool = PAYDAY_MA_FULL_SCAN):
+        """
+        The 30/90/180 day moving averages are kept as running sums of log(1+apy),
+        rewards and day counts per account and period (`moving_average_state`).
+        Every payday the newest day is added and the day that leaves the window is
+        subtracted, so we only need to read those two days per account.
+        A full recompute from `daily_apy_dict` happens if the running sums are not
+        from the previous payday, or every PAYDAY_MA_FULL_RECOMPUTE_EVERY paydays
+        to guard against floating point drift.
+
+        By default only accounts and bakers with an entry in the last
+        `lookback` paydays are processed (this includes everything that was
+        touched in steps 4 and 5). Accounts that stopped earlier can no longer
+        reach the 90% coverage in any window, so their averages can't change.
+        With `full_scan` every document in paydays_apy_intermediate is processed,
+        use this as a repair mode.
+        """
+        print("getting paydays", end=" ")
+        paydays_days = [
+            x["date"]
+            for x in self.db[Collections.paydays].find(
+                filter={},
+                projection={
+                    "_id": 0,
+                    "date": 1,
+                },
+                sort=[("date", 1)],
+            )
+        ]
+        print(len(paydays_days))
+        print("Getting accounts", end=" ")
+
+        periods = [30, 90, 180]
+
+        index_in_list = paydays_days.index(self.payday_date_string)
+        previous_payday_date_string = (
+            paydays_days[index_in_list - 1] if index_in_list > 0 else None
+        )
+
+        # if the index of the current payday is less than the period we want to calculate
+        # we can't continue with this period (ie, if 70 days have passed, we can't calculate 90d avg).
+        periods = [period for period in periods if index_in_list >= period]
+        leaving_dates = {
+            period: paydays_days[index_in_list - period] for period in periods
+        }
+
+        projection = {
+            "moving_average_state": 1,
+            f"daily_apy_dict.{self.payday_date_string}": 1,
+        }
+        for leaving_date in leaving_dates.values():
+            projection[f"daily_apy_dict.{leaving_date}"] = 1
+
+        if full_scan:
+            set_missing_last_payday_dates(self.db)
+            query = {}
+        else:
+            # the last day with an entry needs to be inside the last 10% of
+            # the longest window to still make the 90% coverage.
+            lookback = int(0.10 * max(periods, default=0)) + 1
+            query = {
+                "last_payday_date": {
+                    "$gte": paydays_days[max(0, index_in_list - lookback)]
+                }
+            }
+
+        # gather: per period the accounts that can slide their running sums,
+        # and per account the periods that need a full recompute.
+        incremental_for_period: Dict[int, list] = {period: [] for period in periods}
+        periods_for_full_recompute: Dict[str, list[int]] = {}
+        for x in self.db[Collections.paydays_apy_intermediate].find(query, projection):
+            account_id = x["_id"]
+            daily_apy_dict = x.get("daily_apy_dict", {})
+            state = x.get("moving_average_state", {})
+
+            for period in periods:
+                state_for_period = state.get(f"d{period}")
+                if (
+                    (state_for_period is None)
+                    or (state_for_period["date"] != previous_payday_date_string)
+                    or (
+                        state_for_period["incremental_updates"]
+                        >= PAYDAY_MA_FULL_RECOMPUTE_EVERY
+                    )
+                ):
+                    periods_for_full_recompute.setdefault(account_id, []).append(period)
+                else:
+                    incremental_for_period[period].append(
+                        (
+                            account_id,
+                            state_for_period,
+                            daily_apy_dict.get(self.payday_date_string),
+                            daily_apy_dict.get(leaving_dates[period]),
+                        )
+                    )
+
+        # compute: slide the running sums for all accounts at once
+        updates_by_account: Dict[str, dict] = {}
+        for period, rows in incremental_for_period.items():
+            account_ids = [x[0] for x in rows]
+            sums = slide_window_sums(
+                window_sums_from_states([x[1]["sums"] for x in rows]),
+                day_values(account_ids, [x[2] for x in rows]),
+                day_values(account_ids, [x[3] for x in rows]),
+            )
+            self.add_moving_average_updates(
+                updates_by_account,
+                period,
+                account_ids,
+                sums,
+                [x[1]["incremental_updates"] + 1 for x in rows],
+            )
+
+        # full recompute for accounts without usable running sums
+        documents_for_full_recompute = self.prefetch_apy_intermediate(
+            list(periods_for_full_recompute.keys()),
+            projection={"daily_apy_dict": 1},
+        )
+        for period in periods:
+            account_ids = [
+                account_id
+                for account_id, periods_for_account in periods_for_full_recompute.items()
+                if period in periods_for_account
+            ]
+            term_dates = paydays_days[
+                (index_in_list - period + 1) : (index_in_list + 1)
+            ]
+            sums = window_sums_from_history(
+                account_ids,
+                [
+                    documents_for_full_recompute[account_id]["daily_apy_dict"]
+                    for account_id in account_ids
+                ],
+                term_dates,
+            )
+            self.add_moving_average_updates(
+                updates_by_account, period, account_ids, sums, [0] * len(account_ids)
+            )
+
+        # scatter: one $set per account
+        with BulkWriter(self.db[Collections.paydays_apy_intermediate]) as queue:
+            for account_id, updates_for_account in updates_by_account.items():
+                queue.append(
+                    UpdateOne({"_id": account_id}, {"$set": updates_for_account})
+                )
+
+            # BULK_WRITE
+            print(f"{len(updates_by_account)=}", end="||")
+
+        try:
+            self.tooter.send(
+                channel=TooterChannel.NOTIFIER,
+                message=f"(Payday: {self.payday_date_string}) \nStep 6: Calculate moving averages. done.",
+                notifier_type=TooterType.INFO,
+            )
+        except:
+            console.log("Step 6, can't toot.")
@@ -0,0 +1,440 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import (
+    CCD_DelegatorRewardPeriodInfo,
+)
+from ccdexplorer_fundamentals.mongodb import Collections, MongoDB
+from pymongo import ASCENDING, DESCENDING, InsertOne
+from pymongo.collection import Collection
+from rich.console import Console
+from bulk_writer import BulkWriter
+from delegator_table import DelegatorTable
+
+console = Console()
+from env import *
+
+# one document per (date, pool, delegator), instead of all delegators of all
+# pools embedded in the paydays document. Only on snapshot dates all
+# delegators are stored, on the other dates only the changes.
+PAYDAYS_DELEGATORS = "paydays_delegators"
+# one document per date (the _id), telling which delegators are stored for
+# it: a snapshot, or the changes since `base_date`.
+PAYDAYS_DELEGATORS_HEADERS = "paydays_delegators_headers"
+
+# the delegator tables stored or rebuilt last, by date, to diff against.
+RECENT_TABLES_MAX = 2
+recent_tables: OrderedDict[str, DelegatorTable] = OrderedDict()
+
+
+def delegators_collection(mongodb: MongoDB, TESTNET: bool = False) -> Collection:
+    """
+    The paydays_delegators collection. It's not in `Collections`, so it's
+    taken from the database directly.
+    """
+    database = mongodb.mainnet_db if not TESTNET else mongodb.testnet_db
+    return database[PAYDAYS_DELEGATORS]
+
+
+def delegator_headers_collection(mongodb: MongoDB, TESTNET: bool = False) -> Collection:
+    database = mongodb.mainnet_db if not TESTNET else mongodb.testnet_db
+    return database[PAYDAYS_DELEGATORS_HEADERS]
+
+
+def ensure_delegator_indexes(collection: Collection):
+    """
+    Delegator history per account and per pool, and the delete of a date
+    when a payday is rerun. Safe to call on every startup.
+    The headers are looked up on _id (the date) only.
+    """
+    collection.create_index([("account", ASCENDING), ("date", DESCENDING)])
+    collection.create_index([("pool", ASCENDING), ("date", DESCENDING)])
+    collection.create_index("date")
+
+
+def delegator_documents(
+    payday_date_string: str, delegator_table: DelegatorTable
+) -> Iterator[dict]:
+    for pool, account, stake in delegator_table.items():
+        yield {
+            "_id": f"{payday_date_string}-{pool}-{account}",
+            "date": payday_date_string,
+            "pool": pool,
+            "account": account,
+            "stake": stake,
+        }
+
+
+def delegator_changes(
+    payday_date_string: str, previous: DelegatorTable, delegator_table: DelegatorTable
+) -> Iterator[dict]:
+    """
+    The documents for the delegators that joined, changed pool or stake
+    (with their new pool and stake), or left (`left`, with their old pool)
+    since `previous`.
+    """
+    for pool, account, stake in delegator_table.items():
+        if (previous.pool_for_account(account) != pool) or (
+            previous.stake_for_account(account) != stake
+        ):
+            yield {
+                "_id": f"{payday_date_string}-{pool}-{account}",
+                "date": payday_date_string,
+                "pool": pool,
+                "account": account,
+                "stake": stake,
+            }
+    for pool, account, _ in previous.items():
+        if account not in delegator_table:
+            yield {
+                "_id": f"{payday_date_string}-{pool}-{account}",
+                "date": payday_date_string,
+                "pool": pool,
+                "account": account,
+                "left": True,
+            }
+
+
+def delegation_summary(delegator_table: DelegatorTable) -> Dict[str, dict]:
+    """
+    Per pool the number of delegators and their total stake, what's left of
+    the delegators in the paydays document.
+    """
+    return {
+        pool: {
+            "delegator_count": delegator_table.delegator_count(pool),
+            "delegated_stake": delegator_table.delegated_stake(pool),
+        }
+        for pool in delegator_table.pools
+    }
+
+
+def remember_table(payday_date_string: str, delegator_table: DelegatorTable):
+    recent_tables[payday_date_string] = delegator_table
+    recent_tables.move_to_end(payday_date_string)
+    while len(recent_tables) > RECENT_TABLES_MAX:
+        recent_tables.popitem(last=False)
+
+
+def matches_header(delegator_table: DelegatorTable, header: dict) -> bool:
+    # a remembered table can be from the other net, or from before a rerun.
+    return (
+        (delegator_table.pools == header["pools"])
+        and (len(delegator_table) == header["delegator_count"])
+        and (sum(delegator_table.stakes) == header["delegated_stake"])
+    )
+
+
+def store_delegators_for_payday(
+    collection: Collection,
+    headers: Collection,
+    payday_date_string: str,
+    delegator_table: DelegatorTable,
+):
+    """
+    Store the delegators for this date: the changes since the last stored
+    date before it, or all of them (a snapshot) if there is none, or if the
+    last snapshot was PAYDAY_DELEGATORS_SNAPSHOT_EVERY dates ago.
+    The delegators of a payday are fixed by the chain, so a rerun stores the
+    same view and the dates after it remain valid. A date stored as a
+    snapshot stays one when it's stored again (a backfill of earlier dates),
+    so the dates based on it keep their chain. The header is deleted first
+    and written last, so a date with a header is always complete; reruns
+    don't leave delegators behind that have since been removed.
+    """
+    stored_before = headers.find_one({"_id": payday_date_string})
+    headers.delete_one({"_id": payday_date_string})
+    collection.delete_many({"date": payday_date_string})
+
+    base = headers.find_one(
+        {"_id": {"$lt": payday_date_string}}, sort=[("_id", DESCENDING)]
+    )
+    if base and (base["chain_length"] + 1 >= PAYDAY_DELEGATORS_SNAPSHOT_EVERY):
+        base = None
+    if stored_before and stored_before["snapshot"]:
+        base = None
+
+    header = write_delegators(
+        collection, headers, payday_date_string, delegator_table, base
+    )
+    refresh_later_headers(collection, headers, header)
+
+
+def write_delegators(
+    collection: Collection,
+    headers: Collection,
+    payday_date_string: str,
+    delegator_table: DelegatorTable,
+    base: Optional[dict],
+) -> dict:
+    """
+    Write the documents for a date without any, as the changes since the
+    date of the `base` header or as a snapshot, then its header.
+    """
+    previous = get_delegator_table(collection, headers, base["_id"]) if base else None
+
+    if previous is None:
+        documents = delegator_documents(payday_date_string, delegator_table)
+    else:
+        documents = delegator_changes(payday_date_string, previous, delegator_table)
+    stored = 0
+    with BulkWriter(collection) as queue:
+        for document in documents:
+            queue.append(InsertOne(document))
+            stored += 1
+
+    header = {
+        "_id": payday_date_string,
+        "snapshot": previous is None,
+        "base_date": base["_id"] if previous is not None else None,
+        "snapshot_date": (
+            base["snapshot_date"] if previous is not None else payday_date_string
+        ),
+        "chain_length": base["chain_length"] + 1 if previous is not None else 0,
+        "pools": delegator_table.pools,
+        "delegator_count": len(delegator_table),
+        "delegated_stake": sum(delegator_table.stakes),
+        "documents": stored,
+    }
+    headers.insert_one(header)
+    remember_table(payday_date_string, delegator_table)
+    return header
+
+
+def refresh_later_headers(collection: Collection, headers: Collection, header: dict):
+    """
+    After a date is stored again, its chain can be longer or start at
+    another snapshot. The dates after it whose chain runs through it get
+    their `snapshot_date` and `chain_length` recomputed, and a date whose
+    chain gets too long is stored again as a snapshot, so the cadence of
+    PAYDAY_DELEGATORS_SNAPSHOT_EVERY holds. Usually there are no later dates.
+    """
+    refreshed = {header["_id"]: header}
+    later_headers = list(
+        headers.find(
+            {"_id": {"$gt": header["_id"]}},
+            projection={
+                "_id": 1,
+                "base_date": 1,
+                "snapshot_date": 1,
+                "chain_length": 1,
+            },
+            sort=[("_id", ASCENDING)],
+        )
+    )
+    for later in later_headers:
+        base = refreshed.get(later["base_date"])
+        if base is None:
+            continue
+        if base["chain_length"] + 1 >= PAYDAY_DELEGATORS_SNAPSHOT_EVERY:
+            delegator_table = get_delegator_table(collection, headers, later["_id"])
+            headers.delete_one({"_id": later["_id"]})
+            collection.delete_many({"date": later["_id"]})
+            refreshed[later["_id"]] = write_delegators(
+                collection, headers, later["_id"], delegator_table, None
+            )
+            continue
+
+        update = {
+            "snapshot_date": base["snapshot_date"],
+            "chain_length": base["chain_length"] + 1,
+        }
+        if any(later[k] != v for k, v in update.items()):
+            headers.update_one({"_id": later["_id"]}, {"$set": update})
+        refreshed[later["_id"]] = {**later, **update}
+
+
+def get_delegator_table(
+    collection: Collection, headers: Collection, payday_date_string: str
+) -> Optional[DelegatorTable]:
+    """
+    The full view of the delegators on a date, rebuilt from its snapshot and
+    the changes stored since (usually one query for the headers, one for the
+    delegators). The chain follows `base_date`, a base outside the range
+    since `snapshot_date` (re-stored earlier dates) is looked up on its own.
+    Dates stored before there were headers hold all their delegators. None
+    if nothing is stored for the date.
+    """
+    header = headers.find_one({"_id": payday_date_string})
+    if header and (payday_date_string in recent_tables):
+        if matches_header(recent_tables[payday_date_string], header):
+            return recent_tables[payday_date_string]
+
+    if header is None:
+        chain = [payday_date_string]
+        pools = []
+    else:
+        headers_in_range = {
+            x["_id"]: x
+            for x in headers.find(
+                {"_id": {"$gte": header["snapshot_date"], "$lte": payday_date_string}}
+            )
+        }
+        chain = [payday_date_string]
+        while headers_in_range[chain[-1]]["base_date"] is not None:
+            base_date = headers_in_range[chain[-1]]["base_date"]
+            if base_date not in headers_in_range:
+                headers_in_range[base_date] = headers.find_one({"_id": base_date})
+            if headers_in_range[base_date] is None:
+                raise ValueError(
+                    f"Delegators for {chain[-1]} are based on {base_date}, which isn't stored."
+                )
+            chain.append(base_date)
+        chain.reverse()
+        pools = header["pools"]
+
+    documents_by_date: Dict[str, list[dict]] = {x: [] for x in chain}
+    for x in collection.find({"date": {"$in": chain}}, projection={"_id": 0}):
+        documents_by_date[x["date"]].append(x)
+    if (header is None) and (len(documents_by_date[payday_date_string]) == 0):
+        return None
+
+    # account -> (pool, stake), applied date by date.
+    view: Dict[str, tuple[str, int]] = {}
+    for date in chain:
+        for x in documents_by_date[date]:
+            view.pop(x["account"], None)
+            if not x.get("left"):
+                view[x["account"]] = (x["pool"], x["stake"])
+
+    rows_by_pool: Dict[str, list[tuple[str, int]]] = {x: [] for x in pools}
+    for account, (pool, stake) in view.items():
+        rows_by_pool.setdefault(pool, []).append((account, stake))
+    delegator_table = DelegatorTable()
+    for pool, rows in rows_by_pool.items():
+        delegator_table.add_pool_rows(pool, rows)
+    if header is not None:
+        remember_table(payday_date_string, delegator_table)
+    return delegator_table
+
+
+def get_delegators_for_payday(
+    collection: Collection,
+    headers: Collection,
+    payday_date_string: str,
+    pool: Optional[str] = None,
+) -> Dict[str, list[dict]]:
+    """
+    The delegators (account, stake) per pool for a payday, in the shape of
+    the old embedded `bakers_with_delegation_information`.
+    """
+    delegator_table = get_delegator_table(collection, headers, payday_date_string)
+    if delegator_table is None:
+        return {}
+    return {
+        x: [
+            {"account": account, "stake": stake}
+            for account, stake in delegator_table.delegators(x)
+        ]
+        for x in delegator_table.pools
+        if (pool is None) or (x == pool)
+    }
+
+
+def get_delegation_history_for_account(
+    collection: Collection, headers: Collection, account: str
+) -> list[dict]:
+    """
+    Every payday (date, pool, stake) the account delegated in, newest first.
+    On dates that only hold changes, the account delegates as on the date
+    its changes are based on.
+    """
+    documents = {
+        x["date"]: x
+        for x in collection.find(
+            {"account": account}, projection={"_id": 0, "account": 0}
+        )
+    }
+    if len(documents) == 0:
+        return []
+    headers_by_date = {
+        x["_id"]: x
+        for x in headers.find(
+            {"_id": {"$gte": min(documents)}},
+            projection={"_id": 1, "base_date": 1},
+        )
+    }
+
+    # date -> (pool, stake) or None, in date order.
+    delegation: Dict[str, Optional[tuple[str, int]]] = {}
+    for date in sorted(set(documents) | set(headers_by_date)):
+        x = documents.get(date)
+        base_date = headers_by_date.get(date, {}).get("base_date")
+        if x is not None:
+            delegation[date] = None if x.get("left") else (x["pool"], x["stake"])
+        elif base_date is not None:
+            delegation[date] = delegation.get(base_date)
+        else:
+            # a snapshot without the account.
+            delegation[date] = None
+
+    return [
+        {"date": date, "pool": x[0], "stake": x[1]}
+        for date, x in sorted(delegation.items(), reverse=True)
+        if x is not None
+    ]
+
+
+def compact_delegators(
+    collection: Collection, headers: Collection, dates: Optional[list[str]] = None
+):
+    """
+    Store `dates` again (by default: the dates stored before there were
+    headers) in date order, as snapshots and changes.
+    """
+    if dates is None:
+        dates = [
+            x for x in collection.distinct("date") if not headers.find_one({"_id": x})
+        ]
+    for date in sorted(dates):
+        delegator_table = get_delegator_table(collection, headers, date)
+        if delegator_table is None:
+            continue
+        store_delegators_for_payday(collection, headers, date, delegator_table)
+        console.log(f"Compacted delegators for {date}.")
+
+
+def migrate_embedded_delegators(
+    db: Dict[Collections, Collection], collection: Collection, headers: Collection
+):
+    """
+    Move `bakers_with_delegation_information` out of paydays documents written
+    before this collection existed.
+    """
+    for payday in db[Collections.paydays].find(
+        {"bakers_with_delegation_information": {"$exists": True}},
+        projection={"date": 1, "bakers_with_delegation_information": 1},
+        sort=[("date", ASCENDING)],
+    ):
+        delegator_table = DelegatorTable.from_delegators(
+            {
+                pool: [CCD_DelegatorRewardPeriodInfo(**x) for x in delegators]
+                for pool, delegators in payday[
+                    "bakers_with_delegation_information"
+                ].items()
+            }
+        )
+        store_delegators_for_payday(
+            collection, headers, payday["date"], delegator_table
+        )
+        db[Collections.paydays].update_one(
+            {"_id": payday["_id"]},
+            {
+                "$set": {"delegation_summary": delegation_summary(delegator_table)},
+                "$unset": {"bakers_with_delegation_information": ""},
+            },
+        )
+        console.log(f"Migrated delegators for {payday['date']}.")
+
+
+if __name__ == "__main__":
+    from ccdexplorer_fundamentals.tooter import Tooter
+
+    mongodb = MongoDB(Tooter())
+    for TESTNET in [False, True]:
+        collection = delegators_collection(mongodb, TESTNET)
+        headers = delegator_headers_collection(mongodb, TESTNET)
+        ensure_delegator_indexes(collection)
+        migrate_embedded_delegators(
+            mongodb.mainnet if not TESTNET else mongodb.testnet, collection, headers
+        )
+        compact_delegators(collection, headers)
@@ -0,0 +1,85 @@
+import time
+from typing import Dict, Optional
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+from rich.console import Console
+
+console = Console()
+from env import *
+
+
+class PaydayTrigger:
+    """
+    Waits for `helpers.last_known_payday` to change.
+
+    Preferably through a change stream, which is opened on creation (so create
+    the trigger before the first check) and kept open, so a new payday that
+    lands while we are processing the previous one is buffered and picked up
+    immediately afterwards.
+    If change streams are not available (standalone server), we fall back to
+    polling the helper document with an adaptive backoff: every poll without a
+    change doubles the interval, up to PAYDAY_POLL_MAX_SECONDS.
+    Either way `wait` returns at least every PAYDAY_TRIGGER_SAFETY_SECONDS, so
+    the caller re-checks its state regularly.
+    """
+
+    def __init__(self, db: Dict[Collections, Collection]):
+        self.db = db
+        self.use_change_stream = True
+        self.stream = None
+        self.resume_token = None
+        self.poll_interval = PAYDAY_POLL_MIN_SECONDS
+        self.last_seen: Optional[dict] = None
+        # opened before the caller's first check, so nothing that lands during
+        # the first run is missed.
+        self.open_change_stream()
+
+    def open_change_stream(self):
+        try:
+            self.stream = self.db[Collections.helpers].watch(
+                pipeline=[{"$match": {"documentKey._id": "last_known_payday"}}],
+                max_await_time_ms=1_000,
+                resume_after=self.resume_token,
+            )
+        except PyMongoError as e:
+            console.log(f"Change streams not available ({e}), polling instead.")
+            self.use_change_stream = False
+            self.stream = None
+
+    def wait(self):
+        if self.use_change_stream and (self.stream is None):
+            self.open_change_stream()
+
+        if self.stream is not None:
+            self.wait_for_change_stream()
+        else:
+            self.wait_by_polling()
+
+    def wait_for_change_stream(self):
+        deadline = time.time() + PAYDAY_TRIGGER_SAFETY_SECONDS
+        try:
+            while time.time() < deadline:
+                change = self.stream.try_next()
+                self.resume_token = self.stream.resume_token
+                if change is not None:
+                    return
+        except PyMongoError as e:
+            # reopened (from the resume token) on the next wait.
+            console.log(f"Change stream error ({e}), reopening.")
+            self.stream.close()
+            self.stream = None
+
+    def wait_by_polling(self):
+        deadline = time.time() + PAYDAY_TRIGGER_SAFETY_SECONDS
+        while time.time() < deadline:
+            last_known_payday = self.db[Collections.helpers].find_one(
+                {"_id": "last_known_payday"}
+            )
+            if last_known_payday != self.last_seen:
+                self.last_seen = last_known_payday
+                self.poll_interval = PAYDAY_POLL_MIN_SECONDS
+                return
+
+            time.sleep(self.poll_interval)
+            self.poll_interval = min(self.poll_interval * 2, PAYDAY_POLL_MAX_SECONDS)
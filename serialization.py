@@ -0,0 +1,23 @@
+from typing import Dict
+from pydantic import BaseModel
+
+
+class SerializationCache:
+    """
+    `model_dump(exclude_none=True)` of the pool and passive delegation info,
+    done once per object per payday and reused by every writer (steps 2 and 3
+    both store the same pool status).
+    The cached dicts are shared between documents, so writers must not modify
+    them. The object is kept next to its dump, so its id can't be reused by
+    another object while it is in the cache.
+    """
+
+    def __init__(self):
+        self.dumps: Dict[int, tuple[BaseModel, dict]] = {}
+
+    def dump(self, model: BaseModel) -> dict:
+        cached = self.dumps.get(id(model))
+        if (cached is None) or (cached[0] is not model):
+            cached = (model, model.model_dump(exclude_none=True))
+            self.dumps[id(model)] = cached
+        return cached[1]
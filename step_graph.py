@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable
+from rich.progress import track as rich_track
+from rich.console import Console
+
+console = Console()
+from env import *
+
+progress_lock = threading.Lock()
+
+
+def track(sequence: Iterable, *args, **kwargs):
+    """
+    rich's `track`, but only one progress bar at a time: a second live display
+    (from a step running in parallel) raises a LiveError, so the other steps
+    iterate without one.
+    """
+    if not progress_lock.acquire(blocking=False):
+        yield from sequence
+        return
+    try:
+        yield from rich_track(sequence, *args, **kwargs)
+    finally:
+        progress_lock.release()
+
+
+def run_step_graph(
+    steps: list[tuple[str, Callable]],
+    dependencies: Dict[str, list[str]],
+    on_completed: Callable[[str, bool], None],
+    max_workers: int = PAYDAY_STEP_CONCURRENCY,
+):
+    """
+    Run `steps` (name, function), every step as soon as the steps it depends on
+    are done, with at most `max_workers` steps at the same time. Dependencies
+    on steps that aren't in `steps` (already completed, or not selected) count
+    as done. The steps share their state through the Payday instance.
+
+    `on_completed(step_name, idle)` is called on this thread after every step,
+    `idle` tells whether no other step is running at that moment. With
+    `max_workers` 1 the steps run on this thread, in the order given.
+    If a step raises, no new steps are started, the running ones are waited
+    for and the first exception is raised.
+    """
+    pending = [name for name, _ in steps]
+    functions = dict(steps)
+    for name in pending:
+        for dependency in dependencies.get(name, []):
+            if (dependency in functions) and (
+                pending.index(dependency) > pending.index(name)
+            ):
+                raise ValueError(f"{name} depends on {dependency}, which comes later.")
+
+    def ready() -> list[str]:
+        return [
+            name
+            for name in pending
+            if all(x not in pending for x in dependencies.get(name, []))
+            and (name not in running.values())
+        ]
+
+    running: Dict[Future, str] = {}
+    if max_workers <= 1:
+        while len(pending) > 0:
+            name = ready()[0]
+            functions[name]()
+            pending.remove(name)
+            on_completed(name, True)
+        return
+
+    error = None
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="payday_step"
+    ) as executor:
+        while len(pending) > 0:
+            if error is None:
+                for name in ready()[: max_workers - len(running)]:
+                    running[executor.submit(functions[name])] = name
+            if len(running) == 0:
+                break
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    console.log(f"{name} failed ({future.exception()}).")
+                    error = error or future.exception()
+                    continue
+                pending.remove(name)
+                on_completed(name, len(running) == 0)
+    if error is not None:
+        raise error
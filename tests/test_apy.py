@@ -0,0 +1,111 @@
+import math
+import pytest
+from apy import annualized_apy, pool_rewards_and_apys
+
+EXPONENT = 3_153_6000 / 86_400
+
+
+def scalar_apy(reward: float, stake: float) -> float:
+    # as in the baseline Steps 4 and 5.
+    if stake > 0:
+        return math.pow(1 + (reward / stake), EXPONENT) - 1
+    else:
+        return 0
+
+
+def scalar_pool(pool: dict) -> dict:
+    """
+    The baseline Step 5 split for one pool. The baseline divided by the
+    effective stake unguarded, a pool without stake gets no delegator share.
+    """
+    total_reward = (
+        pool["baker_reward"] + pool["finalization_reward"] + pool["transaction_fees"]
+    )
+    if pool["effective_stake"] > 0:
+        delegator_ratio = pool["delegated_capital"] / pool["effective_stake"]
+    else:
+        delegator_ratio = 0
+    delegator_reward = (
+        (1 - pool["commission_baking"]) * (delegator_ratio * pool["baker_reward"])
+        + (1 - pool["commission_transaction"])
+        * (delegator_ratio * pool["transaction_fees"])
+        + (1 - pool["commission_finalization"])
+        * (delegator_ratio * pool["finalization_reward"])
+    )
+    baker_reward = total_reward - delegator_reward
+    return {
+        "total_reward": total_reward,
+        "owner_reward": baker_reward,
+        "delegator_reward": delegator_reward,
+        "total_apy": scalar_apy(total_reward, pool["effective_stake"]),
+        "owner_apy": scalar_apy(baker_reward, pool["baker_equity_capital"]),
+        "delegator_apy": scalar_apy(delegator_reward, pool["delegated_capital"]),
+    }
+
+
+def pool(
+    equity: int,
+    delegated: int,
+    commission: float,
+    reward: int = 1_000_000_000,
+    finalization_commission: float = 1.0,
+) -> dict:
+    return {
+        "baker_reward": reward,
+        "transaction_fees": reward // 10,
+        "finalization_reward": reward // 20,
+        "delegated_capital": delegated,
+        "effective_stake": equity + delegated,
+        "baker_equity_capital": equity,
+        "commission_baking": commission,
+        "commission_transaction": commission,
+        "commission_finalization": finalization_commission,
+    }
+
+
+POOLS = {
+    "regular": pool(3_000_000_000_000, 7_000_000_000_000, 0.1),
+    "zero commission": pool(
+        3_000_000_000_000, 7_000_000_000_000, 0.0, finalization_commission=0.0
+    ),
+    "full commission": pool(3_000_000_000_000, 7_000_000_000_000, 1.0),
+    "no delegators": pool(3_000_000_000_000, 0, 0.05),
+    "no equity": pool(0, 7_000_000_000_000, 0.05),
+    "zero stake": pool(0, 0, 0.05),
+    "zero stake, no reward": pool(0, 0, 0.0, reward=0, finalization_commission=0.0),
+    "no reward": pool(3_000_000_000_000, 7_000_000_000_000, 0.1, reward=0),
+}
+
+
+def test_pool_rewards_and_apys_match_the_scalar_formulas():
+    names = list(POOLS)
+    result = pool_rewards_and_apys(
+        **{k: [POOLS[x][k] for x in names] for k in POOLS["regular"]},
+        exponent=EXPONENT,
+    )
+    for i, name in enumerate(names):
+        expected = scalar_pool(POOLS[name])
+        for k, v in expected.items():
+            assert result[k][i] == pytest.approx(v, rel=1e-12, abs=1e-12), (name, k)
+
+
+def test_guards_for_pools_without_stake():
+    result = pool_rewards_and_apys(
+        **{k: [POOLS["zero stake"][k]] for k in POOLS["zero stake"]},
+        exponent=EXPONENT,
+    )
+    # everything goes to the owner, no APY without stake (and no nan).
+    assert result["delegator_reward"][0] == 0
+    assert result["owner_reward"][0] == result["total_reward"][0]
+    for k in ["total_apy", "owner_apy", "delegator_apy"]:
+        assert result[k][0] == 0, k
+
+
+def test_annualized_apy_matches_the_scalar_formula():
+    rewards = [0, 1_000, 5_000_000, 123_456, 1_000]
+    stakes = [1_000_000_000, 1_000_000_000, 2_000_000_000_000, 0, -5]
+    apys = annualized_apy(rewards, stakes, EXPONENT)
+    assert apys.tolist() == pytest.approx(
+        [scalar_apy(r, s) for r, s in zip(rewards, stakes)], rel=1e-12
+    )
+    assert len(annualized_apy([], [], EXPONENT)) == 0
@@ -0,0 +1,115 @@
+import threading
+import pytest
+from pymongo.errors import BulkWriteError, PyMongoError
+from bulk_writer import BulkWriter
+
+
+class FakeBulkWriteResult:
+    def __init__(self, requests: list):
+        self.inserted_count = len(requests)
+        self.upserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+
+
+class FakeCollection:
+    """
+    Records the chunks it gets. Chunks whose first request is in `failing`
+    raise that error, while `gate` is cleared bulk_write blocks.
+    """
+
+    name = "fake"
+
+    def __init__(self, failing: dict = None):
+        self.failing = failing or {}
+        self.chunks: list[list] = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.writing = 0
+        self.max_writing = 0
+        self.lock = threading.Lock()
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        assert not ordered
+        with self.lock:
+            self.writing += 1
+            self.max_writing = max(self.max_writing, self.writing)
+        try:
+            self.gate.wait()
+            if requests[0] in self.failing:
+                raise self.failing[requests[0]]
+            self.chunks.append(list(requests))
+            return FakeBulkWriteResult(requests)
+        finally:
+            with self.lock:
+                self.writing -= 1
+
+
+def test_writes_chunks_in_order():
+    collection = FakeCollection()
+    with BulkWriter(collection, chunk_size=3, max_pending=2) as queue:
+        queue.extend(range(10))
+    assert collection.chunks == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    assert [x["chunk"] for x in queue.results] == [0, 1, 2, 3]
+    assert sum(x["inserted"] for x in queue.results) == 10
+
+
+def test_failed_chunk_fails_close_after_the_other_chunks():
+    error = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]}
+    )
+    collection = FakeCollection(failing={3: error, 6: PyMongoError("lost")})
+
+    with pytest.raises(BulkWriteError):
+        with BulkWriter(collection, chunk_size=3, max_pending=2) as queue:
+            queue.extend(range(10))
+
+    # the other chunks are still written, the first error is raised.
+    assert collection.chunks == [[0, 1, 2], [9]]
+    assert [x["errors"] for x in queue.results] == [0, 1, 3, 0]
+    assert queue.results[1]["error"] is error
+
+
+def test_append_waits_when_max_pending_chunks_are_in_flight():
+    collection = FakeCollection()
+    collection.gate.clear()
+    queue = BulkWriter(collection, chunk_size=1, max_pending=2)
+    queue.append(0)
+    queue.append(1)
+
+    appended = threading.Event()
+
+    def append_third():
+        queue.append(2)
+        appended.set()
+
+    thread = threading.Thread(target=append_third)
+    thread.start()
+    # two chunks in flight, the third append blocks.
+    assert not appended.wait(0.2)
+
+    collection.gate.set()
+    assert appended.wait(2)
+    thread.join()
+    queue.close()
+    assert collection.chunks == [[0], [1], [2]]
+    # one writer thread, chunks are never written at the same time.
+    assert collection.max_writing == 1
+
+
+def test_error_in_the_step_aborts_without_writing_the_rest():
+    collection = FakeCollection()
+    collection.gate.clear()
+    # lets the chunk in flight finish while the writer is aborting.
+    timer = threading.Timer(0.2, collection.gate.set)
+
+    with pytest.raises(ValueError):
+        with BulkWriter(collection, chunk_size=2, max_pending=3) as queue:
+            queue.extend(range(7))
+            timer.start()
+            raise ValueError("step failed")
+
+    # the chunk in flight is finished, the queued ones and the last partial
+    # one are dropped.
+    assert collection.chunks == [[0, 1]]
+    assert len(queue.pending) == 0
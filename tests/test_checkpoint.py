@@ -0,0 +1,166 @@
+import functools
+import os
+import pytest
+import checkpoint
+import payday as payday_module
+from ccdexplorer_fundamentals.mongodb import Collections
+from checkpoint import CHECKPOINT_HELPER_ID, PaydayCheckpoint, get_unfinished_payday
+from in_memory_mongo import InMemoryMongoDB
+from payday import STEP_DEPENDENCIES, NullTooter, Payday
+from step_graph import run_step_graph
+
+DATE = "2024-06-01"
+BLOCK_HASH = "block-1"
+
+
+class FakePayday(Payday):
+    """
+    Payday whose steps only record that they ran and leave a product behind
+    for the steps that depend on them. Steps named in `failing` raise.
+    """
+
+    failing: list[str] = []
+    ran: list[str] = []
+
+    def pipeline_steps(self) -> list[tuple[str, list]]:
+        return [
+            (step_name, [functools.partial(self.run_step, step_name)])
+            for step_name in STEP_DEPENDENCIES
+        ]
+
+    def run_step(self, step_name: str):
+        for dependency in STEP_DEPENDENCIES[step_name]:
+            # restored from the checkpoint if the dependency ran before.
+            assert getattr(self, f"product_{dependency}") == dependency
+        if step_name in self.failing:
+            raise RuntimeError(f"{step_name} failed")
+        FakePayday.ran.append(step_name)
+        setattr(self, f"product_{step_name}", step_name)
+
+
+@pytest.fixture
+def mongodb(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "PAYDAY_CHECKPOINT_DIR", str(tmp_path))
+    FakePayday.ran = []
+    return InMemoryMongoDB()
+
+
+def run(mongodb: InMemoryMongoDB, failing: list[str], backfill: bool = False):
+    FakePayday.failing = failing
+    payday = FakePayday.from_state(
+        {"payday_date_string": DATE, "payday_block_hash": BLOCK_HASH},
+        None,
+        mongodb,
+        NullTooter(),
+        backfill=backfill,
+    )
+    payday.run_pipeline()
+    return payday
+
+
+def checkpoint_helper(mongodb: InMemoryMongoDB):
+    return mongodb.mainnet[Collections.helpers].find_one({"_id": CHECKPOINT_HELPER_ID})
+
+
+@pytest.fixture
+def one_step_at_a_time(monkeypatch):
+    monkeypatch.setattr(
+        payday_module,
+        "run_step_graph",
+        functools.partial(run_step_graph, max_workers=1),
+    )
+
+
+def test_resume_skips_completed_steps(mongodb, one_step_at_a_time):
+    with pytest.raises(RuntimeError, match="step_4 failed"):
+        run(mongodb, failing=["step_4"])
+
+    assert checkpoint_helper(mongodb)["completed_steps"] == [
+        "step_1",
+        "step_2",
+        "step_3",
+        "step_3_5",
+    ]
+    assert get_unfinished_payday(mongodb.mainnet) == (DATE, BLOCK_HASH)
+    path = PaydayCheckpoint(mongodb.mainnet, DATE, BLOCK_HASH).path
+    assert os.path.exists(path)
+
+    FakePayday.ran = []
+    payday = run(mongodb, failing=[])
+
+    assert FakePayday.ran == ["step_4", "step_5", "step_6"]
+    assert payday.product_step_1 == "step_1"
+    # discarded after success.
+    assert checkpoint_helper(mongodb) is None
+    assert not os.path.exists(path)
+    assert get_unfinished_payday(mongodb.mainnet) is None
+
+
+def test_resume_with_concurrent_steps(mongodb):
+    with pytest.raises(RuntimeError, match="step_6 failed"):
+        run(mongodb, failing=["step_6"])
+    completed_steps = list(checkpoint_helper(mongodb)["completed_steps"])
+    assert {"step_1", "step_3"} <= set(completed_steps)
+
+    FakePayday.ran = []
+    run(mongodb, failing=[])
+
+    # steps that finished while another one was running aren't in the
+    # checkpoint and run again, nothing that was checkpointed does.
+    assert "step_6" in FakePayday.ran
+    assert set(FakePayday.ran).isdisjoint(completed_steps)
+    assert checkpoint_helper(mongodb) is None
+
+
+def test_checkpoint_of_another_payday_is_ignored(mongodb):
+    payday = FakePayday.from_state(
+        {"payday_date_string": DATE, "payday_block_hash": BLOCK_HASH, "product_x": 1},
+        None,
+        mongodb,
+        NullTooter(),
+    )
+    PaydayCheckpoint(mongodb.mainnet, DATE, BLOCK_HASH).save(payday, ["step_1"])
+
+    other = FakePayday.from_state(
+        {"payday_date_string": "2024-06-02", "payday_block_hash": "block-2"},
+        None,
+        mongodb,
+        NullTooter(),
+    )
+    assert (
+        PaydayCheckpoint(mongodb.mainnet, "2024-06-02", "block-2").restore(other) == []
+    )
+    assert not hasattr(other, "product_x")
+
+    same = FakePayday.from_state(
+        {"payday_date_string": DATE, "payday_block_hash": BLOCK_HASH},
+        None,
+        mongodb,
+        NullTooter(),
+    )
+    assert PaydayCheckpoint(mongodb.mainnet, DATE, BLOCK_HASH).restore(same) == [
+        "step_1"
+    ]
+    assert same.product_x == 1
+    # the clients are never part of the checkpoint.
+    assert same.db is not None
+
+
+def test_missing_pickle_starts_over(mongodb, one_step_at_a_time):
+    with pytest.raises(RuntimeError):
+        run(mongodb, failing=["step_2"])
+    os.remove(PaydayCheckpoint(mongodb.mainnet, DATE, BLOCK_HASH).path)
+
+    FakePayday.ran = []
+    run(mongodb, failing=[])
+
+    assert FakePayday.ran == list(STEP_DEPENDENCIES)
+    assert checkpoint_helper(mongodb) is None
+
+
+def test_backfill_is_not_checkpointed(mongodb, one_step_at_a_time):
+    with pytest.raises(RuntimeError):
+        run(mongodb, failing=["step_4"], backfill=True)
+
+    assert checkpoint_helper(mongodb) is None
+    assert get_unfinished_payday(mongodb.mainnet) is None
@@ -0,0 +1,68 @@
+from current_payday import copy_indexes, swap_current_payday
+from in_memory_mongo import InMemoryDatabase
+
+
+class IndexedCollection:
+    def __init__(self, index_information: dict):
+        self.indexes = index_information
+        self.created: list[tuple] = []
+
+    def index_information(self) -> dict:
+        return self.indexes
+
+    def create_index(self, keys, **kwargs):
+        self.created.append((keys, kwargs))
+
+
+def test_copy_indexes_keeps_every_option():
+    source = IndexedCollection(
+        {
+            "_id_": {"v": 2, "key": [("_id", 1)]},
+            "baker_id_1": {"v": 2, "key": [("baker_id", 1)], "unique": True},
+            "date_1": {
+                "v": 2,
+                "key": [("date", 1)],
+                "expireAfterSeconds": 86_400,
+                "ns": "concordium.paydays_current_payday",
+            },
+            "account_1": {
+                "v": 2,
+                "key": [("account", 1), ("pool", -1)],
+                "sparse": True,
+                "partialFilterExpression": {"pool": {"$exists": True}},
+                "collation": {"locale": "en", "strength": 2},
+            },
+        }
+    )
+    target = IndexedCollection({})
+
+    copy_indexes(source, target)
+
+    assert target.created == [
+        ([("baker_id", 1)], {"name": "baker_id_1", "unique": True}),
+        ([("date", 1)], {"name": "date_1", "expireAfterSeconds": 86_400}),
+        (
+            [("account", 1), ("pool", -1)],
+            {
+                "name": "account_1",
+                "sparse": True,
+                "partialFilterExpression": {"pool": {"$exists": True}},
+                "collation": {"locale": "en", "strength": 2},
+            },
+        ),
+    ]
+
+
+def test_swap_replaces_all_documents():
+    database = InMemoryDatabase()
+    current_payday = database["paydays_current_payday"]
+    current_payday.insert_many([{"_id": x} for x in ["a", "b", "c"]])
+    # leftovers of a failed run.
+    database["staging"].insert_one({"_id": "old"})
+
+    swap_current_payday(
+        database["staging"], current_payday, [{"_id": "b"}, {"_id": "d"}]
+    )
+
+    assert [x["_id"] for x in current_payday.find({})] == ["b", "d"]
+    assert database["staging"].count_documents({}) == 0
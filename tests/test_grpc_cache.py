@@ -0,0 +1,57 @@
+import gc
+import tracemalloc
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import CCD_DelegatorRewardPeriodInfo
+from grpc_cache import BlockResponseCache, memory_size
+
+
+def delegators(count: int, offset: int = 0) -> list[CCD_DelegatorRewardPeriodInfo]:
+    return [
+        CCD_DelegatorRewardPeriodInfo(
+            account=f"3{x + offset:049d}", stake=(x + offset) * 1_000_003
+        )
+        for x in range(count)
+    ]
+
+
+def test_memory_size_is_close_to_the_allocated_memory():
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        response = delegators(20_000)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    # several times the pickled size, never much below what's allocated.
+    assert 0.9 * allocated <= memory_size(response) <= 1.5 * allocated
+    assert memory_size([]) > 0
+    assert memory_size(response[:10]) < memory_size(response)
+
+
+def test_cache_is_bounded_by_memory_size():
+    response_size = memory_size(delegators(2_000))
+    cache = BlockResponseCache(directory=None, max_mb=3.5 * response_size / 1024 / 1024)
+
+    for i in range(5):
+        cache.put(f"key-{i}", delegators(2_000, offset=i * 2_000))
+
+    assert cache.bytes_in_memory <= cache.max_bytes
+    # the most recent ones are kept.
+    assert list(cache.responses) == ["key-2", "key-3", "key-4"]
+    cache.get("key-0")
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # larger than half of the cache, not kept in memory.
+    cache.put("large", delegators(4_000))
+    assert "large" not in cache.responses
+
+
+def test_responses_on_disk_are_read_back(tmp_path):
+    response = delegators(100)
+    BlockResponseCache(directory=str(tmp_path)).put("key", response)
+
+    cache = BlockResponseCache(directory=str(tmp_path))
+    assert cache.get("key") == response
+    assert cache.hits == 1
+    assert cache.bytes_in_memory == memory_size(cache.responses["key"][0])
@@ -0,0 +1,69 @@
+import pytest
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo import UpdateMany
+from in_memory_mongo import InMemoryMongoDB
+from payday import ensure_indexes
+
+
+def test_ensure_indexes_sets_missing_last_payday_dates():
+    mongodb = InMemoryMongoDB()
+    collection = mongodb.mainnet[Collections.paydays_apy_intermediate]
+    collection.insert_many(
+        [
+            {
+                "_id": "a",
+                "daily_apy_dict": {
+                    "2024-06-02": {"apy": 0.05, "reward": 1},
+                    "2024-06-03": {"apy": 0.04, "reward": 1},
+                    "2024-06-01": {"apy": 0.06, "reward": 1},
+                },
+            },
+            {"_id": "b", "daily_apy_dict": {}},
+            {
+                "_id": "c",
+                "daily_apy_dict": {"2024-06-03": {"apy": 0.05, "reward": 1}},
+                "last_payday_date": "2024-06-04",
+            },
+        ]
+    )
+
+    ensure_indexes(mongodb.mainnet)
+
+    assert collection.find_one({"_id": "a"})["last_payday_date"] == "2024-06-03"
+    assert collection.find_one({"_id": "b"})["last_payday_date"] is None
+    assert collection.find_one({"_id": "c"})["last_payday_date"] == "2024-06-04"
+    # the other fields are left alone.
+    assert len(collection.find_one({"_id": "a"})["daily_apy_dict"]) == 3
+
+
+def test_pipeline_update_sees_the_document_before_the_stage():
+    collection = InMemoryMongoDB().mainnet_db["test"]
+    collection.insert_one({"_id": 1, "a": 1, "b": 2})
+
+    collection.update_one({"_id": 1}, [{"$set": {"a": "$b", "b": "$a"}}])
+
+    assert collection.find_one({"_id": 1}) == {"_id": 1, "a": 2, "b": 1}
+
+
+@pytest.mark.parametrize(
+    "f, message",
+    [
+        (lambda x: x.find_one({"a": {"$ne": 1}}), "query operator \\$ne"),
+        (lambda x: x.update_one({"_id": 1}, {"$inc": {"a": 1}}), "operator \\$inc"),
+        (
+            lambda x: x.update_one({"_id": 1}, [{"$unset": "a"}]),
+            "pipeline update stage \\$unset",
+        ),
+        (
+            lambda x: x.update_one({"_id": 1}, [{"$set": {"a": {"$add": [1, 2]}}}]),
+            "expression operator \\$add",
+        ),
+        (lambda x: x.bulk_write([UpdateMany({}, {"$set": {"a": 1}})]), "UpdateMany"),
+    ],
+)
+def test_unsupported_operations_say_what_is_missing(f, message):
+    collection = InMemoryMongoDB().mainnet_db["test"]
+    collection.insert_one({"_id": 1, "a": 1})
+
+    with pytest.raises(NotImplementedError, match=message):
+        f(collection)
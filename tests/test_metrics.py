@@ -0,0 +1,30 @@
+import bson
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from bulk_writer import BulkWriter
+from in_memory_mongo import InMemoryDatabase
+from metrics import InstrumentedCollection, PaydayMetrics
+
+
+def test_bulk_writes_count_their_bytes_for_the_step():
+    metrics = PaydayMetrics("2024-06-01", "block-1")
+    collection = InstrumentedCollection(InMemoryDatabase()["test"], metrics)
+    documents = [
+        {"_id": "a", "daily_apy_dict": {"2024-06-01": {"apy": 0.05, "reward": 1.5}}},
+        {"$set": {"daily_apy_dict.2024-06-01": {"apy": 0.04, "reward": 2.5}}},
+        {"_id": "c", "pool": "42", "stake": 1_000_000},
+    ]
+
+    metrics.start_step("step_4")
+    # chunks of 2, written on the BulkWriter's own thread.
+    with BulkWriter(collection, chunk_size=2) as queue:
+        queue.append(ReplaceOne({"_id": "a"}, documents[0], upsert=True))
+        queue.append(UpdateOne({"_id": "b"}, documents[1], upsert=True))
+        queue.append(InsertOne(documents[2]))
+        queue.append(DeleteOne({"_id": "a"}))
+    metrics.stop_step("step_4")
+
+    m = metrics.steps["step_4"]["mongo"]["test"]["bulk_write"]
+    assert m["calls"] == 2
+    assert m["documents_written"] == 4
+    assert m["bytes_written"] == sum(len(bson.encode(x)) for x in documents)
+    assert "test" not in metrics.steps.get("setup", {}).get("mongo", {})
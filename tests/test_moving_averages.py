@@ -0,0 +1,260 @@
+import datetime as dt
+import math
+import numpy as np
+import pytest
+import payday as payday_module
+from ccdexplorer_fundamentals.mongodb import Collections
+from in_memory_mongo import InMemoryMongoDB
+from moving_averages import (
+    day_values,
+    moving_averages_from_sums,
+    slide_window_sums,
+    window_sums_from_history,
+)
+from payday import NullTooter, Payday
+
+PERIOD = 30
+DATES = [f"{dt.date(2024, 1, 1) + dt.timedelta(days=x):%Y-%m-%d}" for x in range(45)]
+
+
+def calc_apy_for_period(daily_apy: list) -> float:
+    # as in the baseline, before the running sums.
+    daily_ln = [math.log(1 + x) for x in daily_apy]
+    avg_ln = sum(daily_ln) / len(daily_ln)
+    expp = math.exp(avg_ln)
+    apy = expp - 1
+    return apy
+
+
+def day_entry(account_id: str, apy: float, reward: float) -> dict:
+    if account_id == "passive_delegation":
+        return {"passive": {"apy": apy, "reward": reward}}
+    if account_id.isnumeric():
+        other = {"apy": 2 * apy, "reward": 3 * reward}
+        return {
+            "baker": other,
+            "total": other,
+            "delegator": {"apy": apy, "reward": reward},
+        }
+    return {"apy": apy, "reward": reward}
+
+
+def history() -> dict[str, dict]:
+    """
+    daily_apy_dict per account: a full one, one with gaps around the 90%
+    coverage, one with only zero days, one that stops, one that starts late,
+    a baker and passive delegation.
+    """
+    rng = np.random.default_rng(7)
+    days = {
+        "account-full": range(len(DATES)),
+        "account-gaps": [x for x in range(len(DATES)) if x % 11 not in [3, 7]],
+        "account-zero": range(len(DATES)),
+        "account-stopped": range(20),
+        "account-late": range(12, len(DATES)),
+        "42": range(len(DATES)),
+        "passive_delegation": [x for x in range(len(DATES)) if x != 33],
+    }
+    result = {}
+    for account_id, indices in days.items():
+        result[account_id] = {}
+        for i in indices:
+            if account_id == "account-zero":
+                apy, reward = 0.0, 0.0
+            else:
+                apy, reward = rng.uniform(0.0, 0.2), rng.uniform(0, 100)
+            result[account_id][DATES[i]] = day_entry(account_id, apy, reward)
+    return result
+
+
+def apy_and_reward(account_id: str, day: dict) -> tuple[float, float]:
+    if account_id == "passive_delegation":
+        return day["passive"]["apy"], day["passive"]["reward"]
+    if account_id.isnumeric():
+        return day["delegator"]["apy"], day["delegator"]["reward"]
+    return day["apy"], day["reward"]
+
+
+def baseline_moving_average(
+    account_id: str, daily_apy_dict: dict, index_in_list: int
+) -> dict:
+    """
+    The d30 entry as the baseline computed it, None without enough days.
+    """
+    term_dates = DATES[(index_in_list - PERIOD + 1) : (index_in_list + 1)]
+    days = [
+        apy_and_reward(account_id, v)
+        for k, v in daily_apy_dict.items()
+        if k in term_dates
+    ]
+    if len(days) > 0.90 * PERIOD:
+        return {
+            "apy": calc_apy_for_period([x[0] for x in days]),
+            "sum_of_rewards": sum(x[1] for x in days),
+            "count_of_days": len(days),
+        }
+    return None
+
+
+def test_full_recompute_matches_baseline():
+    daily_apy_dicts = history()
+    account_ids = list(daily_apy_dicts)
+    for index_in_list in range(PERIOD - 1, len(DATES)):
+        term_dates = DATES[(index_in_list - PERIOD + 1) : (index_in_list + 1)]
+        sums = window_sums_from_history(
+            account_ids, [daily_apy_dicts[x] for x in account_ids], term_dates
+        )
+        enough_days, apys = moving_averages_from_sums(sums, PERIOD)
+        for i, account_id in enumerate(account_ids):
+            expected = baseline_moving_average(
+                account_id, daily_apy_dicts[account_id], index_in_list
+            )
+            assert enough_days[i] == (expected is not None), account_id
+            if expected is not None:
+                assert apys[i] == pytest.approx(expected["apy"], rel=1e-12)
+                assert sums["sum_reward"][i] == pytest.approx(
+                    expected["sum_of_rewards"], rel=1e-12
+                )
+                assert sums["count"][i] == expected["count_of_days"]
+
+
+def test_sliding_sums_match_full_recompute():
+    daily_apy_dicts = history()
+    account_ids = list(daily_apy_dicts)
+
+    def window(index_in_list: int) -> dict:
+        return window_sums_from_history(
+            account_ids,
+            [daily_apy_dicts[x] for x in account_ids],
+            DATES[max(0, index_in_list - PERIOD + 1) : (index_in_list + 1)],
+        )
+
+    sums = window(PERIOD - 1)
+    for index_in_list in range(PERIOD, len(DATES)):
+        sums = slide_window_sums(
+            sums,
+            day_values(
+                account_ids,
+                [daily_apy_dicts[x].get(DATES[index_in_list]) for x in account_ids],
+            ),
+            day_values(
+                account_ids,
+                [
+                    daily_apy_dicts[x].get(DATES[index_in_list - PERIOD])
+                    for x in account_ids
+                ],
+            ),
+        )
+        expected = window(index_in_list)
+        np.testing.assert_array_equal(sums["count"], expected["count"])
+        np.testing.assert_allclose(sums["sum_ln"], expected["sum_ln"], atol=1e-12)
+        np.testing.assert_allclose(
+            sums["sum_reward"], expected["sum_reward"], rtol=1e-12
+        )
+
+
+def test_zero_and_missing_days():
+    account_ids = ["account-zero", "account-none", "account-27", "account-28"]
+    term_dates = DATES[:PERIOD]
+    daily_apy_dicts = [
+        {x: {"apy": 0.0, "reward": 0.0} for x in term_dates},
+        {},
+        {x: {"apy": 0.1, "reward": 1.0} for x in term_dates[:27]},
+        {x: {"apy": 0.1, "reward": 1.0} for x in term_dates[:28]},
+    ]
+
+    sums = window_sums_from_history(account_ids, daily_apy_dicts, term_dates)
+    enough_days, apys = moving_averages_from_sums(sums, PERIOD)
+
+    assert sums["count"].tolist() == [30, 0, 27, 28]
+    # exactly 90% of the days isn't enough, as in the baseline.
+    assert enough_days.tolist() == [True, False, False, True]
+    assert apys[0] == 0.0
+    assert apys[3] == pytest.approx(calc_apy_for_period([0.1] * 28))
+
+    # an account without an entry on either end of the window keeps its sums.
+    sums = slide_window_sums(
+        sums,
+        day_values(account_ids, [None] * 4),
+        day_values(account_ids, [None] * 4),
+    )
+    assert sums["count"].tolist() == [30, 0, 27, 28]
+    assert sums["sum_ln"][1] == 0.0
+
+    sums = window_sums_from_history([], [], term_dates)
+    assert len(moving_averages_from_sums(sums, PERIOD)[0]) == 0
+
+
+def run_step_6(
+    mongodb: InMemoryMongoDB, daily_apy_dicts: dict, skip: list[int], full_scan: bool
+):
+    """
+    Step 6 for every date in turn, after storing that date's entries as
+    Step 4 and 5 would.
+    """
+    db = mongodb.mainnet
+    db[Collections.paydays].insert_many(
+        [{"_id": f"block-{i}", "date": x} for i, x in enumerate(DATES)]
+    )
+    for i, date in enumerate(DATES):
+        for account_id, daily_apy_dict in daily_apy_dicts.items():
+            if date in daily_apy_dict:
+                db[Collections.paydays_apy_intermediate].update_one(
+                    {"_id": account_id},
+                    {
+                        "$set": {
+                            f"daily_apy_dict.{date}": daily_apy_dict[date],
+                            "last_payday_date": date,
+                        }
+                    },
+                    upsert=True,
+                )
+        if i in skip:
+            continue
+        Payday.from_state(
+            {"payday_date_string": date, "payday_block_hash": f"block-{i}"},
+            None,
+            mongodb,
+            NullTooter(),
+        ).calc_moving_averages(full_scan=full_scan)
+
+
+@pytest.mark.parametrize(
+    "full_scan, recompute_every, skip",
+    [
+        (False, 30, []),
+        (True, 30, []),
+        # forced full recomputes in between the incremental updates.
+        (False, 4, []),
+        # a payday without Step 6 makes the running sums stale.
+        (False, 30, [36]),
+    ],
+)
+def test_step_6_matches_baseline(monkeypatch, full_scan, recompute_every, skip):
+    monkeypatch.setattr(
+        payday_module, "PAYDAY_MA_FULL_RECOMPUTE_EVERY", recompute_every
+    )
+    daily_apy_dicts = history()
+    mongodb = InMemoryMongoDB()
+
+    run_step_6(mongodb, daily_apy_dicts, skip, full_scan)
+
+    collection = mongodb.mainnet[Collections.paydays_apy_intermediate]
+    for account_id, daily_apy_dict in daily_apy_dicts.items():
+        document = collection.find_one({"_id": account_id})
+        expected = {}
+        for index_in_list in range(PERIOD, len(DATES)):
+            if index_in_list in skip:
+                continue
+            x = baseline_moving_average(account_id, daily_apy_dict, index_in_list)
+            if x is not None:
+                expected[DATES[index_in_list]] = x
+        d30_apy_dict = document.get("d30_apy_dict", {})
+        assert list(d30_apy_dict) == list(expected), account_id
+        for date, x in expected.items():
+            assert d30_apy_dict[date] == pytest.approx(x, rel=1e-12), (account_id, date)
+
+    state = collection.find_one({"_id": "account-full"})["moving_average_state"]
+    assert state["d30"]["date"] == DATES[-1]
+    if full_scan or (recompute_every == 30 and not skip):
+        assert state["d30"]["incremental_updates"] == len(DATES) - 1 - PERIOD
@@ -0,0 +1,125 @@
+import threading
+import time
+import pytest
+import node_pool
+from node_pool import Endpoint, NodePool, node_pool_for
+
+
+class FakeClient:
+    """
+    A node that answers `get_block_info` with its name, after `delay`
+    seconds, or raises `error`; while `gate` is cleared it hangs.
+    """
+
+    def __init__(self, name: str, delay: float = 0.0, error: Exception = None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = 0
+        self.host = f"{name}:20000"
+
+    def get_block_info(self, block_hash: str):
+        self.calls += 1
+        self.gate.wait()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return (self.name, block_hash)
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay(monkeypatch):
+    monkeypatch.setattr(node_pool, "HEDGE_INITIAL_DELAY", 0.05)
+
+
+def pool(*clients: FakeClient) -> NodePool:
+    return NodePool([Endpoint(x.name, x) for x in clients], max_workers=8)
+
+
+def test_fastest_node_gets_the_calls():
+    primary, extra = FakeClient("primary"), FakeClient("extra")
+    p = pool(primary, extra)
+    p.endpoints[0].latencies["get_block_info"] = [0.2] * 30
+    p.endpoints[1].latencies["get_block_info"] = [0.01] * 30
+
+    assert p.get_block_info("a") == ("extra", "a")
+    assert (primary.calls, extra.calls) == (0, 1)
+
+
+def test_failed_call_goes_to_the_next_node():
+    primary = FakeClient("primary", error=RuntimeError("unavailable"))
+    extra = FakeClient("extra")
+    p = pool(primary, extra)
+
+    assert p.get_block_info("a") == ("extra", "a")
+    assert p.endpoints[0].failures == 1
+    # the failing node is ranked last from now on.
+    assert p.ranked("get_block_info")[0].name == "extra"
+    assert p.hedges == 0
+
+
+def test_all_nodes_failing_raises():
+    p = pool(
+        FakeClient("primary", error=RuntimeError("primary down")),
+        FakeClient("extra", error=RuntimeError("extra down")),
+    )
+    with pytest.raises(RuntimeError, match="extra down"):
+        p.get_block_info("a")
+
+
+def test_slow_call_is_hedged_to_the_next_node():
+    primary, extra = FakeClient("primary", delay=0.5), FakeClient("extra")
+    p = pool(primary, extra)
+
+    start = time.perf_counter()
+    assert p.get_block_info("a") == ("extra", "a")
+    assert time.perf_counter() - start < 0.4
+    assert p.hedges == 1
+    assert p.endpoints[1].hedges_won == 1
+
+    # the late answer of the slow node doesn't clear its failure.
+    time.sleep(0.6)
+    assert p.endpoints[0].in_flight == 0
+    assert p.endpoints[0].failures == 1
+    assert len(p.endpoints[0].latencies["get_block_info"]) == 1
+
+
+def test_hanging_node_is_ranked_last():
+    primary, extra, other = (
+        FakeClient("primary"),
+        FakeClient("extra"),
+        FakeClient("other"),
+    )
+    primary.gate.clear()
+    p = pool(primary, extra, other)
+    # the primary was the fastest so far.
+    p.endpoints[0].latencies["get_block_info"] = [0.001] * 30
+    p.endpoints[1].latencies["get_block_info"] = [0.01] * 30
+    p.endpoints[2].latencies["get_block_info"] = [0.02] * 30
+
+    assert p.get_block_info("a") == ("extra", "a")
+    for i in range(5):
+        assert p.get_block_info(f"b{i}")[0] != "primary"
+    # only the first call was sent to it.
+    assert primary.calls == 1
+    assert [x.name for x in p.ranked("get_block_info")][-1] == "primary"
+    primary.gate.set()
+
+
+def test_other_attributes_are_the_primary_clients():
+    primary = FakeClient("primary")
+    p = pool(primary, FakeClient("extra"))
+    assert p.host == "primary:20000"
+
+
+def test_node_pool_for_pools_real_clients_only(monkeypatch):
+    monkeypatch.setattr(node_pool, "PAYDAY_GRPC_ENDPOINTS", "extra:20000")
+    client = FakeClient("primary")
+    # not a GRPCClient (a benchmark client).
+    assert node_pool_for(client) is client
+    assert node_pool_for(None) is None
+
+    monkeypatch.setattr(node_pool, "pooling_enabled", False)
+    assert node_pool_for(client) is client
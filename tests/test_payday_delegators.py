@@ -0,0 +1,137 @@
+import pytest
+import payday_delegators
+from delegator_table import DelegatorTable
+from in_memory_mongo import InMemoryDatabase
+from payday_delegators import (
+    get_delegation_history_for_account,
+    get_delegator_table,
+    store_delegators_for_payday,
+)
+
+POOLS = ["1", "2", "passive_delegation"]
+
+
+def table(view: dict) -> DelegatorTable:
+    delegator_table = DelegatorTable()
+    for pool in POOLS:
+        delegator_table.add_pool_rows(
+            pool,
+            [(account, stake) for account, (p, stake) in view.items() if p == pool],
+        )
+    return delegator_table
+
+
+def as_view(delegator_table: DelegatorTable) -> dict:
+    return {account: (pool, stake) for pool, account, stake in delegator_table.items()}
+
+
+# the view of every date: a delegator joins, one changes stake, one moves pool
+# and one leaves, day by day.
+VIEWS = {
+    "2024-05-30": {"a": ("1", 10), "b": ("2", 20), "c": ("1", 30)},
+    "2024-05-31": {"a": ("1", 10), "b": ("2", 25), "c": ("1", 30)},
+    "2024-06-01": {"a": ("2", 10), "b": ("2", 25), "c": ("1", 30), "d": ("1", 5)},
+    "2024-06-02": {"a": ("2", 10), "b": ("2", 25), "d": ("1", 5)},
+    "2024-06-03": {"a": ("2", 11), "b": ("2", 25), "d": ("passive_delegation", 5)},
+}
+
+
+@pytest.fixture
+def store():
+    payday_delegators.recent_tables.clear()
+    database = InMemoryDatabase()
+    yield database["paydays_delegators"], database["paydays_delegators_headers"]
+    payday_delegators.recent_tables.clear()
+
+
+def store_dates(collection, headers, dates: list[str]):
+    for date in dates:
+        store_delegators_for_payday(collection, headers, date, table(VIEWS[date]))
+
+
+def assert_views(collection, headers, dates: list[str]):
+    # rebuilt from the database, not from the tables remembered in memory.
+    payday_delegators.recent_tables.clear()
+    for date in dates:
+        assert as_view(get_delegator_table(collection, headers, date)) == VIEWS[date]
+
+
+def test_stores_changes_after_a_snapshot(store):
+    collection, headers = store
+    store_dates(collection, headers, list(VIEWS))
+
+    assert headers.find_one({"_id": "2024-05-30"})["snapshot"]
+    assert not headers.find_one({"_id": "2024-06-02"})["snapshot"]
+    # only c leaves on 06-02.
+    assert collection.count_documents({"date": "2024-06-02"}) == 1
+    assert_views(collection, headers, list(VIEWS))
+
+
+def test_backfill_before_existing_dates(store):
+    collection, headers = store
+    # live first, then a backfill of the dates before and including 06-01.
+    store_dates(collection, headers, ["2024-06-01", "2024-06-02", "2024-06-03"])
+    store_dates(collection, headers, ["2024-05-30", "2024-05-31", "2024-06-01"])
+
+    assert headers.find_one({"_id": "2024-06-01"})["snapshot"]
+    assert_views(collection, headers, list(VIEWS))
+
+
+def test_rebuild_follows_a_base_before_the_snapshot_date(store):
+    collection, headers = store
+    store_dates(collection, headers, ["2024-05-31", "2024-06-01", "2024-06-02"])
+    # 06-01 is re-stored as changes since 05-30, which is outside the range
+    # 06-02 was stored in.
+    store_dates(collection, headers, ["2024-05-30"])
+    headers.delete_one({"_id": "2024-05-31"})
+    collection.delete_many({"date": "2024-05-31"})
+    store_dates(collection, headers, ["2024-06-01"])
+
+    assert headers.find_one({"_id": "2024-06-01"})["base_date"] == "2024-05-30"
+    assert headers.find_one({"_id": "2024-06-02"})["snapshot_date"] == "2024-05-30"
+    # as left by a re-store that stopped before the later headers were
+    # refreshed.
+    headers.update_one({"_id": "2024-06-02"}, {"$set": {"snapshot_date": "2024-05-31"}})
+    assert_views(collection, headers, ["2024-05-30", "2024-06-01", "2024-06-02"])
+
+
+def test_restore_refreshes_the_chains_of_later_dates(store, monkeypatch):
+    monkeypatch.setattr(payday_delegators, "PAYDAY_DELEGATORS_SNAPSHOT_EVERY", 3)
+    collection, headers = store
+    store_dates(collection, headers, ["2024-05-30", "2024-06-01", "2024-06-02"])
+    # 05-31 is backfilled, 06-01 is re-stored as changes since it: its chain
+    # gets one longer and 06-02 would pass the cap.
+    store_dates(collection, headers, ["2024-05-31", "2024-06-01"])
+
+    assert [
+        (x["_id"], x["snapshot_date"], x["chain_length"])
+        for x in headers.find(sort=[("_id", 1)])
+    ] == [
+        ("2024-05-30", "2024-05-30", 0),
+        ("2024-05-31", "2024-05-30", 1),
+        ("2024-06-01", "2024-05-30", 2),
+        ("2024-06-02", "2024-06-02", 0),
+    ]
+    assert headers.find_one({"_id": "2024-06-02"})["snapshot"]
+    assert_views(
+        collection, headers, ["2024-05-30", "2024-05-31", "2024-06-01", "2024-06-02"]
+    )
+
+    # the dates after a new snapshot follow it.
+    store_dates(collection, headers, ["2024-06-03"])
+    store_dates(collection, headers, ["2024-06-02"])
+    assert headers.find_one({"_id": "2024-06-03"})["chain_length"] == 1
+    assert_views(collection, headers, list(VIEWS))
+
+
+def test_history_for_account(store):
+    collection, headers = store
+    store_dates(collection, headers, list(VIEWS))
+
+    assert get_delegation_history_for_account(collection, headers, "c") == [
+        {"date": date, "pool": "1", "stake": 30}
+        for date in ["2024-06-01", "2024-05-31", "2024-05-30"]
+    ]
+    assert [
+        x["pool"] for x in get_delegation_history_for_account(collection, headers, "d")
+    ] == ["passive_delegation", "1", "1"]
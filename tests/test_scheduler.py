@@ -0,0 +1,124 @@
+import threading
+import time
+import pytest
+import scheduler
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.errors import PyMongoError
+from in_memory_mongo import InMemoryMongoDB
+from scheduler import PaydayTrigger
+
+
+class FakeChangeStream:
+    """
+    A change stream with the changes in `changes`, a None is an empty batch
+    and an exception is raised.
+    """
+
+    def __init__(self, changes: list):
+        self.changes = changes
+        self.resume_token = None
+        self.closed = False
+
+    def try_next(self):
+        if len(self.changes) == 0:
+            time.sleep(0.01)
+            return None
+        change = self.changes.pop(0)
+        if isinstance(change, Exception):
+            raise change
+        if change is not None:
+            self.resume_token = {"_data": change["_id"]}
+        return change
+
+    def close(self):
+        self.closed = True
+
+
+class FakeHelpers:
+    def __init__(self, streams: list[FakeChangeStream]):
+        self.streams = streams
+        self.watch_calls: list[dict] = []
+
+    def watch(self, **kwargs):
+        self.watch_calls.append(kwargs)
+        return self.streams.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def short_timeouts(monkeypatch):
+    monkeypatch.setattr(scheduler, "PAYDAY_TRIGGER_SAFETY_SECONDS", 0.3)
+    monkeypatch.setattr(scheduler, "PAYDAY_POLL_MIN_SECONDS", 0.01)
+    monkeypatch.setattr(scheduler, "PAYDAY_POLL_MAX_SECONDS", 0.04)
+
+
+def timed(f) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def test_change_stream_is_opened_on_creation():
+    stream = FakeChangeStream([])
+    helpers = FakeHelpers([stream])
+
+    trigger = PaydayTrigger({Collections.helpers: helpers})
+
+    assert len(helpers.watch_calls) == 1
+    assert helpers.watch_calls[0]["pipeline"] == [
+        {"$match": {"documentKey._id": "last_known_payday"}}
+    ]
+    # a change that lands before the first wait is buffered in the stream.
+    stream.changes.append({"_id": "change-1"})
+    assert timed(trigger.wait) < 0.2
+    # nothing new: back after the safety timeout.
+    assert timed(trigger.wait) >= 0.3
+    assert trigger.resume_token == {"_data": "change-1"}
+
+
+def test_change_stream_error_reopens_from_the_resume_token():
+    first = FakeChangeStream([{"_id": "change-1"}, PyMongoError("connection lost")])
+    second = FakeChangeStream([{"_id": "change-2"}])
+    helpers = FakeHelpers([first, second])
+    trigger = PaydayTrigger({Collections.helpers: helpers})
+
+    trigger.wait()
+    # the error returns early, so the caller checks its state.
+    assert timed(trigger.wait) < 0.2
+    assert first.closed
+    assert trigger.use_change_stream
+
+    trigger.wait()
+    assert helpers.watch_calls[1]["resume_after"] == {"_data": "change-1"}
+    assert trigger.resume_token == {"_data": "change-2"}
+
+
+def test_falls_back_to_polling_without_change_streams():
+    mongodb = InMemoryMongoDB()
+    helpers = mongodb.mainnet[Collections.helpers]
+    helpers.insert_one({"_id": "last_known_payday", "date": "2024-06-01"})
+
+    # the in-memory Mongo has no change streams, like a standalone server.
+    trigger = PaydayTrigger(mongodb.mainnet)
+    assert not trigger.use_change_stream
+
+    # the first poll sees the helper as new.
+    assert timed(trigger.wait) < 0.2
+    # no change: the interval backs off up to the max, until the safety timeout.
+    assert timed(trigger.wait) >= 0.3
+    assert trigger.poll_interval == 0.04
+
+    def new_payday():
+        time.sleep(0.1)
+        helpers.replace_one(
+            {"_id": "last_known_payday"},
+            {"_id": "last_known_payday", "date": "2024-06-02"},
+        )
+
+    thread = threading.Thread(target=new_payday)
+    thread.start()
+    assert timed(trigger.wait) < 0.25
+    thread.join()
+    assert trigger.last_seen["date"] == "2024-06-02"
+    assert trigger.poll_interval == 0.01
+    # still polling, the change stream isn't tried again.
+    assert not trigger.use_change_stream
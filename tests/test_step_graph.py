@@ -0,0 +1,134 @@
+import threading
+import time
+import pytest
+import step_graph
+from payday import STEP_DEPENDENCIES
+from step_graph import run_step_graph, track
+
+
+class Recorder:
+    """
+    Steps that record when they start and finish, optionally sleep, wait on
+    a barrier or raise.
+    """
+
+    def __init__(self):
+        self.events: list[tuple[str, str]] = []
+        self.completed: list[tuple[str, bool]] = []
+        self.lock = threading.Lock()
+
+    def step(self, name: str, sleep: float = 0.0, barrier=None, error=None):
+        def run():
+            with self.lock:
+                self.events.append(("start", name))
+            if barrier is not None:
+                barrier.wait(timeout=2)
+            time.sleep(sleep)
+            if error is not None:
+                raise error
+            with self.lock:
+                self.events.append(("end", name))
+
+        return (name, run)
+
+    def on_completed(self, name: str, idle: bool):
+        self.completed.append((name, idle))
+
+    def index(self, event: str, name: str) -> int:
+        return self.events.index((event, name))
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_steps_start_after_their_dependencies(max_workers):
+    recorder = Recorder()
+    steps = [recorder.step(name, sleep=0.01) for name in STEP_DEPENDENCIES]
+
+    run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed, max_workers)
+
+    for name, dependencies in STEP_DEPENDENCIES.items():
+        for dependency in dependencies:
+            assert recorder.index("end", dependency) < recorder.index("start", name)
+    assert sorted(x[0] for x in recorder.completed) == sorted(STEP_DEPENDENCIES)
+    if max_workers == 1:
+        assert [x[0] for x in recorder.completed] == list(STEP_DEPENDENCIES)
+        assert all(x[1] for x in recorder.completed)
+
+
+def test_independent_steps_run_at_the_same_time():
+    recorder = Recorder()
+    # step_4 and step_5 only pass the barrier if they run together.
+    barrier = threading.Barrier(2)
+    steps = [
+        recorder.step("step_3"),
+        recorder.step("step_4", barrier=barrier),
+        recorder.step("step_5", barrier=barrier),
+        recorder.step("step_6"),
+    ]
+
+    run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed, max_workers=2)
+
+    assert not barrier.broken
+    # step_6 waits for both, only the last of them completes while idle.
+    assert recorder.completed[-1] == ("step_6", True)
+    assert [x[1] for x in recorder.completed[1:3]].count(True) == 1
+
+
+def test_failed_step_stops_dependents_and_waits_for_running_steps():
+    recorder = Recorder()
+    steps = [
+        recorder.step("step_1"),
+        recorder.step("step_2", sleep=0.2),
+        recorder.step("step_3", error=RuntimeError("step_3 failed")),
+        recorder.step("step_4"),
+        recorder.step("step_6"),
+    ]
+
+    with pytest.raises(RuntimeError, match="step_3 failed"):
+        run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed, max_workers=4)
+
+    # step_2 was running and is finished, nothing after step_3 started.
+    assert ("end", "step_2") in recorder.events
+    assert ("start", "step_4") not in recorder.events
+    assert [x[0] for x in recorder.completed] == ["step_1", "step_2"]
+
+
+def test_failed_step_one_at_a_time():
+    recorder = Recorder()
+    steps = [
+        recorder.step("step_1"),
+        recorder.step("step_2", error=RuntimeError("step_2 failed")),
+        recorder.step("step_3"),
+    ]
+
+    with pytest.raises(RuntimeError, match="step_2 failed"):
+        run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed, max_workers=1)
+
+    assert recorder.completed == [("step_1", True)]
+
+
+def test_dependencies_outside_the_steps_count_as_done():
+    recorder = Recorder()
+    # as after a resume: steps 1-3 are already completed.
+    steps = [recorder.step(x) for x in ["step_4", "step_5", "step_6"]]
+
+    run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed, max_workers=4)
+
+    assert [x[0] for x in recorder.completed][-1] == "step_6"
+
+
+def test_dependency_that_comes_later_is_an_error():
+    recorder = Recorder()
+    steps = [recorder.step("step_2"), recorder.step("step_1")]
+
+    with pytest.raises(ValueError, match="step_2 depends on step_1"):
+        run_step_graph(steps, STEP_DEPENDENCIES, recorder.on_completed)
+    assert recorder.events == []
+
+
+def test_only_one_progress_bar_at_a_time():
+    first = track(range(3))
+    assert next(first) == 0
+    # the second one iterates without a bar (a second bar would raise).
+    assert list(track(range(5))) == [0, 1, 2, 3, 4]
+    assert list(first) == [1, 2]
+    assert not step_graph.progress_lock.locked()